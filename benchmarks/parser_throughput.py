@@ -0,0 +1,90 @@
+"""
+Throughput of the CoNLL parser (tokens/second), before and after the fast-path reader.
+
+The sample corpus in data/wikiCoNLL_10000 is replicated to reach a more realistic size.
+
+Usage:
+    python benchmarks/parser_throughput.py [--copies 50] [--token_shape form lemma pos]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from src import dsmagic
+
+
+def dict_based_sentences(filename, token_shape):
+    """Parser as it was before the fast path: one dictionary per token"""
+
+    with open(filename, encoding="utf-8") as fin:
+        sentence = []
+
+        for line in fin:
+
+            if not line.startswith("<"):
+                line = line.strip()
+
+                if len(line):
+
+                    linesplit = line.split("\t")
+
+                    CoNLL_columns = ["s_id", "form", "lemma",
+                                     "pos", "pos_fgrained",
+                                     "morph",
+                                     "synhead", "synrel",
+                                     "_", "_", "mwe", "mwe2"]
+
+                    full_token = dict(zip(CoNLL_columns, linesplit))
+                    token = tuple(full_token[col_name]
+                                  for col_name in token_shape)
+
+                    sentence.append(token)
+
+                else:
+                    yield sentence
+                    sentence = []
+
+        yield sentence
+
+
+def measure(sentences):
+    start = time.perf_counter()
+    n_tokens = sum(len(sentence) for sentence in sentences)
+    elapsed = time.perf_counter() - start
+    return n_tokens, elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "wikiCoNLL_10000"))
+    parser.add_argument("--copies", type=int, default=50)
+    parser.add_argument("--token_shape", nargs="+", default=["form", "lemma", "pos"])
+    args = parser.parse_args()
+
+    token_shape = tuple(args.token_shape)
+
+    with open(args.corpus, "rb") as fin:
+        sample = fin.read()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        corpus = os.path.join(tmpdir, "corpus.conll")
+        with open(corpus, "wb") as fout:
+            for _ in range(args.copies):
+                fout.write(sample)
+
+        compiled = os.path.join(tmpdir, "compiled")
+        dsmagic.compile_corpus(corpus, compiled, token_shape)
+
+        runs = [("dict-based parser", dict_based_sentences(corpus, token_shape)),
+                ("corpus_to_sentences", dsmagic.corpus_to_sentences(corpus, token_shape)),
+                ("corpus_to_sentences (compiled)", dsmagic.corpus_to_sentences(compiled, token_shape))]
+
+        print(f"corpus: {args.copies} x {args.corpus}, token_shape: {token_shape}")
+        for name, sentences in runs:
+            n_tokens, elapsed = measure(sentences)
+            print(f"{name:<32}{n_tokens:>12} tokens{elapsed:>10.2f} s{n_tokens/elapsed:>14,.0f} tokens/s")
@@ -0,0 +1,288 @@
+"""
+Approximate nearest neighbors search with random-hyperplane LSH (Locality Sensitive Hashing).
+"""
+
+import os
+import numpy as np
+import scipy as sp
+
+from typing import Dict, Tuple, List, Iterable, Union
+
+from . import dsmagic
+
+
+class LSHIndex:
+    """
+    Approximate cosine nearest neighbors index over the rows of a matrix,
+    such as the ones returned by "load_vectors" or "build_sparse_matrix".
+
+    Each of the n_tables hash tables assigns to each vector a code of n_bits bits,
+    one bit for the side of a random hyperplane the vector falls on.
+    Candidates for a query are the vectors sharing its code in at least one table
+    (plus, with n_probes > 0, the codes obtained by flipping the bits whose hyperplanes are closest to the query);
+    candidates are then ranked by exact cosine similarity.
+
+    More tables or more probes give higher recall, more bits give smaller buckets and faster queries.
+
+    Args:
+        vectors (Union[np.ndarray, sp.sparse.csr_matrix]): unit-normalized vectors, one per row
+        id_dict (Dict[Tuple[str, ...], int]): mapping from token to row id
+        planes (np.ndarray): random hyperplanes, of shape (n_tables, dimensions, n_bits)
+        codes (np.ndarray): sorted codes of each table, of shape (n_tables, rows)
+        orders (np.ndarray): row ids corresponding to sorted codes, of shape (n_tables, rows)
+    """
+
+    def __init__(self,
+                 vectors: Union[np.ndarray, sp.sparse.csr_matrix],
+                 id_dict: Dict[Tuple[str, ...], int],
+                 planes: np.ndarray,
+                 codes: np.ndarray,
+                 orders: np.ndarray):
+        self.vectors = vectors
+        self.id_dict = id_dict
+        self.planes = planes
+        self.codes = codes
+        self.orders = orders
+        self.tokens = dsmagic._id_to_token(id_dict)
+        self._bit_values = np.left_shift(np.int64(1), np.arange(planes.shape[2], dtype=np.int64))
+
+    @classmethod
+    def build(cls,
+              matrix: Union[np.ndarray, sp.sparse.spmatrix],
+              id_dict: Dict[Tuple[str, ...], int],
+              n_tables: int = 8,
+              n_bits: int = 16,
+              seed: int = 0
+              ) -> "LSHIndex":
+        """
+        Builds the index.
+
+        Args:
+            matrix (Union[np.ndarray, sp.sparse.spmatrix]): dense or sparse matrix of vectors, one per row
+            id_dict (Dict[Tuple[str, ...], int]): mapping from token to row id
+            n_tables (int, optional): number of hash tables. Defaults to 8.
+            n_bits (int, optional): number of bits of each code (at most 62). Defaults to 16.
+            seed (int, optional): seed of the random hyperplanes. Defaults to 0.
+
+        Returns:
+            LSHIndex: the index
+        """
+
+        if not 0 < n_bits < 63:
+            raise ValueError("n_bits must be between 1 and 62")
+
+        vectors = dsmagic.normalize_rows(matrix)
+
+        rng = np.random.default_rng(seed)
+        planes = rng.standard_normal((n_tables, vectors.shape[1], n_bits)).astype(np.float32)
+
+        bit_values = np.left_shift(np.int64(1), np.arange(n_bits, dtype=np.int64))
+        codes = np.empty((n_tables, vectors.shape[0]), dtype=np.int64)
+        orders = np.empty((n_tables, vectors.shape[0]), dtype=np.int64)
+
+        for table in range(n_tables):
+            table_codes = (np.asarray(vectors @ planes[table]) > 0) @ bit_values
+            orders[table] = np.argsort(table_codes, kind="stable")
+            codes[table] = table_codes[orders[table]]
+
+        return cls(vectors, id_dict, planes, codes, orders)
+
+    def save(self, path: str) -> None:
+        """
+        Saves the index to a directory, that can be memory-mapped by "load"
+
+        Args:
+            path (str): path to directory
+        """
+
+        os.makedirs(path, exist_ok=True)
+
+        if sp.sparse.issparse(self.vectors):
+            sp.sparse.save_npz(os.path.join(path, "vectors.npz"), self.vectors)
+        else:
+            np.save(os.path.join(path, "vectors.npy"), self.vectors)
+
+        np.save(os.path.join(path, "planes.npy"), self.planes)
+        np.save(os.path.join(path, "codes.npy"), self.codes)
+        np.save(os.path.join(path, "orders.npy"), self.orders)
+        dsmagic._write_vocabulary(os.path.join(path, "tokens.vocab"), self.id_dict)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "LSHIndex":
+        """
+        Loads an index saved by "save"
+
+        Args:
+            path (str): path to directory
+            mmap (bool, optional): whether to memory-map arrays instead of reading them. Defaults to True.
+
+        Returns:
+            LSHIndex: the index
+        """
+
+        mmap_mode = "r" if mmap else None
+
+        if os.path.exists(os.path.join(path, "vectors.npz")):
+            vectors = sp.sparse.load_npz(os.path.join(path, "vectors.npz")).tocsr()
+        else:
+            vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode=mmap_mode)
+
+        return cls(vectors,
+                   dsmagic._read_vocabulary(os.path.join(path, "tokens.vocab")),
+                   np.load(os.path.join(path, "planes.npy")),
+                   np.load(os.path.join(path, "codes.npy"), mmap_mode=mmap_mode),
+                   np.load(os.path.join(path, "orders.npy"), mmap_mode=mmap_mode))
+
+    def _probe_codes(self, projections: np.ndarray, n_probes: int) -> np.ndarray:
+        """
+        Codes to look up for each query in one table: the query code,
+        then the codes with one flipped bit, starting from the hyperplanes closest to the query.
+
+        Args:
+            projections (np.ndarray): projections of the queries on the hyperplanes, of shape (queries, n_bits)
+            n_probes (int): number of additional codes
+
+        Returns:
+            np.ndarray: codes, of shape (queries, 1 + n_probes)
+        """
+
+        query_codes = (projections > 0) @ self._bit_values
+        ret = [query_codes]
+
+        if n_probes:
+            closest_bits = np.argsort(np.abs(projections), axis=1)[:, :n_probes]
+            for probe in range(closest_bits.shape[1]):
+                ret.append(np.bitwise_xor(query_codes, self._bit_values[closest_bits[:, probe]]))
+
+        return np.stack(ret, axis=1)
+
+    def query_vectors(self,
+                      queries: Union[np.ndarray, sp.sparse.spmatrix],
+                      topk: int = 10,
+                      n_probes: int = 0
+                      ) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+        """
+        Approximate nearest neighbors of a batch of query vectors.
+
+        Args:
+            queries (Union[np.ndarray, sp.sparse.spmatrix]): query vectors, one per row
+            topk (int, optional): Number of neighbors to return. Defaults to 10.
+            n_probes (int, optional): number of additional buckets visited in each table. Defaults to 0.
+
+        Returns:
+            Tuple[List[np.ndarray], List[np.ndarray]]: for each query, ids and cosine similarities of its neighbors,
+                sorted by decreasing similarity (fewer than topk if there are not enough candidates)
+        """
+
+        queries = dsmagic.normalize_rows(queries)
+        n_queries = queries.shape[0]
+
+        candidates = [[] for _ in range(n_queries)]
+
+        for table in range(len(self.planes)):
+            probe_codes = self._probe_codes(np.asarray(queries @ self.planes[table]), n_probes)
+            starts = np.searchsorted(self.codes[table], probe_codes, side="left")
+            ends = np.searchsorted(self.codes[table], probe_codes, side="right")
+
+            for query_id in range(n_queries):
+                for start, end in zip(starts[query_id], ends[query_id]):
+                    if end > start:
+                        candidates[query_id].append(self.orders[table][start:end])
+
+        ret_ids = []
+        ret_scores = []
+
+        for query_id in range(n_queries):
+            if not candidates[query_id]:
+                ret_ids.append(np.empty(0, dtype=np.int64))
+                ret_scores.append(np.empty(0, dtype=np.float32))
+                continue
+
+            candidate_ids = np.unique(np.concatenate(candidates[query_id]))
+            scores = self.vectors[candidate_ids] @ queries[query_id].T
+            if sp.sparse.issparse(scores):
+                scores = scores.toarray()
+            scores = np.asarray(scores).ravel()
+
+            ids, scores = dsmagic._topk_rows(scores[np.newaxis, :], topk)
+            ret_ids.append(candidate_ids[ids[0]])
+            ret_scores.append(scores[0])
+
+        return ret_ids, ret_scores
+
+    def query(self,
+              tokens: Iterable[Tuple[str, ...]],
+              topk: int = 10,
+              n_probes: int = 0
+              ) -> Dict[Tuple[str, ...], List[Tuple[float, Tuple[str, ...]]]]:
+        """
+        Approximate nearest neighbors of tokens of the index.
+
+        Args:
+            tokens (Iterable[Tuple[str, ...]]): query tokens
+            topk (int, optional): Number of neighbors to return. Defaults to 10.
+            n_probes (int, optional): number of additional buckets visited in each table. Defaults to 0.
+
+        Returns:
+            Dict[Tuple[str, ...], List[Tuple[float, Tuple[str, ...]]]]: Dictionary containing, for each token,
+                its top neighbors and their cosine similarity, as in "get_nearest_neighbors"
+        """
+
+        tokens = list(tokens)
+        row_ids = [self.id_dict[token] for token in tokens]
+
+        neighbor_ids, neighbor_scores = self.query_vectors(self.vectors[row_ids], topk, n_probes)
+
+        ret = {}
+        for token, ids, scores in zip(tokens, neighbor_ids, neighbor_scores):
+            ret[token] = [(score, self.tokens[neighbor_id]) for score, neighbor_id in zip(scores.tolist(), ids.tolist())]
+
+        return ret
+
+    def recall(self,
+               exact_neighbors: Dict[Tuple[str, ...], List[Tuple[float, Tuple[str, ...]]]],
+               topk: int = 10,
+               n_probes: int = 0
+               ) -> float:
+        """
+        Recall@k of the index against exact neighbors, for the tokens in exact_neighbors.
+
+        Args:
+            exact_neighbors (Dict[Tuple[str, ...], List[Tuple[float, Tuple[str, ...]]]]): output of "get_nearest_neighbors"
+                or "get_nearest_neighbors_blocked"
+            topk (int, optional): Number of neighbors considered. Defaults to 10.
+            n_probes (int, optional): number of additional buckets visited in each table. Defaults to 0.
+
+        Returns:
+            float: recall@k
+        """
+
+        return recall_at_k(self.query(exact_neighbors.keys(), topk, n_probes), exact_neighbors, topk)
+
+
+def recall_at_k(approximate_neighbors: Dict[Tuple[str, ...], List[Tuple[float, Tuple[str, ...]]]],
+                exact_neighbors: Dict[Tuple[str, ...], List[Tuple[float, Tuple[str, ...]]]],
+                k: int = 10
+                ) -> float:
+    """
+    Average fraction of the exact top-k neighbors that are found among the approximate top-k neighbors.
+
+    Args:
+        approximate_neighbors (Dict[Tuple[str, ...], List[Tuple[float, Tuple[str, ...]]]]): approximate neighbors of each token
+        exact_neighbors (Dict[Tuple[str, ...], List[Tuple[float, Tuple[str, ...]]]]): exact neighbors of each token,
+            as returned by "get_nearest_neighbors"
+        k (int, optional): Number of neighbors considered. Defaults to 10.
+
+    Returns:
+        float: recall@k
+    """
+
+    recalls = []
+
+    for token, neighbors in exact_neighbors.items():
+        expected = set(neighbor for _, neighbor in neighbors[:k])
+        found = set(neighbor for _, neighbor in approximate_neighbors.get(token, [])[:k])
+        if expected:
+            recalls.append(len(expected & found) / len(expected))
+
+    return float(np.mean(recalls)) if recalls else 0.
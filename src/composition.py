@@ -0,0 +1,315 @@
+"""
+Batched composition of word vectors into phrase vectors, and evaluation on RELPRON and DTFit.
+"""
+
+import numpy as np
+import scipy as sp
+
+from typing import Callable, Tuple, Any, List, Dict, Union
+
+from . import dsmagic
+from .evaluation import make_item_mapper, cosine_pairs, typicality_comparisons
+
+
+def _additive(slots: List[Union[np.ndarray, sp.sparse.csr_matrix]], **kwargs: Any) -> Union[np.ndarray, sp.sparse.csr_matrix]:
+    """
+    Sum of the vectors of the slots
+    """
+
+    ret = slots[0]
+    for rows in slots[1:]:
+        ret = ret + rows
+
+    return ret
+
+
+def _weighted_additive(slots: List[Union[np.ndarray, sp.sparse.csr_matrix]],
+                       weights: List[float] = None,
+                       **kwargs: Any) -> Union[np.ndarray, sp.sparse.csr_matrix]:
+    """
+    Weighted sum of the vectors of the slots, with one weight per slot
+    """
+
+    if weights is None or len(weights) != len(slots):
+        raise ValueError("weighted_additive needs one weight per slot")
+
+    return _additive([rows * weight for rows, weight in zip(slots, weights)])
+
+
+def _multiplicative(slots: List[Union[np.ndarray, sp.sparse.csr_matrix]], **kwargs: Any) -> Union[np.ndarray, sp.sparse.csr_matrix]:
+    """
+    Component-wise product of the vectors of the slots
+    """
+
+    ret = slots[0]
+    for rows in slots[1:]:
+        ret = ret.multiply(rows).tocsr() if sp.sparse.issparse(ret) else ret * rows
+
+    return ret
+
+
+def _role_based(slots: List[Union[np.ndarray, sp.sparse.csr_matrix]],
+                weights: Dict[str, Union[float, np.ndarray]] = None,
+                roles: np.ndarray = None,
+                **kwargs: Any) -> Union[np.ndarray, sp.sparse.csr_matrix]:
+    """
+    Sum of the vectors of the slots, each scaled component-wise by the weights of its role in the item
+    (a diagonal stand-in for role tensors). Roles missing from weights get weight 1.
+    """
+
+    if roles is None:
+        raise ValueError("role operator needs the role of each slot of each item")
+
+    weights = weights or {}
+    role_names, role_ids = np.unique(roles, return_inverse=True)
+    role_ids = role_ids.reshape(roles.shape)
+
+    dims = slots[0].shape[1]
+    role_weights = np.ones((len(role_names), dims), dtype=np.float32)
+    for role_id, role in enumerate(role_names.tolist()):
+        if role in weights:
+            role_weights[role_id] = weights[role]
+
+    scaled = []
+    for slot, rows in enumerate(slots):
+        if not sp.sparse.issparse(rows):
+            scaled.append(rows * role_weights[role_ids[:, slot]])
+            continue
+
+        # one diagonal product per role, restricted to the items having that role in this slot
+        slot_rows = None
+        for role_id in np.unique(role_ids[:, slot]):
+            mask = sp.sparse.diags((role_ids[:, slot] == role_id).astype(np.float32))
+            part = mask @ rows @ sp.sparse.diags(role_weights[role_id])
+            slot_rows = part if slot_rows is None else slot_rows + part
+        scaled.append(slot_rows)
+
+    return _additive(scaled)
+
+
+OPERATORS = {"additive": _additive,
+             "weighted_additive": _weighted_additive,
+             "multiplicative": _multiplicative,
+             "role": _role_based}
+
+
+def compose(space: dsmagic.VectorSpace,
+            item_ids: np.ndarray,
+            operator: str = "additive",
+            weights: Union[List[float], Dict[str, Union[float, np.ndarray]]] = None,
+            roles: np.ndarray = None,
+            normalize: bool = True
+            ) -> Union[np.ndarray, sp.sparse.csr_matrix]:
+    """
+    Composes the vectors of a batch of items, each made of the same number of words (slots).
+
+    Rows of each slot are gathered with a single indexing operation and combined with one vectorized
+    operation per slot, so composing thousands of items takes about as long as composing one.
+
+    Available operators:
+        - "additive": u + v + ...
+        - "weighted_additive": a*u + b*v + ..., with weights a list of one weight per slot
+        - "multiplicative": u * v * ... (component-wise)
+        - "role": r(u)*u + r(v)*v + ..., where r(x) is the weight (a scalar or a vector of dimensions)
+          of the role of x in the item, with weights a dictionary from role to weight
+
+    Example:
+        ids = np.array([[space.id_dict[("red", "A")], space.id_dict[("car", "N")]]])
+        phrases = compose(space, ids, "multiplicative")
+
+    Args:
+        space (dsmagic.VectorSpace): word vectors
+        item_ids (np.ndarray): row ids of the words of each item, of shape (items, slots), -1 for missing words
+        operator (str, optional): one of OPERATORS. Defaults to "additive".
+        weights (Union[List[float], Dict[str, Union[float, np.ndarray]]], optional): weights of the
+            "weighted_additive" or "role" operators. Defaults to None.
+        roles (np.ndarray, optional): role of each word of each item, of shape (items, slots),
+            needed by the "role" operator. Defaults to None.
+        normalize (bool, optional): whether to compose unit-normalized vectors. Defaults to True.
+
+    Returns:
+        Union[np.ndarray, sp.sparse.csr_matrix]: float32 composed vectors, one per item (zeros for items with missing words)
+    """
+
+    if operator not in OPERATORS:
+        raise ValueError(f"Unknown operator {operator}, expected one of {list(OPERATORS)}")
+
+    item_ids = np.asarray(item_ids, dtype=np.int64)
+    if roles is not None:
+        roles = np.asarray(roles)
+
+    matrix = space.normalized if normalize else space.matrix
+    gathered = np.maximum(item_ids, 0)
+
+    if sp.sparse.issparse(matrix):
+        slots = [sp.sparse.csr_matrix(matrix[gathered[:, slot]], dtype=np.float32) for slot in range(item_ids.shape[1])]
+    else:
+        slots = [np.asarray(matrix[gathered[:, slot]], dtype=np.float32) for slot in range(item_ids.shape[1])]
+
+    ret = OPERATORS[operator](slots, weights=weights, roles=roles)
+
+    # zero out items with missing words
+    covered = (item_ids >= 0).all(axis=1)
+    if sp.sparse.issparse(ret):
+        ret = sp.sparse.diags(covered.astype(np.float32)) @ ret
+        ret.eliminate_zeros()
+        return ret.astype(np.float32).tocsr()
+
+    ret[~covered] = 0
+    return ret.astype(np.float32, copy=False)
+
+
+def _cosine_matrix(left: Union[np.ndarray, sp.sparse.spmatrix], right: Union[np.ndarray, sp.sparse.spmatrix]) -> np.ndarray:
+    """
+    Cosine similarity between every row of left and every row of right
+    """
+
+    ret = dsmagic.normalize_rows(left) @ dsmagic.normalize_rows(right).T
+    if sp.sparse.issparse(ret):
+        ret = ret.toarray()
+
+    return np.asarray(ret)
+
+
+def evaluate_relpron(space: dsmagic.VectorSpace,
+                     dataset: Dict[Tuple[str, str, str], List[Tuple[Tuple[str, str], Tuple[str, str], Tuple[str, str]]]],
+                     operator: str = "additive",
+                     weights: Union[List[float], Dict[str, Union[float, np.ndarray]]] = None,
+                     item_to_id: Callable[[Union[str, Tuple[str, ...]]], int] = None
+                     ) -> Dict[str, Any]:
+    """
+    Mean Average Precision on RELPRON: each property (head noun, verb, argument) is composed,
+    then, for each term, all properties are ranked by cosine similarity to the term vector.
+
+    Words of each property are arranged as (head, verb, argument), with roles ("nsubj", "root", "obj")
+    for subject relative clauses and ("obj", "root", "nsubj") for object relative clauses,
+    so that the "role" operator can weight them as in DTFit. Properties with missing words are ranked last.
+
+    Example:
+        dataset = dataset_utilities.read_RELPRON("datasets/RELPRON/relpron.dev")
+        evaluate_relpron(space, dataset, "role", {"nsubj": 0.5, "root": 1, "obj": 0.5})
+
+    Args:
+        space (dsmagic.VectorSpace): word vectors
+        dataset (Dict[Tuple[str, str, str], List[Tuple[Tuple[str, str], Tuple[str, str], Tuple[str, str]]]]):
+            output of "read_RELPRON"
+        operator (str, optional): composition operator (see "compose"). Defaults to "additive".
+        weights (Union[List[float], Dict[str, Union[float, np.ndarray]]], optional): weights of the operator. Defaults to None.
+        item_to_id (Callable[[Union[str, Tuple[str, ...]]], int], optional): function from item to row id.
+            Defaults to None ("make_item_mapper" with default arguments).
+
+    Returns:
+        Dict[str, Any]: MAP over covered terms, the average precision of each term and coverage statistics
+    """
+
+    if item_to_id is None:
+        item_to_id = make_item_mapper(space.id_dict)
+
+    terms = sorted(set((target, pos) for target, pos, _ in dataset))
+    term_index = {term: i for i, term in enumerate(terms)}
+
+    property_terms = []
+    property_ids = []
+    property_roles = []
+
+    for (target, pos, role), properties in dataset.items():
+        for head, w1, w2 in properties:
+            if role == "SBJ":
+                # head that w1 (verb) w2 (object)
+                property_ids.append((item_to_id(head), item_to_id(w1), item_to_id(w2)))
+                property_roles.append(("nsubj", "root", "obj"))
+            else:
+                # head that w1 (subject) w2 (verb)
+                property_ids.append((item_to_id(head), item_to_id(w2), item_to_id(w1)))
+                property_roles.append(("obj", "root", "nsubj"))
+            property_terms.append(term_index[(target, pos)])
+
+    property_terms = np.array(property_terms, dtype=np.int64)
+    property_ids = np.array(property_ids, dtype=np.int64).reshape(-1, 3)
+    term_ids = np.array([item_to_id(term) for term in terms], dtype=np.int64)
+
+    composed = compose(space, property_ids, operator, weights, np.array(property_roles).reshape(-1, 3))
+    term_vectors = space.normalized[np.maximum(term_ids, 0)]
+
+    similarities = _cosine_matrix(term_vectors, composed)
+    covered_properties = (property_ids >= 0).all(axis=1)
+    similarities[:, ~covered_properties] = -np.inf
+
+    # average precision of each term, over the ranking of all properties
+    order = np.argsort(-similarities, axis=1, kind="stable")
+    relevant = property_terms[order] == np.arange(len(terms))[:, np.newaxis]
+    hits = np.cumsum(relevant, axis=1)
+    precisions = hits / np.arange(1, relevant.shape[1] + 1)
+    n_relevant = relevant.sum(axis=1)
+    average_precisions = (precisions * relevant).sum(axis=1) / np.maximum(n_relevant, 1)
+
+    covered_terms = term_ids >= 0
+
+    return {"map": float(average_precisions[covered_terms].mean()) if covered_terms.any() else float("nan"),
+            "average_precision": {term: float(ap) for term, ap, covered in zip(terms, average_precisions, covered_terms)
+                                  if covered},
+            "terms": len(terms),
+            "covered_terms": int(covered_terms.sum()),
+            "properties": len(property_terms),
+            "covered_properties": int(covered_properties.sum())}
+
+
+def evaluate_dtfit(space: dsmagic.VectorSpace,
+                   dataset: Dict[Tuple[Tuple[str, str], Tuple[str, str], Tuple[str, str]], int],
+                   operator: str = "additive",
+                   weights: Union[List[float], Dict[str, Union[float, np.ndarray]]] = None,
+                   item_to_id: Callable[[Union[str, Tuple[str, ...]]], int] = None
+                   ) -> Dict[str, Any]:
+    """
+    Typicality on DTFit: the subject and verb of each triple are composed, and the object is scored
+    by its cosine similarity to the composed vector. Triples sharing subject and verb are compared,
+    and a comparison is correct when the typical object scores higher than the atypical one.
+
+    Words are looked up by lexeme only, since DTFit gives their syntactic role instead of their PoS.
+    Roles ("nsubj", "root") are passed to the "role" operator.
+
+    Example:
+        dataset = dataset_utilities.read_DTFit("datasets/DTFit_vassallo_deps.txt")
+        evaluate_dtfit(space, dataset, "weighted_additive", [0.3, 0.7])
+
+    Args:
+        space (dsmagic.VectorSpace): word vectors
+        dataset (Dict[Tuple[Tuple[str, str], Tuple[str, str], Tuple[str, str]], int]): output of "read_DTFit"
+        operator (str, optional): composition operator (see "compose"). Defaults to "additive".
+        weights (Union[List[float], Dict[str, Union[float, np.ndarray]]], optional): weights of the operator. Defaults to None.
+        item_to_id (Callable[[Union[str, Tuple[str, ...]]], int], optional): function from lexeme to row id.
+            Defaults to None ("make_item_mapper" with default arguments).
+
+    Returns:
+        Dict[str, Any]: accuracy over covered comparisons, mean score of typical and atypical triples,
+            the score of each triple (NaN if not covered) and coverage statistics
+    """
+
+    if item_to_id is None:
+        item_to_id = make_item_mapper(space.id_dict)
+
+    triples = list(dataset)
+    labels = np.array([dataset[triple] for triple in triples], dtype=np.int64)
+
+    context_ids = np.array([(item_to_id(subj[0]), item_to_id(verb[0])) for subj, verb, _ in triples], dtype=np.int64).reshape(-1, 2)
+    object_ids = np.array([item_to_id(obj[0]) for _, _, obj in triples], dtype=np.int64)
+    roles = np.array([(subj[1], verb[1]) for subj, verb, _ in triples]).reshape(-1, 2)
+
+    composed = compose(space, context_ids, operator, weights, roles)
+    scores = cosine_pairs(composed, space.normalized[np.maximum(object_ids, 0)]).astype(np.float64)
+
+    covered = (context_ids >= 0).all(axis=1) & (object_ids >= 0)
+    scores[~covered] = np.nan
+
+    comparisons = typicality_comparisons(triples, labels)
+    covered_comparisons = covered[comparisons].all(axis=1)
+    correct = scores[comparisons[:, 0]] > scores[comparisons[:, 1]]
+
+    return {"accuracy": float(correct[covered_comparisons].mean()) if covered_comparisons.any() else float("nan"),
+            "mean_typical": float(np.nanmean(scores[labels == 1])) if (covered & (labels == 1)).any() else float("nan"),
+            "mean_atypical": float(np.nanmean(scores[labels == 0])) if (covered & (labels == 0)).any() else float("nan"),
+            "scores": dict(zip(triples, scores.tolist())),
+            "triples": len(triples),
+            "covered_triples": int(covered.sum()),
+            "comparisons": len(comparisons),
+            "covered_comparisons": int(covered_comparisons.sum())}
@@ -2,10 +2,30 @@
 Set of utilities for Tutorial on Distributional Semantic Models
 """
   
+import array
 import collections
+import collections.abc
+import concurrent.futures
+import functools
+import gzip
+import hashlib
+import inspect
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
 import numpy as np
 import scipy as sp
 import math
+import operator
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
 
 from typing import Callable, Iterable, Generator, Tuple, Any, List, Set, Dict, Union
 
@@ -32,448 +52,4244 @@ def mk_reusable(fun: Callable) -> Generator[Any, None, None]:
     return MyIterable
 
 
-@mk_reusable
-def corpus_to_sentences(filename: str, 
-                        token_shape: Tuple[str, ...] = ("form", "lemma", "pos") 
-                        ) -> Generator[Iterable, None, None]:
+class Profiler:
     """
-    The function turns corpus into sentences containing only the required info.
-    How do we choose how much info we want to keep? One of the parameters of the
-    function controls that for us.
-
-    Args:
-        filename (str): path to file containing parsed corpus in CoNLL format
-        token_shape (Tuple[str,...], optional):tuple containing the info that we want to retain for each token.
-            Possible values for 'token_shape' are:
-            "s_id", "form", "lemma", "pos", "pos_fgrained",
-            "morph", "synhead", "synrel",
-            "_", "_", "mwe", "mwe2" 
-            Defaults to ("form", "lemma", "pos").
-
-    Yields:
-        Generator[Iterable, None, None]: Sentences containin tokens represented as token_shape
+    Collects per-stage measures of the instrumented functions of this module: wall time, sentences and tokens read 
+    (and their rate), peak resident memory and number of non-zero cells of the returned matrix.
+    
+    Profiling is off by default, and instrumented functions then run unchanged. Once enabled (see "enable_profiling"),
+    each call of an instrumented function adds a record to the report; tokens read by a corpus reader are also 
+    counted in the records of the functions reading it (e.g. "compute_frequencies"), and an optional callback
+    is called with the record of the outermost running stage every progress_every tokens.
+    For generators, such as "corpus_to_sentences", wall time is measured from the first to the last sentence,
+    including the time spent by the caller on each sentence.
     """
+    
+    def __init__(self):
+        self.enabled = False
+        self.records = []
+        self.progress = None
+        self.progress_every = 1000000
+        self._stack = []
+        self._pending_tokens = 0
+    
+    def stage(self, name: str) -> "_ProfiledStage":
+        """
+        Context manager measuring a stage
 
+        Args:
+            name (str): name of the stage
 
-    with open(filename, encoding="utf-8") as fin:
-        sentence = []
-
-        for _, line in enumerate(fin):
-
-            if not line.startswith("<"):
-                line = line.strip()
-
-                if len(line):
-
-                    linesplit = line.split("\t")
-
-                    CoNLL_columns = ["s_id", "form", "lemma",
-                                     "pos", "pos_fgrained",
-                                     "morph",
-                                     "synhead", "synrel",
-                                     "_", "_", "mwe", "mwe2"]
-                    
-                    full_token = dict(zip(CoNLL_columns, linesplit))
-                    token = tuple(full_token[col_name]
-                                  for col_name in token_shape)
-
-                    sentence.append(token)
+        Returns:
+            _ProfiledStage: context manager, whose record is available as its "record" attribute
+        """
+        
+        return _ProfiledStage(self, name)
+    
+    def count(self, sentences: int, tokens: int) -> None:
+        """
+        Adds sentences and tokens read to all running stages, and calls the progress callback when due
+        """
+        
+        for record in self._stack:
+            record["sentences"] += sentences
+            record["tokens"] += tokens
+        
+        if self.progress is not None and self._stack:
+            self._pending_tokens += tokens
+            if self._pending_tokens >= self.progress_every:
+                self._pending_tokens = 0
+                self.progress(_finalize_record(dict(self._stack[0]), time.perf_counter()))
+    
+    def report(self, filepath: str = None) -> List[Dict[str, Any]]:
+        """
+        Records of the calls profiled so far, optionally written to a JSON file
 
-                else:
-                    yield sentence
-                    sentence = []
+        Args:
+            filepath (str, optional): path to JSON file. Defaults to None.
 
-        yield sentence
+        Returns:
+            List[Dict[str, Any]]: one record per call, in order of completion
+        """
+        
+        if filepath is not None:
+            with open(filepath, "w", encoding="utf-8") as fout:
+                json.dump(self.records, fout, indent=2)
+        
+        return self.records
 
 
-@mk_reusable
-def corpus_to_sentences_w2v(filename: str, 
-                            token_shape: Tuple[str, ...] = ("form", "lemma", "pos")
-                            ) -> Generator[Iterable[str], None, None]:
+class _ProfiledStage:
+    """
+    Context manager measuring a stage for a Profiler
     """
-    The function turns corpus into sentences containing only the required info.
     
-    Similar to "corpus_to_sentences", but tokens are represented as strings
-    rather than tuples, in order to work as input for the gensim library
-
+    def __init__(self, profiler: Profiler, name: str):
+        self.profiler = profiler
+        self.record = {"stage": name, 
+                       "parent": profiler._stack[-1]["stage"] if profiler._stack else None, 
+                       "sentences": 0, 
+                       "tokens": 0, 
+                       "nnz": None}
+    
+    def __enter__(self) -> "_ProfiledStage":
+        self.record["start"] = time.perf_counter()
+        self.profiler._stack.append(self.record)
+        return self
+    
+    def __exit__(self, *exc_info: Any) -> None:
+        self.profiler._stack.remove(self.record)
+        self.profiler.records.append(_finalize_record(self.record, time.perf_counter()))
 
-    Args:
-        filename (str): path to file containing parsed corpus in CoNLL format
-        token_shape (Tuple[str, ...], optional): tuple containing the info that we want to retain for each token.
-            Possible values for 'token_shape' are:
-            "s_id", "form", "lemma", "pos", "pos_fgrained",
-            "morph", "synhead", "synrel",
-            "_", "_", "mwe", "mwe2" 
-            Defaults to ("form", "lemma", "pos").
 
-    Yields:
-        Generator[Iterable[str], None, None]: Sentences containin tokens represented as strings
+def _peak_rss_mb() -> float:
     """
+    Peak resident set size of the process in MB (None where the resource module is not available)
+    """
+    
+    if resource is None:
+        return None
+    
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / (1 << 10)
 
-    with open(filename, encoding="utf-8") as fin:
-        sentence = []
-
-        for _, line in enumerate(fin):
-
-            if not line.startswith("<"):
-                line = line.strip()
 
-                if len(line):
+def _finalize_record(record: Dict[str, Any], now: float) -> Dict[str, Any]:
+    seconds = now - record.pop("start")
+    record["seconds"] = seconds
+    record["sentences_per_second"] = record["sentences"] / seconds if seconds > 0 else None
+    record["tokens_per_second"] = record["tokens"] / seconds if seconds > 0 else None
+    record["peak_rss_mb"] = _peak_rss_mb()
+    
+    return record
 
-                    linesplit = line.split("\t")
-                    CoNLL_columns = ["s_id", "form", "lemma",
-                                     "pos", "pos_fgrained",
-                                     "morph",
-                                     "synhead", "synrel",
-                                     "_", "_", "mwe", "mwe2"]
 
-                    full_token = dict(zip(CoNLL_columns, linesplit))
-                    token = tuple(full_token[col_name]
-                                  for col_name in token_shape)
-                    
-                    token_str = "/".join(token)
-                    sentence.append(token_str)
+def _count_nnz(result: Any) -> int:
+    """
+    Number of non-zero cells of the matrix returned by an instrumented function (None if there is no matrix)
+    """
+    
+    if isinstance(result, tuple) and result:
+        result = result[0]
+    
+    if sp.sparse.issparse(result):
+        return int(result.nnz)
+    if isinstance(result, np.ndarray):
+        return int(np.count_nonzero(result))
+    if isinstance(result, dict) and all(isinstance(row, dict) for row in itertools.islice(result.values(), 10)):
+        return sum(len(row) for row in result.values())
+    
+    return None
 
-                else:
-                    yield sentence
-                    sentence = []
 
-        yield sentence
+PROFILER = Profiler()
 
 
-def compute_frequencies (filename: str, 
-                         token_shape: Tuple[str, ...] = ("form", "lemma", "pos")
-                         ) -> List[Tuple[Tuple[str,...], int]]:
+def enable_profiling(progress: Callable[[Dict[str, Any]], None] = None, 
+                     progress_every: int = 1000000
+                     ) -> Profiler:
     """
-    Given a corpus, the function computes the list of frequencies of its token, sorted in decreasing order
+    Turns on the instrumentation of the pipeline stages (reading, counting, weighting, neighbors), clearing previous records.
+    
+    Example:
+        enable_profiling(progress=print)
+        freqs = compute_frequencies("data/wikiCoNLL_10000")
+        disable_profiling().report("profile.json")
 
     Args:
-        filename (str): path to file containing parsed corpus in CoNLL format
-        token_shape (Tuple[str, ...], optional): tuple containing the info that we want to retain for each token.
-                                                Possible values for 'token_shape' are:
-                                                "s_id", "form", "lemma", "pos", "pos_fgrained",
-                                                "morph", "synhead", "synrel",
-                                                "_", "_", "mwe", "mwe2" 
-                                                Defaults to ("form", "lemma", "pos").
+        progress (Callable[[Dict[str, Any]], None], optional): function called with the current record of the 
+            outermost running stage, every progress_every tokens read. Defaults to None.
+        progress_every (int, optional): number of tokens between progress calls. Defaults to 1000000.
 
     Returns:
-        List[Tuple[Tuple[str,...], int]]: List of sorted frequencies
+        Profiler: the module profiler
     """
+    
+    PROFILER.records = []
+    PROFILER.progress = progress
+    PROFILER.progress_every = progress_every
+    PROFILER._pending_tokens = 0
+    PROFILER.enabled = True
+    
+    return PROFILER
 
-    freqDict = collections.defaultdict(int)
-
-    for sentence in corpus_to_sentences(filename, token_shape):
 
-        for token in sentence:
-            freqDict[token] += 1
+def disable_profiling() -> Profiler:
+    """
+    Turns off the instrumentation, keeping the records collected so far
 
-    sorted_freqs = sorted(freqDict.items(), key= lambda x: (-x[1], x[0]))
+    Returns:
+        Profiler: the module profiler
+    """
     
-    return list(sorted_freqs)
+    PROFILER.enabled = False
+    
+    return PROFILER
 
 
-def filter_by_POS(sorted_freqs: List[Tuple[Tuple[str,...], Any]], 
-                  poslist: Union[List[str], Set[str], Dict[str, Any]], 
-                  position: int = 1 
-                  ) -> List[Tuple[Tuple[str,...], Any]]:
+def profiled(stage: str) -> Callable[[Callable], Callable]:
     """
-    Filters list of tokens only keeping those with accepted Parts of Speech
+    Decorator instrumenting a function as a stage of the module profiler (see "Profiler").
+    
+    Generator functions are expected to yield sentences, which are counted as they are read.
+    When profiling is disabled, the function is called directly.
 
     Args:
-        sorted_freqs (List[Tuple[Tuple[str,...], Any]]): List of tokens in some representation format
-        poslist (Union[List[str], Set[str], Dict[str, Any]]): List of accepted Parts of Speech
-        position (int, optional): Offset of Part of Speech info in token representation. Defaults to 1.
+        stage (str): name of the stage
 
     Returns:
-        List[Tuple[Tuple[str,...], Any]]: Same list as sorted_freqs but filtered
+        Callable[[Callable], Callable]: decorator
     """
     
-    ret = []
-    for token, freq in sorted_freqs:
-        if token[position] in poslist:
-            ret.append((token, freq))
-            
-    return ret
+    def decorator(fun):
+        
+        if inspect.isgeneratorfunction(fun):
+            @functools.wraps(fun)
+            def wrapper(*args, **kwargs):
+                if not PROFILER.enabled:
+                    yield from fun(*args, **kwargs)
+                    return
+                
+                with PROFILER.stage(stage):
+                    for sentence in fun(*args, **kwargs):
+                        PROFILER.count(1, len(sentence))
+                        yield sentence
+        
+        else:
+            @functools.wraps(fun)
+            def wrapper(*args, **kwargs):
+                if not PROFILER.enabled:
+                    return fun(*args, **kwargs)
+                
+                with PROFILER.stage(stage) as profiled_stage:
+                    ret = fun(*args, **kwargs)
+                    profiled_stage.record["nnz"] = _count_nnz(ret)
+                
+                return ret
+        
+        return wrapper
+    
+    return decorator
 
 
-def filter_by_threshold(sorted_freqs: List[Tuple[Tuple[str,...], int]], 
-                        min_freq: int = 0
-                        ) -> List[Tuple[Tuple[str,...], int]]:
+CoNLL_COLUMNS = ["s_id", "form", "lemma",
+                 "pos", "pos_fgrained",
+                 "morph",
+                 "synhead", "synrel",
+                 "_", "_", "mwe", "mwe2"]
+
+
+def _token_projection(token_shape: Tuple[str, ...]) -> Callable[[List[str]], Tuple[str, ...]]:
     """
-    Filters list of tokens by minimum frequency
+    Resolves token_shape to column indices once, and returns a function projecting the fields of a CoNLL line onto them.
 
     Args:
-        sorted_freqs (List[Tuple[Tuple[str,...], int]]): List of tokens in some representation format with their frequency
-        min_freq (int, optional): Frequency threshold used for filtering. Defaults to 0.
+        token_shape (Tuple[str, ...]): tuple containing the info that we want to retain for each token.
 
     Returns:
-        List[Tuple[Tuple[str,...], int]]: Same list as sorted_freqs but filtered
+        Callable[[List[str]], Tuple[str, ...]]: function from the list of fields to the token tuple
     """
     
-    ret = []
-    for token, freq in sorted_freqs:
-        if freq > min_freq:
-            ret.append((token, freq))
+    # as in dict(zip(CoNLL_COLUMNS, ...)), a repeated column name refers to its last position
+    column_ids = dict(zip(CoNLL_COLUMNS, range(len(CoNLL_COLUMNS))))
+    indices = [column_ids[col_name] for col_name in token_shape]
     
-    return ret
+    if len(indices) == 1:
+        index = indices[0]
+        return lambda fields: (fields[index],)
+    
+    return operator.itemgetter(*indices)
 
 
-def load_from_file(filename: str, 
-                   sep: str = "\t"
-                   ) -> Dict[Tuple[str, ...], float]:
+def _read_sentences(filename: str, 
+                    token_shape: Tuple[str, ...], 
+                    start: int = 0, 
+                    end: int = None, 
+                    as_string: bool = False, 
+                    chunk_size: int = 1 << 24
+                    ) -> Generator[List[Tuple[str, ...]], None, None]:
     """
-    Load tokens from file with their frequencies
+    Reads sentences from a byte range of a CoNLL file.
+    
+    The range is expected to start at the beginning of a sentence (see "_split_corpus"),
+    lines are read as long as they start before 'end'. 
+    The file is read in binary chunks of chunk_size bytes, and each token is built 
+    by projecting the fields of its line onto the columns in token_shape.
 
     Args:
-        filename (str): path to file containing list of tokens
-        sep (str, optional): separator used to parse file into tokens. Defaults to '\t'.
+        filename (str): path to file containing parsed corpus in CoNLL format
+        token_shape (Tuple[str, ...]): tuple containing the info that we want to retain for each token.
+        start (int, optional): byte offset where reading starts. Defaults to 0.
+        end (int, optional): byte offset where reading stops. Defaults to None (end of file).
+        as_string (bool, optional): whether tokens are joined into "/"-separated strings. Defaults to False.
+        chunk_size (int, optional): number of bytes read at once. Defaults to 16MB.
 
-    Returns:
-        Dict[Tuple[str, ...], float]: Dictionary with tokens as keys and frequencies as values
+    Yields:
+        Generator[List[Tuple[str, ...]], None, None]: Sentences containin tokens represented as token_shape
     """
+    
+    project = _token_projection(token_shape)
+    if as_string:
+        tuple_project = project
+        project = lambda fields: "/".join(tuple_project(fields))
+    
+    with open(filename, "rb") as fin:
+        fin.seek(start)
+        remaining = end - start if end is not None else None
+        pending = b""
+        sentence = []
+        
+        while True:
+            size = chunk_size if remaining is None else min(chunk_size, remaining)
+            chunk = fin.read(size) if size > 0 else b""
+            
+            if chunk:
+                if remaining is not None:
+                    remaining -= len(chunk)
+                chunk = pending + chunk
+                cut = chunk.rfind(b"\n") + 1
+                pending = chunk[cut:]
+                lines = chunk[:cut].decode("utf-8").split("\n")[:-1]
+                
+            else:
+                # the last line may start before 'end' and finish after it
+                if pending and remaining is not None:
+                    pending += fin.readline()
+                lines = pending.decode("utf-8").split("\n")[:1] if pending else []
 
-    ret = {}
+            for line in lines:
+                
+                if not line.startswith("<"):
+                    line = line.strip()
 
-    with open(filename, encoding="utf-8") as fin:
-        for line in fin:
-            line = line.strip().split(sep)
+                    if line:
+                        sentence.append(project(line.split("\t")))
 
-            ret[tuple(line[:-1])] = float(line[-1])
+                    else:
+                        yield sentence
+                        sentence = []
+            
+            if not chunk:
+                break
 
-    return ret
+        yield sentence
 
 
-def build_sparse_matrix(filename: str, 
-                        token_shape: Tuple[str, ...], 
-                        nrows: int, 
-                        ncols: int, 
-                        sep: str = "\t"
-                        ) -> sp.sparse.spmatrix:
-    """_summary_
+def _split_corpus(filename: str, n_shards: int) -> List[Tuple[int, int]]:
+    """
+    Splits a CoNLL file into byte ranges of about the same size, aligned to sentence boundaries.
+    
+    Each range ends right after a blank line, so that no sentence is split across two ranges.
 
     Args:
-        filename (str): path to file containing matrix entries
-        token_shape (Tuple[str, ...]): tuple containing the info that we want to retain for each token.
-            Possible values for 'token_shape' are:
-            "s_id", "form", "lemma", "pos", "pos_fgrained",
-            "morph", "synhead", "synrel",
-            "_", "_", "mwe", "mwe2" 
-        nrows (int): number of rows
-        ncols (int): number of columns
-        sep (str, optional): separator used to parse file into tokens. Defaults to '\t'.
+        filename (str): path to file containing parsed corpus in CoNLL format
+        n_shards (int): number of ranges to produce. Fewer ranges are returned for small files.
 
     Returns:
-        sp.sparse.spmatrix: scipy sparse matrix in csr format
+        List[Tuple[int, int]]: list of (start, end) byte offsets
     """
-
-    rows = []
-    columns = []
-    data = []
-
-    targets_dict = {}
-    contexts_dict = {}
     
-    len_token_rep = len(token_shape)
-
-    with open(filename, encoding="utf-8") as fin:
-        for line in fin:
-            linesplit = line.strip().split(sep)
-            
-            weight = float(linesplit[-1])
-            
-            row = linesplit[:len_token_rep+1]
-            column = linesplit[len_token_rep+1:-1]
-            
-            row_id = int(row[0])
-            column_id = int(column[0])
+    size = os.path.getsize(filename)
+    boundaries = [0]
+    
+    with open(filename, "rb") as fin:
+        for shard_id in range(1, n_shards):
+            offset = max(size * shard_id // n_shards, boundaries[-1])
+            fin.seek(offset)
             
-            row_token = tuple(row[1:])
-            column_token = tuple(column[1:])          
+            # move to the beginning of the next line, then to the end of the next blank line
+            fin.readline()
+            line = fin.readline()
+            while line and line.strip():
+                line = fin.readline()
             
-            rows.append(row_id)
-            columns.append(column_id)
-            data.append(weight)
-
-            targets_dict[row_token] = row_id
-            contexts_dict[column_token] = column_id
-
-    ret = sp.sparse.csr_matrix(
-        (data, (rows, columns)), shape=(nrows, ncols), dtype=np.float32)
-    return ret, targets_dict, contexts_dict
+            boundary = fin.tell()
+            if boundary > boundaries[-1] and boundary < size:
+                boundaries.append(boundary)
+    
+    boundaries.append(size)
+    
+    return list(zip(boundaries[:-1], boundaries[1:]))
 
 
-def write_to_file(filepath: str, 
-                  matrix: Iterable[Iterable[Union[int, float]]], 
-                  id_dict: Dict[Tuple[str, ...], int]
-                  ) -> None:
+def _last_sentence_boundary(filename: str, start: int = 0) -> int:
     """
-    Serialize vectors to file
+    Finds the end of the last complete sentence of a CoNLL file, i.e. the byte offset right after its last blank line.
+    
+    Sentences still being written (not yet followed by a blank line) are left out.
 
     Args:
-        filepath (str): path to location where file has to be created
-        matrix (Iterable[Iterable[int  |  float]]): matrix (iterable of iterable)
-        id_dict (Dict[Tuple[str, ...], int]): mapping from row id to token
+        filename (str): path to file containing parsed corpus in CoNLL format
+        start (int, optional): byte offset of the beginning of a sentence, where the search starts. Defaults to 0.
+
+    Returns:
+        int: byte offset (start if no sentence is complete)
     """
     
-    sorted_dict = sorted(id_dict.items(), key=lambda x: x[1])
+    boundary = start
     
-    with open(filepath, "w", encoding="utf-8") as fout:
-        for row_id, row in enumerate(matrix):
-            token_str = "\t".join(sorted_dict[row_id][0])
-            vector_str = "\t".join(str(x) for x in row)
-            print(f"{token_str}\t{vector_str}", file=fout)
-            
+    with open(filename, "rb") as fin:
+        fin.seek(start)
+        for line in fin:
+            start += len(line)
+            if line.endswith(b"\n") and not line.strip():
+                boundary = start
+    
+    return boundary
 
-def get_nearest_neighbors(matrix: Iterable[Iterable[Union[int, float]]], 
-                          id_dict: Dict[Tuple[str, ...], int], 
-                          topk: int = 10
-                          ) -> Dict[Tuple[str, ...], List[Tuple[Tuple[str, ...], float]]]:
+
+def _run_sharded(worker: Callable, 
+                 filename: str, 
+                 workers: int, 
+                 *args: Any
+                 ) -> Iterable[Any]:
     """
-    Get nearest neighbors from matrix containing cosine similarities
+    Runs worker on sentence-aligned shards of a CoNLL file, in a pool of processes.
 
     Args:
-        matrix (Iterable[Iterable[Union[int, float]]]): dense matrix containing cosine similarities
-        id_dict (Dict[Tuple[str, ...], int]): mapping from row or column id to token
-        topk (int, optional): Number of neighbors to return. Defaults to 10.
+        worker (Callable): top-level function called as worker((filename, start, end, *args))
+        filename (str): path to file containing parsed corpus in CoNLL format
+        workers (int): number of processes
+        *args (Any): additional arguments passed to the worker
 
     Returns:
-        Dict[Tuple[str, ...], List[Tuple[Tuple[str, ...], float]]]: Dictionary containing, for each token, its top neighbors and their cosine similarity
+        Iterable[Any]: results of the worker, one per shard, in file order
     """
     
-    ret = {}
-    sorted_dict = sorted(id_dict.items(), key=lambda x: x[1])
-    sorted_dict = [x[0] for x in sorted_dict]
+    tasks = [(filename, start, end) + args for start, end in _split_corpus(filename, workers)]
     
-    for row_id, row in enumerate(matrix):
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(worker, tasks))
 
-        row_with_labels = zip (row, sorted_dict)
-        sorted_row = sorted(row_with_labels, reverse=True)
+
+class CompiledCorpus:
+    """
+    Corpus compiled by "compile_corpus": one memory-mapped int32 array of ids per CoNLL column,
+    the vocabulary of each column and the offsets of sentences.
+
+    Args:
+        path (str): path to directory created by "compile_corpus"
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
         
-        ret[sorted_dict[row_id]] = sorted_row[:topk]
+        with open(os.path.join(path, "columns.txt"), encoding="utf-8") as fin:
+            self.column_names = tuple(line.rstrip("\n") for line in fin)
         
-    return ret
+        self.columns = {}
+        self.vocabularies = {}
+        for col_name in self.column_names:
+            self.columns[col_name] = np.load(os.path.join(path, f"{col_name}.npy"), mmap_mode="r")
+            with open(os.path.join(path, f"{col_name}.vocab"), encoding="utf-8") as fin:
+                self.vocabularies[col_name] = [line.rstrip("\n") for line in fin]
+    
+    @property
+    def n_sentences(self) -> int:
+        return len(self.offsets) - 1
+    
+    @property
+    def n_tokens(self) -> int:
+        return int(self.offsets[-1])
 
+    def token_keys(self, 
+                   token_shape: Tuple[str, ...], 
+                   start: int = 0, 
+                   end: int = None
+                   ) -> np.ndarray:
+        """
+        Encodes each token of a range of positions as a single int64, combining the ids of the columns in token_shape.
 
+        Args:
+            token_shape (Tuple[str, ...]): tuple containing the columns that identify a token
+            start (int, optional): first position. Defaults to 0.
+            end (int, optional): last position (excluded). Defaults to None (end of corpus).
+
+        Returns:
+            np.ndarray: token keys
+        """
+        
+        ret = np.zeros(len(self.columns[token_shape[0]][start:end]), dtype=np.int64)
+        for col_name in token_shape:
+            ret *= len(self.vocabularies[col_name])
+            ret += self.columns[col_name][start:end]
+        
+        return ret
+    
+    def encode(self, 
+               tokens: Iterable[Tuple[str, ...]], 
+               token_shape: Tuple[str, ...]
+               ) -> np.ndarray:
+        """
+        Encodes tokens as keys (see "token_keys"). Tokens that never occur in the corpus get key -1.
+
+        Args:
+            tokens (Iterable[Tuple[str, ...]]): tokens represented as token_shape
+            token_shape (Tuple[str, ...]): tuple containing the columns that identify a token
+
+        Returns:
+            np.ndarray: token keys
+        """
+        
+        lookups = [{value: value_id for value_id, value in enumerate(self.vocabularies[col_name])} 
+                   for col_name in token_shape]
+        
+        ret = []
+        for token in tokens:
+            key = 0
+            for lookup, col_name, value in zip(lookups, token_shape, token):
+                if value not in lookup:
+                    key = -1
+                    break
+                key = key * len(self.vocabularies[col_name]) + lookup[value]
+            ret.append(key)
+        
+        return np.array(ret, dtype=np.int64)
+    
+    def decode(self, 
+               keys: Iterable[int], 
+               token_shape: Tuple[str, ...]
+               ) -> List[Tuple[str, ...]]:
+        """
+        Decodes keys (see "token_keys") back to tokens.
+
+        Args:
+            keys (Iterable[int]): token keys
+            token_shape (Tuple[str, ...]): tuple containing the columns that identify a token
+
+        Returns:
+            List[Tuple[str, ...]]: tokens represented as token_shape
+        """
+        
+        keys = np.array(keys, dtype=np.int64)
+        values = []
+        for col_name in reversed(token_shape):
+            vocabulary = self.vocabularies[col_name]
+            keys, value_ids = np.divmod(keys, len(vocabulary))
+            values.append([vocabulary[value_id] for value_id in value_ids])
+        
+        return list(zip(*reversed(values)))
+    
+    def check_token_shape(self, token_shape: Tuple[str, ...]) -> None:
+        """
+        Checks that token_shape only uses compiled columns and that its keys fit in an int64
+
+        Args:
+            token_shape (Tuple[str, ...]): tuple containing the columns that identify a token
+
+        Raises:
+            ValueError: if token_shape cannot be used with this corpus
+        """
+        
+        missing = [col_name for col_name in token_shape if col_name not in self.columns]
+        if missing:
+            raise ValueError(f"Columns {missing} were not compiled in {self.path}")
+        
+        if math.prod(len(self.vocabularies[col_name]) for col_name in token_shape) >= 2**63:
+            raise ValueError(f"Token shape {token_shape} has too many distinct values to be encoded")
+
+
+def compile_corpus(filename: str, 
+                   output_dir: str, 
+                   columns: Tuple[str, ...] = ("form", "lemma", "pos")
+                   ) -> CompiledCorpus:
+    """
+    Compiles a CoNLL corpus into a binary format that can be read without parsing.
+    
+    For each column, the directory will contain a vocabulary file ([column].vocab, one value per line)
+    and an int32 array of ids ([column].npy), one per token. 
+    Sentence boundaries are stored in offsets.npy (int64, number of sentences + 1 entries).
+    
+    The output directory can then be passed in place of the CoNLL file to "corpus_to_sentences", 
+    "compute_frequencies" and "extract_cooccurrences_sparse".
+
+    Args:
+        filename (str): path to file containing parsed corpus in CoNLL format
+        output_dir (str): path to directory where the compiled corpus is written
+        columns (Tuple[str, ...], optional): columns to compile.
+            Possible values are:
+            "s_id", "form", "lemma", "pos", "pos_fgrained",
+            "morph", "synhead", "synrel",
+            "_", "mwe", "mwe2" 
+            Defaults to ("form", "lemma", "pos").
+
+    Returns:
+        CompiledCorpus: the compiled corpus
+    """
+    
+    lookups = [{} for _ in columns]
+    ids = [array.array("i") for _ in columns]
+    offsets = array.array("q", [0])
+    
+    for sentence in _read_sentences(filename, columns):
+        for token in sentence:
+            for lookup, column_ids, value in zip(lookups, ids, token):
+                column_ids.append(lookup.setdefault(value, len(lookup)))
+        offsets.append(offsets[-1] + len(sentence))
+    
+    os.makedirs(output_dir, exist_ok=True)
+    
+    for col_name, lookup, column_ids in zip(columns, lookups, ids):
+        np.save(os.path.join(output_dir, f"{col_name}.npy"), np.frombuffer(column_ids, dtype=np.int32))
+        with open(os.path.join(output_dir, f"{col_name}.vocab"), "w", encoding="utf-8") as fout:
+            for value in lookup:
+                print(value, file=fout)
+    
+    np.save(os.path.join(output_dir, "offsets.npy"), np.frombuffer(offsets, dtype=np.int64))
+    
+    with open(os.path.join(output_dir, "columns.txt"), "w", encoding="utf-8") as fout:
+        for col_name in columns:
+            print(col_name, file=fout)
+    
+    return CompiledCorpus(output_dir)
+
+
+def _is_compiled_corpus(path: str) -> bool:
+    """
+    Checks whether path points to a corpus created by "compile_corpus"
+    """
+    return os.path.isfile(os.path.join(path, "offsets.npy"))
+
+
+def _read_compiled_sentences(path: str, 
+                             token_shape: Tuple[str, ...], 
+                             as_string: bool = False
+                             ) -> Generator[List[Tuple[str, ...]], None, None]:
+    """
+    Reads sentences from a compiled corpus.
+
+    Args:
+        path (str): path to directory created by "compile_corpus"
+        token_shape (Tuple[str, ...]): tuple containing the info that we want to retain for each token.
+        as_string (bool, optional): whether tokens are joined into "/"-separated strings. Defaults to False.
+
+    Yields:
+        Generator[List[Tuple[str, ...]], None, None]: Sentences containin tokens represented as token_shape
+    """
+    
+    corpus = CompiledCorpus(path)
+    corpus.check_token_shape(token_shape)
+    
+    vocabularies = [corpus.vocabularies[col_name] for col_name in token_shape]
+    columns = [corpus.columns[col_name] for col_name in token_shape]
+    
+    for sentence_id in range(corpus.n_sentences):
+        start, end = corpus.offsets[sentence_id], corpus.offsets[sentence_id+1]
+        values = [[vocabulary[value_id] for value_id in column[start:end].tolist()] 
+                  for vocabulary, column in zip(vocabularies, columns)]
+        if as_string:
+            yield ["/".join(token) for token in zip(*values)]
+        else:
+            yield list(zip(*values))
+
+
+@mk_reusable
+@profiled("corpus_to_sentences")
+def corpus_to_sentences(filename: str, 
+                        token_shape: Tuple[str, ...] = ("form", "lemma", "pos") 
+                        ) -> Generator[Iterable, None, None]:
+    """
+    The function turns corpus into sentences containing only the required info.
+    How do we choose how much info we want to keep? One of the parameters of the
+    function controls that for us.
+
+    Args:
+        filename (str): path to file containing parsed corpus in CoNLL format, or to a corpus created by "compile_corpus"
+        token_shape (Tuple[str,...], optional):tuple containing the info that we want to retain for each token.
+            Possible values for 'token_shape' are:
+            "s_id", "form", "lemma", "pos", "pos_fgrained",
+            "morph", "synhead", "synrel",
+            "_", "_", "mwe", "mwe2" 
+            Defaults to ("form", "lemma", "pos").
+
+    Yields:
+        Generator[Iterable, None, None]: Sentences containin tokens represented as token_shape
+    """
+
+    if _is_compiled_corpus(filename):
+        yield from _read_compiled_sentences(filename, token_shape)
+    else:
+        yield from _read_sentences(filename, token_shape)
+
+
+@mk_reusable
+@profiled("corpus_to_sentences_w2v")
+def corpus_to_sentences_w2v(filename: str, 
+                            token_shape: Tuple[str, ...] = ("form", "lemma", "pos")
+                            ) -> Generator[Iterable[str], None, None]:
+    """
+    The function turns corpus into sentences containing only the required info.
+    
+    Similar to "corpus_to_sentences", but tokens are represented as strings
+    rather than tuples, in order to work as input for the gensim library
+
+
+    Args:
+        filename (str): path to file containing parsed corpus in CoNLL format, or to a corpus created by "compile_corpus"
+        token_shape (Tuple[str, ...], optional): tuple containing the info that we want to retain for each token.
+            Possible values for 'token_shape' are:
+            "s_id", "form", "lemma", "pos", "pos_fgrained",
+            "morph", "synhead", "synrel",
+            "_", "_", "mwe", "mwe2" 
+            Defaults to ("form", "lemma", "pos").
+
+    Yields:
+        Generator[Iterable[str], None, None]: Sentences containin tokens represented as strings
+    """
+
+    if _is_compiled_corpus(filename):
+        yield from _read_compiled_sentences(filename, token_shape, as_string=True)
+    else:
+        yield from _read_sentences(filename, token_shape, as_string=True)
+
+
+@mk_reusable
+@profiled("corpus_to_id_sentences")
+def corpus_to_id_sentences(filename: str, 
+                           token_to_id: Dict[Tuple[str, ...], int], 
+                           token_shape: Tuple[str, ...] = ("form", "lemma", "pos")
+                           ) -> Generator[np.ndarray, None, None]:
+    """
+    The function turns corpus into sentences represented as arrays of integer ids.
+    
+    Similar to "corpus_to_sentences", but each token is replaced by its id in token_to_id 
+    (-1 for tokens that are not in the mapping).
+
+    Args:
+        filename (str): path to file containing parsed corpus in CoNLL format, or to a corpus created by "compile_corpus"
+        token_to_id (Dict[Tuple[str, ...], int]): mapping from token (represented as token_shape) to id
+        token_shape (Tuple[str, ...], optional): tuple containing the info that we want to retain for each token.
+            Possible values for 'token_shape' are:
+            "s_id", "form", "lemma", "pos", "pos_fgrained",
+            "morph", "synhead", "synrel",
+            "_", "_", "mwe", "mwe2" 
+            Defaults to ("form", "lemma", "pos").
+
+    Yields:
+        Generator[np.ndarray, None, None]: Sentences as int32 arrays of token ids
+    """
+    
+    get_id = token_to_id.get
+    
+    for sentence in corpus_to_sentences(filename, token_shape):
+        yield np.array([get_id(token, -1) for token in sentence], dtype=np.int32)
+
+
+class Vocabulary(collections.abc.Mapping):
+    """
+    Compact mapping from tokens to dense integer ids, with the frequency of each token.
+    
+    Tokens are not stored as tuples: each distinct value of each field is stored once, and each token 
+    as a row of int32 codes in codes (one column per field). Lookups go through a sorted array of int64 keys 
+    combining the codes of the fields, so that batches of tokens are mapped to ids with NumPy ("encode")
+    and ids back to tokens ("decode"). Frequencies are an int64 array indexed by id.
+    
+    A Vocabulary behaves as a read-only dictionary from token to id, so it can be passed wherever a mapping 
+    from token to id (e.g. targets_dict) or a collection of tokens (e.g. targets) is accepted.
+    "compute_frequencies" returns one with as_vocabulary, and "filter_by_POS" and "filter_by_threshold" 
+    filter it into a new Vocabulary.
+
+    Args:
+        tokens (Iterable[Tuple[str, ...]]): distinct tokens, in id order
+        frequencies (Iterable[int], optional): frequency of each token. Defaults to None (all 0).
+    """
+    
+    __slots__ = ("fields", "codes", "frequencies", "_lookups", "_radixes", "_keys", "_ids")
+    
+    def __init__(self, 
+                 tokens: Iterable[Tuple[str, ...]], 
+                 frequencies: Iterable[int] = None):
+        
+        tokens = list(tokens)
+        n_fields = len(tokens[0]) if tokens else 0
+        
+        lookups = [{} for _ in range(n_fields)]
+        codes = np.empty((len(tokens), n_fields), dtype=np.int32)
+        
+        for field, lookup in enumerate(lookups):
+            codes[:, field] = [lookup.setdefault(token[field], len(lookup)) for token in tokens]
+        
+        self._init_arrays([list(lookup) for lookup in lookups], lookups, codes, frequencies)
+    
+    def _init_arrays(self, 
+                     fields: List[List[str]], 
+                     lookups: List[Dict[str, int]], 
+                     codes: np.ndarray, 
+                     frequencies: Iterable[int]
+                     ) -> None:
+        
+        self.fields = fields
+        self._lookups = lookups
+        self.codes = codes
+        self._radixes = [len(values) for values in fields]
+        
+        if math.prod(self._radixes) >= 2**63:
+            raise ValueError("Tokens have too many distinct values to be encoded")
+        
+        keys = self._keys_of(codes)
+        self._ids = np.argsort(keys, kind="stable")
+        self._keys = keys[self._ids]
+        
+        if len(keys) > 1 and (self._keys[1:] == self._keys[:-1]).any():
+            raise ValueError("Tokens of a Vocabulary must be distinct")
+        
+        if frequencies is None:
+            self.frequencies = np.zeros(len(codes), dtype=np.int64)
+        else:
+            self.frequencies = np.fromiter(frequencies, dtype=np.int64, count=len(codes))
+    
+    @classmethod
+    def _from_codes(cls, 
+                    fields: List[List[str]], 
+                    lookups: List[Dict[str, int]], 
+                    codes: np.ndarray, 
+                    frequencies: np.ndarray
+                    ) -> "Vocabulary":
+        ret = cls.__new__(cls)
+        ret._init_arrays(fields, lookups, codes, frequencies)
+        return ret
+    
+    @classmethod
+    def from_frequencies(cls, sorted_freqs: List[Tuple[Tuple[str,...], int]]) -> "Vocabulary":
+        """
+        Builds a vocabulary from the output of "compute_frequencies", ids following the order of the list
+
+        Args:
+            sorted_freqs (List[Tuple[Tuple[str,...], int]]): List of tokens with their frequency
+
+        Returns:
+            Vocabulary: the vocabulary
+        """
+        
+        return cls((token for token, _ in sorted_freqs), (freq for _, freq in sorted_freqs))
+    
+    def _keys_of(self, codes: np.ndarray) -> np.ndarray:
+        ret = np.zeros(len(codes), dtype=np.int64)
+        for field, radix in enumerate(self._radixes):
+            ret *= radix
+            ret += codes[:, field]
+        
+        return ret
+    
+    def encode(self, tokens: Iterable[Tuple[str, ...]]) -> np.ndarray:
+        """
+        Maps tokens to ids
+
+        Args:
+            tokens (Iterable[Tuple[str, ...]]): tokens
+
+        Returns:
+            np.ndarray: id of each token, -1 for tokens not in the vocabulary
+        """
+        
+        tokens = list(tokens)
+        n_fields = len(self.fields)
+        
+        codes = np.empty((len(tokens), n_fields), dtype=np.int64)
+        for field, lookup in enumerate(self._lookups):
+            codes[:, field] = [lookup.get(token[field], -1) if len(token) == n_fields else -1 for token in tokens]
+        
+        if not len(self._keys):
+            return np.full(len(tokens), -1, dtype=np.int64)
+        
+        keys = self._keys_of(np.maximum(codes, 0))
+        positions = np.minimum(np.searchsorted(self._keys, keys), len(self._keys) - 1)
+        found = (self._keys[positions] == keys) & (codes >= 0).all(axis=1)
+        
+        return np.where(found, self._ids[positions], -1)
+    
+    def decode(self, ids: Iterable[int]) -> List[Tuple[str, ...]]:
+        """
+        Maps ids back to tokens
+
+        Args:
+            ids (Iterable[int]): token ids
+
+        Returns:
+            List[Tuple[str, ...]]: tokens
+        """
+        
+        codes = self.codes[np.asarray(ids, dtype=np.int64)]
+        values = [list(map(self.fields[field].__getitem__, codes[:, field].tolist())) 
+                  for field in range(len(self.fields))]
+        
+        return list(zip(*values)) if values else [()] * len(codes)
+    
+    def subset(self, selection: np.ndarray) -> "Vocabulary":
+        """
+        New vocabulary made of some of the tokens, with their frequency, renumbered in order
+
+        Args:
+            selection (np.ndarray): boolean mask or array of ids of the tokens to keep
+
+        Returns:
+            Vocabulary: the selected vocabulary
+        """
+        
+        return Vocabulary._from_codes(self.fields, self._lookups, self.codes[selection], self.frequencies[selection])
+    
+    def frequency_list(self) -> List[Tuple[Tuple[str,...], int]]:
+        """
+        Tokens with their frequency, in id order (i.e. the format of "compute_frequencies")
+
+        Returns:
+            List[Tuple[Tuple[str,...], int]]: List of tokens with their frequency
+        """
+        
+        return list(zip(self, self.frequencies.tolist()))
+    
+    def _lookup(self, token: Any) -> int:
+        """
+        Id of a single token, -1 if missing (scalar path of "encode", for per-token loops)
+        """
+        
+        if not isinstance(token, tuple) or len(token) != len(self._lookups) or not len(self._keys):
+            return -1
+        
+        key = 0
+        for lookup, radix, value in zip(self._lookups, self._radixes, token):
+            code = lookup.get(value)
+            if code is None:
+                return -1
+            key = key * radix + code
+        
+        position = int(self._keys.searchsorted(key))
+        if position < len(self._keys) and self._keys[position] == key:
+            return int(self._ids[position])
+        
+        return -1
+    
+    def __getitem__(self, token: Tuple[str, ...]) -> int:
+        token_id = self._lookup(token)
+        if token_id < 0:
+            raise KeyError(token)
+        
+        return token_id
+    
+    def get(self, token: Tuple[str, ...], default: Any = None) -> Any:
+        token_id = self._lookup(token)
+        return token_id if token_id >= 0 else default
+    
+    def __contains__(self, token: Any) -> bool:
+        return self._lookup(token) >= 0
+    
+    def __len__(self) -> int:
+        return len(self.codes)
+    
+    def __iter__(self) -> Generator[Tuple[str, ...], None, None]:
+        for start in range(0, len(self), 100000):
+            yield from self.decode(np.arange(start, min(start + 100000, len(self))))
+    
+    def values(self) -> range:
+        return range(len(self))
+    
+    def items(self) -> Iterable[Tuple[Tuple[str, ...], int]]:
+        return zip(self, range(len(self)))
+    
+    def __repr__(self) -> str:
+        return f"Vocabulary({len(self)} tokens)"
+
+
+class FrequencyTable:
+    """
+    Token frequencies as parallel arrays sorted by decreasing frequency, for fast repeated filtering.
+    
+    Rows are token ids (of a Vocabulary) and their counts. An index by Part of Speech, i.e. the ids grouped by
+    the value of one field and still sorted by frequency within each group, is built once, so that
+    "filter_by_POS" for a single PoS and "filter_by_threshold" (a binary search on sorted counts) 
+    return tables that are views of the arrays of the original one, without copying. 
+    Filtering for several PoS at once takes a boolean mask.
+    
+    Iterating over a table yields (token, frequency) pairs, as the list returned by "compute_frequencies",
+    and a table can be passed as targets or contexts to the extraction functions.
+    
+    Example:
+        table = FrequencyTable(compute_frequencies("data/wikiCoNLL_10000", ("lemma", "pos"), as_vocabulary=True))
+        for min_freq in (10, 50, 100):
+            targets = filter_by_threshold(filter_by_POS(table, {"S"}), min_freq)
+
+    Args:
+        frequencies (Union[Vocabulary, List[Tuple[Tuple[str,...], int]]]): Vocabulary with frequencies,
+            or list returned by "compute_frequencies"
+        position (int, optional): Offset of Part of Speech info in token representation, 
+            whose index is built up front. Defaults to 1.
+    """
+    
+    def __init__(self, 
+                 frequencies: Union[Vocabulary, List[Tuple[Tuple[str,...], int]]], 
+                 position: int = 1):
+        
+        if not isinstance(frequencies, Vocabulary):
+            frequencies = Vocabulary.from_frequencies(frequencies)
+        
+        self.vocabulary = frequencies
+        self.ids = np.argsort(-frequencies.frequencies, kind="stable")
+        self.counts = frequencies.frequencies[self.ids]
+        self._pos_index = {}
+        
+        if position is not None and position < len(frequencies.fields):
+            self._get_pos_index(position)
+    
+    @classmethod
+    def _view(cls, vocabulary: Vocabulary, ids: np.ndarray, counts: np.ndarray) -> "FrequencyTable":
+        ret = cls.__new__(cls)
+        ret.vocabulary = vocabulary
+        ret.ids = ids
+        ret.counts = counts
+        ret._pos_index = {}
+        return ret
+    
+    def _get_pos_index(self, position: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Ids and counts grouped by the code of field position (sorted by frequency within groups), 
+        and the start of each group
+        """
+        
+        if position not in self._pos_index:
+            pos_codes = self.vocabulary.codes[self.ids, position]
+            order = np.argsort(pos_codes, kind="stable")
+            starts = np.searchsorted(pos_codes[order], np.arange(len(self.vocabulary.fields[position]) + 1))
+            self._pos_index[position] = (self.ids[order], self.counts[order], starts)
+        
+        return self._pos_index[position]
+    
+    def filter_by_pos(self, 
+                      poslist: Union[List[str], Set[str], Dict[str, Any]], 
+                      position: int = 1
+                      ) -> "FrequencyTable":
+        """
+        Keeps tokens with accepted Parts of Speech (see "filter_by_POS")
+
+        Args:
+            poslist (Union[List[str], Set[str], Dict[str, Any]]): List of accepted Parts of Speech
+            position (int, optional): Offset of Part of Speech info in token representation. Defaults to 1.
+
+        Returns:
+            FrequencyTable: filtered table
+        """
+        
+        lookup = self.vocabulary._lookups[position]
+        codes = sorted(set(lookup[pos] for pos in poslist if pos in lookup))
+        
+        if len(codes) == 1:
+            ids, counts, starts = self._get_pos_index(position)
+            group = slice(starts[codes[0]], starts[codes[0] + 1])
+            return FrequencyTable._view(self.vocabulary, ids[group], counts[group])
+        
+        mask = np.isin(self.vocabulary.codes[self.ids, position], codes)
+        return FrequencyTable._view(self.vocabulary, self.ids[mask], self.counts[mask])
+    
+    def filter_by_threshold(self, min_freq: int = 0) -> "FrequencyTable":
+        """
+        Keeps tokens whose frequency is greater than min_freq (see "filter_by_threshold")
+
+        Args:
+            min_freq (int, optional): Frequency threshold used for filtering. Defaults to 0.
+
+        Returns:
+            FrequencyTable: filtered table
+        """
+        
+        # counts are sorted in decreasing order, so their reversed view is sorted in increasing order
+        n_kept = len(self.counts) - np.searchsorted(self.counts[::-1], min_freq, side="right")
+        
+        return FrequencyTable._view(self.vocabulary, self.ids[:n_kept], self.counts[:n_kept])
+    
+    def tokens(self) -> List[Tuple[str, ...]]:
+        """
+        Tokens of the table, by decreasing frequency
+
+        Returns:
+            List[Tuple[str, ...]]: tokens
+        """
+        
+        return self.vocabulary.decode(self.ids)
+    
+    def to_list(self) -> List[Tuple[Tuple[str,...], int]]:
+        """
+        Tokens with their frequency, in the format of "compute_frequencies"
+
+        Returns:
+            List[Tuple[Tuple[str,...], int]]: List of sorted frequencies
+        """
+        
+        return list(zip(self.tokens(), self.counts.tolist()))
+    
+    def as_vocabulary(self) -> Vocabulary:
+        """
+        Tokens of the table as a Vocabulary, with ids following the table order
+
+        Returns:
+            Vocabulary: the vocabulary
+        """
+        
+        return self.vocabulary.subset(self.ids)
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+    
+    def __iter__(self) -> Iterable[Tuple[Tuple[str,...], int]]:
+        return iter(self.to_list())
+    
+    def __repr__(self) -> str:
+        return f"FrequencyTable({len(self)} tokens)"
+
+
+class CountMinSketch:
+    """
+    Approximate token frequencies in fixed memory: a count-min sketch, plus a bounded set of heavy-hitter candidates.
+    
+    Each token is hashed to one cell per row of a (depth, width) table of counters, with the double hashing scheme 
+    of Kirsch and Mitzenmacher over a 64-bit blake2b digest; its estimated frequency is the smallest of its counters.
+    Estimates never underestimate, and overestimate by more than error_bound() with probability at most exp(-depth).
+    The top_k most frequent tokens are tracked while counting, so that the head of the distribution can be 
+    returned without storing every distinct token.
+    
+    Sketches with the same width and depth can be merged, e.g. to count shards of a corpus in parallel.
+
+    Args:
+        width (int, optional): number of counters in each row. Defaults to 2**22.
+        depth (int, optional): number of rows. Defaults to 4.
+        top_k (int, optional): number of tokens tracked as heavy hitters. Defaults to 100000.
+    """
+    
+    def __init__(self, width: int = 1 << 22, depth: int = 4, top_k: int = 100000):
+        self.width = width
+        self.depth = depth
+        self.top_k = top_k
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        self.candidates = {}
+        self.n_tokens = 0
+    
+    def _cells(self, tokens: List[Tuple[str, ...]]) -> np.ndarray:
+        """
+        Cell of each token in each row, of shape (depth, len(tokens))
+        """
+        
+        # a 64-bit digest, split into the two hashes of double hashing: tokens colliding in one row 
+        # are unlikely to collide in the others
+        hashes = np.fromiter((int.from_bytes(hashlib.blake2b("\t".join(token).encode("utf-8"), digest_size=8).digest(), "little") 
+                              for token in tokens), 
+                             dtype=np.uint64, count=len(tokens))
+        
+        h1 = hashes >> np.uint64(32)
+        h2 = (hashes & np.uint64(0xFFFFFFFF)) | np.uint64(1)
+        rows = np.arange(self.depth, dtype=np.uint64)[:, np.newaxis]
+        
+        return ((h1 + rows * h2) % np.uint64(self.width)).astype(np.int64)
+    
+    def _estimate_cells(self, cells: np.ndarray) -> np.ndarray:
+        return self.table[np.arange(self.depth)[:, np.newaxis], cells].min(axis=0)
+    
+    def update(self, frequencies: Dict[Tuple[str, ...], int]) -> None:
+        """
+        Adds counts to the sketch.
+
+        Args:
+            frequencies (Dict[Tuple[str, ...], int]): frequency of each token, e.g. a Counter over a batch of sentences
+        """
+        
+        if not frequencies:
+            return
+        
+        tokens = list(frequencies)
+        counts = np.fromiter(frequencies.values(), dtype=np.int64, count=len(tokens))
+        cells = self._cells(tokens)
+        
+        for row in range(self.depth):
+            np.add.at(self.table[row], cells[row], counts)
+        self.n_tokens += int(counts.sum())
+        
+        self.candidates.update(zip(tokens, self._estimate_cells(cells).tolist()))
+        if len(self.candidates) > 2 * self.top_k:
+            self._prune()
+    
+    def _prune(self) -> None:
+        """
+        Re-estimates candidates and keeps the top_k
+        """
+        
+        tokens = list(self.candidates)
+        estimates = self.estimate(tokens)
+        
+        if len(tokens) > self.top_k:
+            kept = np.argpartition(-estimates, self.top_k - 1)[:self.top_k]
+        else:
+            kept = np.arange(len(tokens))
+        
+        self.candidates = {tokens[i]: int(estimates[i]) for i in kept.tolist()}
+    
+    def estimate(self, tokens: Iterable[Tuple[str, ...]]) -> np.ndarray:
+        """
+        Estimated frequencies of tokens
+
+        Args:
+            tokens (Iterable[Tuple[str, ...]]): tokens
+
+        Returns:
+            np.ndarray: estimated frequency of each token
+        """
+        
+        tokens = list(tokens)
+        if not tokens:
+            return np.zeros(0, dtype=np.int64)
+        
+        return self._estimate_cells(self._cells(tokens))
+    
+    def error_bound(self) -> int:
+        """
+        Overestimate that is exceeded with probability at most exp(-depth), i.e. e / width * n_tokens
+
+        Returns:
+            int: error bound
+        """
+        
+        return math.ceil(math.e / self.width * self.n_tokens)
+    
+    def merge(self, other: "CountMinSketch") -> None:
+        """
+        Adds the counts of another sketch with the same width and depth
+
+        Args:
+            other (CountMinSketch): sketch to merge
+        """
+        
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("Only sketches with the same width and depth can be merged")
+        
+        self.table += other.table
+        self.n_tokens += other.n_tokens
+        self.candidates.update(other.candidates)
+        self._prune()
+    
+    def frequencies(self) -> List[Tuple[Tuple[str,...], int]]:
+        """
+        Estimated frequencies of the top_k tokens, in the format of "compute_frequencies"
+
+        Returns:
+            List[Tuple[Tuple[str,...], int]]: List of sorted frequencies
+        """
+        
+        self._prune()
+        return sorted(self.candidates.items(), key=lambda x: (-x[1], x[0]))
+
+
+def _sketch_frequencies(sentences: Iterable[List[Tuple[str, ...]]], 
+                        sketch: CountMinSketch, 
+                        batch_size: int = 1000000
+                        ) -> CountMinSketch:
+    """
+    Feeds sentences to a sketch, in batches of about batch_size tokens counted exactly before being added.
+
+    Returns:
+        CountMinSketch: the sketch itself
+    """
+    
+    batch = collections.Counter()
+    batch_tokens = 0
+    
+    for sentence in sentences:
+        batch.update(sentence)
+        batch_tokens += len(sentence)
+        
+        if batch_tokens >= batch_size:
+            sketch.update(batch)
+            batch = collections.Counter()
+            batch_tokens = 0
+    
+    sketch.update(batch)
+    
+    return sketch
+
+
+def _sketch_frequencies_shard(task: Tuple[str, int, int, Tuple[str, ...], int, int, int]) -> CountMinSketch:
+    """
+    Counts token frequencies in a shard of the corpus with a sketch (worker for "compute_frequencies")
+
+    Args:
+        task (Tuple[str, int, int, Tuple[str, ...], int, int, int]): filename, start and end offsets of the shard, 
+            token_shape, and width, depth and top_k of the sketch
+
+    Returns:
+        CountMinSketch: sketch of the shard
+    """
+    
+    filename, start, end, token_shape, width, depth, top_k = task
+    
+    return _sketch_frequencies(_read_sentences(filename, token_shape, start, end), CountMinSketch(width, depth, top_k))
+
+
+def _count_frequencies_shard(task: Tuple[str, int, int, Tuple[str, ...]]) -> collections.Counter:
+    """
+    Counts token frequencies in a shard of the corpus (worker for "compute_frequencies")
+
+    Args:
+        task (Tuple[str, int, int, Tuple[str, ...]]): filename, start and end offsets of the shard, token_shape
+
+    Returns:
+        collections.Counter: frequencies of tokens in the shard
+    """
+    
+    filename, start, end, token_shape = task
+    
+    ret = collections.Counter()
+    for sentence in _read_sentences(filename, token_shape, start, end):
+        ret.update(sentence)
+    
+    return ret
+
+
+@profiled("compute_frequencies")
+def compute_frequencies (filename: str, 
+                         token_shape: Tuple[str, ...] = ("form", "lemma", "pos"),
+                         workers: int = 1, 
+                         sketch: CountMinSketch = None, 
+                         as_vocabulary: bool = False
+                         ) -> Union[List[Tuple[Tuple[str,...], int]], Vocabulary]:
+    """
+    Given a corpus, the function computes the list of frequencies of its token, sorted in decreasing order
+
+    Args:
+        filename (str): path to file containing parsed corpus in CoNLL format, or to a corpus created by "compile_corpus"
+        token_shape (Tuple[str, ...], optional): tuple containing the info that we want to retain for each token.
+                                                Possible values for 'token_shape' are:
+                                                "s_id", "form", "lemma", "pos", "pos_fgrained",
+                                                "morph", "synhead", "synrel",
+                                                "_", "_", "mwe", "mwe2" 
+                                                Defaults to ("form", "lemma", "pos").
+        workers (int, optional): number of processes. If greater than 1, the file is split into 
+                                sentence-aligned shards that are counted in parallel. Defaults to 1.
+        sketch (CountMinSketch, optional): if given, frequencies are estimated in fixed memory by the sketch,
+                                and only its top_k tokens are returned, with their estimated frequency 
+                                (see "CountMinSketch"), which is updated in place. Defaults to None (exact counts).
+        as_vocabulary (bool, optional): whether to return a Vocabulary, with ids in order of decreasing frequency, 
+                                instead of a list. Defaults to False.
+
+    Returns:
+        Union[List[Tuple[Tuple[str,...], int]], Vocabulary]: List of sorted frequencies
+    """
+
+    if sketch is not None:
+        if workers > 1 and not _is_compiled_corpus(filename):
+            shard_sketches = _run_sharded(_sketch_frequencies_shard, filename, workers, 
+                                          token_shape, sketch.width, sketch.depth, sketch.top_k)
+            for shard_sketch in shard_sketches:
+                sketch.merge(shard_sketch)
+        else:
+            _sketch_frequencies(corpus_to_sentences(filename, token_shape), sketch)
+        
+        sorted_freqs = sketch.frequencies()
+        return Vocabulary.from_frequencies(sorted_freqs) if as_vocabulary else sorted_freqs
+
+    freqDict = collections.defaultdict(int)
+
+    if _is_compiled_corpus(filename):
+        corpus = CompiledCorpus(filename)
+        corpus.check_token_shape(token_shape)
+        keys, counts = np.unique(corpus.token_keys(token_shape), return_counts=True)
+        freqDict.update(zip(corpus.decode(keys, token_shape), counts.tolist()))
+
+    elif workers > 1:
+        for shard_freqs in _run_sharded(_count_frequencies_shard, filename, workers, token_shape):
+            for token, freq in shard_freqs.items():
+                freqDict[token] += freq
+
+    else:
+        for sentence in corpus_to_sentences(filename, token_shape):
+
+            for token in sentence:
+                freqDict[token] += 1
+
+    sorted_freqs = sorted(freqDict.items(), key= lambda x: (-x[1], x[0]))
+    
+    if as_vocabulary:
+        return Vocabulary.from_frequencies(sorted_freqs)
+    
+    return list(sorted_freqs)
+
+
+def filter_by_POS(sorted_freqs: Union[List[Tuple[Tuple[str,...], Any]], Vocabulary, FrequencyTable], 
+                  poslist: Union[List[str], Set[str], Dict[str, Any]], 
+                  position: int = 1 
+                  ) -> Union[List[Tuple[Tuple[str,...], Any]], Vocabulary, FrequencyTable]:
+    """
+    Filters list of tokens only keeping those with accepted Parts of Speech
+
+    Args:
+        sorted_freqs (Union[List[Tuple[Tuple[str,...], Any]], Vocabulary, FrequencyTable]): List of tokens 
+            in some representation format, Vocabulary or FrequencyTable
+        poslist (Union[List[str], Set[str], Dict[str, Any]]): List of accepted Parts of Speech
+        position (int, optional): Offset of Part of Speech info in token representation. Defaults to 1.
+
+    Returns:
+        Union[List[Tuple[Tuple[str,...], Any]], Vocabulary, FrequencyTable]: Same list (or Vocabulary, or FrequencyTable) 
+            as sorted_freqs but filtered
+    """
+    
+    if isinstance(sorted_freqs, FrequencyTable):
+        return sorted_freqs.filter_by_pos(poslist, position)
+    
+    if isinstance(sorted_freqs, Vocabulary):
+        accepted = [sorted_freqs._lookups[position][pos] for pos in poslist if pos in sorted_freqs._lookups[position]]
+        return sorted_freqs.subset(np.isin(sorted_freqs.codes[:, position], accepted))
+    
+    ret = []
+    for token, freq in sorted_freqs:
+        if token[position] in poslist:
+            ret.append((token, freq))
+            
+    return ret
+
+
+def filter_by_threshold(sorted_freqs: Union[List[Tuple[Tuple[str,...], int]], Vocabulary, FrequencyTable], 
+                        min_freq: int = 0
+                        ) -> Union[List[Tuple[Tuple[str,...], int]], Vocabulary, FrequencyTable]:
+    """
+    Filters list of tokens by minimum frequency
+
+    Args:
+        sorted_freqs (Union[List[Tuple[Tuple[str,...], int]], Vocabulary, FrequencyTable]): List of tokens 
+            in some representation format with their frequency, Vocabulary or FrequencyTable
+        min_freq (int, optional): Frequency threshold used for filtering. Defaults to 0.
+
+    Returns:
+        Union[List[Tuple[Tuple[str,...], int]], Vocabulary, FrequencyTable]: Same list (or Vocabulary, or FrequencyTable) 
+            as sorted_freqs but filtered
+    """
+    
+    if isinstance(sorted_freqs, FrequencyTable):
+        return sorted_freqs.filter_by_threshold(min_freq)
+    
+    if isinstance(sorted_freqs, Vocabulary):
+        return sorted_freqs.subset(sorted_freqs.frequencies > min_freq)
+    
+    ret = []
+    for token, freq in sorted_freqs:
+        if freq > min_freq:
+            ret.append((token, freq))
+    
+    return ret
+
+
+def load_from_file(filename: str, 
+                   sep: str = "\t"
+                   ) -> Dict[Tuple[str, ...], float]:
+    """
+    Load tokens from file with their frequencies
+
+    Args:
+        filename (str): path to file containing list of tokens
+        sep (str, optional): separator used to parse file into tokens. Defaults to '\t'.
+
+    Returns:
+        Dict[Tuple[str, ...], float]: Dictionary with tokens as keys and frequencies as values
+    """
+
+    ret = {}
+
+    with open(filename, encoding="utf-8") as fin:
+        for line in fin:
+            line = line.strip().split(sep)
+
+            ret[tuple(line[:-1])] = float(line[-1])
+
+    return ret
+
+
+@profiled("build_sparse_matrix")
+def build_sparse_matrix(filename: str, 
+                        token_shape: Tuple[str, ...], 
+                        nrows: int, 
+                        ncols: int, 
+                        sep: str = "\t"
+                        ) -> sp.sparse.spmatrix:
+    """_summary_
+
+    Args:
+        filename (str): path to file containing matrix entries
+        token_shape (Tuple[str, ...]): tuple containing the info that we want to retain for each token.
+            Possible values for 'token_shape' are:
+            "s_id", "form", "lemma", "pos", "pos_fgrained",
+            "morph", "synhead", "synrel",
+            "_", "_", "mwe", "mwe2" 
+        nrows (int): number of rows
+        ncols (int): number of columns
+        sep (str, optional): separator used to parse file into tokens. Defaults to '\t'.
+
+    Returns:
+        sp.sparse.spmatrix: scipy sparse matrix in csr format
+    """
+
+    rows = []
+    columns = []
+    data = []
+
+    targets_dict = {}
+    contexts_dict = {}
+    
+    len_token_rep = len(token_shape)
+
+    with open(filename, encoding="utf-8") as fin:
+        for line in fin:
+            linesplit = line.strip().split(sep)
+            
+            weight = float(linesplit[-1])
+            
+            row = linesplit[:len_token_rep+1]
+            column = linesplit[len_token_rep+1:-1]
+            
+            row_id = int(row[0])
+            column_id = int(column[0])
+            
+            row_token = tuple(row[1:])
+            column_token = tuple(column[1:])          
+            
+            rows.append(row_id)
+            columns.append(column_id)
+            data.append(weight)
+
+            targets_dict[row_token] = row_id
+            contexts_dict[column_token] = column_id
+
+    ret = sp.sparse.csr_matrix(
+        (data, (rows, columns)), shape=(nrows, ncols), dtype=np.float32)
+    return ret, targets_dict, contexts_dict
+
+
+def save_sparse_matrix(dirpath: str, 
+                       matrix: sp.sparse.spmatrix, 
+                       targets_dict: Dict[Tuple[str, ...], int], 
+                       contexts_dict: Dict[Tuple[str, ...], int], 
+                       compress: bool = False
+                       ) -> None:
+    """Save a sparse matrix with its row and column vocabularies in binary format.
+    
+    The directory will contain the csr arrays (indptr.npy, indices.npy, data.npy and shape.npy), 
+    the vocabularies (targets.vocab and contexts.vocab, one token per line in id order) 
+    and the id of each line of the vocabularies (target_ids.npy and context_ids.npy), 
+    so that ids are preserved even when they are not contiguous (as in the output of "build_sparse_matrix").
+    With compress, arrays are stored in a single compressed matrix.npz and vocabularies are gzipped:
+    files are smaller, but cannot be memory-mapped.
+    
+    Text formats are still available for export, see "write_to_file".
+
+    Args:
+        dirpath (str): path to directory where files have to be created
+        matrix (sp.sparse.spmatrix): matrix, targets on rows and contexts on columns
+        targets_dict (Dict[Tuple[str, ...], int]): mapping from target to row id
+        contexts_dict (Dict[Tuple[str, ...], int]): mapping from context to column id
+        compress (bool, optional): whether to compress files. Defaults to False.
+    """
+    
+    matrix = sp.sparse.csr_matrix(matrix)
+    arrays = {"indptr": matrix.indptr, 
+              "indices": matrix.indices, 
+              "data": matrix.data, 
+              "shape": np.array(matrix.shape, dtype=np.int64)}
+    
+    os.makedirs(dirpath, exist_ok=True)
+    suffix = ".gz" if compress else ""
+    
+    arrays["target_ids"] = _write_vocabulary(os.path.join(dirpath, f"targets.vocab{suffix}"), targets_dict)
+    arrays["context_ids"] = _write_vocabulary(os.path.join(dirpath, f"contexts.vocab{suffix}"), contexts_dict)
+    
+    if compress:
+        np.savez_compressed(os.path.join(dirpath, "matrix.npz"), **arrays)
+    else:
+        for name, values in arrays.items():
+            np.save(os.path.join(dirpath, f"{name}.npy"), values)
+
+
+def load_sparse_matrix(dirpath: str, 
+                       mmap: bool = True
+                       ) -> Tuple[sp.sparse.csr_matrix, Dict[Tuple[str, ...], int], Dict[Tuple[str, ...], int]]:
+    """Load a sparse matrix saved by "save_sparse_matrix".
+
+    Args:
+        dirpath (str): path to directory containing the matrix
+        mmap (bool, optional): whether to memory-map uncompressed arrays (read-only) instead of reading them. Defaults to True.
+
+    Returns:
+        Tuple[sp.sparse.csr_matrix, Dict[Tuple[str, ...], int], Dict[Tuple[str, ...], int]]: matrix in csr format,
+            mapping from target to row id and mapping from context to column id
+    """
+    
+    if os.path.exists(os.path.join(dirpath, "matrix.npz")):
+        with np.load(os.path.join(dirpath, "matrix.npz")) as npz:
+            arrays = {name: npz[name] for name in npz.files}
+        suffix = ".gz"
+    else:
+        arrays = {name: np.load(os.path.join(dirpath, f"{name}.npy"), mmap_mode="r" if mmap else None) 
+                  for name in ("indptr", "indices", "data", "shape")}
+        for name in ("target_ids", "context_ids"):
+            if os.path.exists(os.path.join(dirpath, f"{name}.npy")):
+                arrays[name] = np.load(os.path.join(dirpath, f"{name}.npy"))
+        suffix = ""
+    
+    ret = sp.sparse.csr_matrix((arrays["data"], arrays["indices"], arrays["indptr"]), 
+                               shape=tuple(arrays["shape"]), copy=False)
+    # directories saved without ids have vocabularies in contiguous id order
+    targets_dict = _read_vocabulary(os.path.join(dirpath, f"targets.vocab{suffix}"), arrays.get("target_ids"))
+    contexts_dict = _read_vocabulary(os.path.join(dirpath, f"contexts.vocab{suffix}"), arrays.get("context_ids"))
+    
+    return ret, targets_dict, contexts_dict
+
+
+def write_to_file(filepath: str, 
+                  matrix: Iterable[Iterable[Union[int, float]]], 
+                  id_dict: Dict[Tuple[str, ...], int]
+                  ) -> None:
+    """
+    Serialize vectors to file
+
+    Args:
+        filepath (str): path to location where file has to be created
+        matrix (Iterable[Iterable[int  |  float]]): matrix (iterable of iterable)
+        id_dict (Dict[Tuple[str, ...], int]): mapping from row id to token
+    """
+    
+    sorted_dict = sorted(id_dict.items(), key=lambda x: x[1])
+    
+    with open(filepath, "w", encoding="utf-8") as fout:
+        for row_id, row in enumerate(matrix):
+            token_str = "\t".join(sorted_dict[row_id][0])
+            vector_str = "\t".join(str(x) for x in row)
+            print(f"{token_str}\t{vector_str}", file=fout)
+            
+
+@profiled("get_nearest_neighbors")
+def get_nearest_neighbors(matrix: Iterable[Iterable[Union[int, float]]], 
+                          id_dict: Dict[Tuple[str, ...], int], 
+                          topk: int = 10
+                          ) -> Dict[Tuple[str, ...], List[Tuple[Tuple[str, ...], float]]]:
+    """
+    Get nearest neighbors from matrix containing cosine similarities
+
+    Args:
+        matrix (Iterable[Iterable[Union[int, float]]]): dense matrix containing cosine similarities
+        id_dict (Dict[Tuple[str, ...], int]): mapping from row or column id to token
+        topk (int, optional): Number of neighbors to return. Defaults to 10.
+
+    Returns:
+        Dict[Tuple[str, ...], List[Tuple[Tuple[str, ...], float]]]: Dictionary containing, for each token, its top neighbors and their cosine similarity
+    """
+    
+    ret = {}
+    sorted_dict = _id_to_token(id_dict)
+    
+    for row_id, row in enumerate(matrix):
+
+        row_with_labels = zip (row, sorted_dict)
+        sorted_row = sorted(row_with_labels, reverse=True)
+        
+        ret[sorted_dict[row_id]] = sorted_row[:topk]
+        
+    return ret
+
+
+def _id_to_token(id_dict: Dict[Tuple[str, ...], int]) -> List[Tuple[str, ...]]:
+    """Inverts a mapping from token to id, into the list of tokens indexed by id.
+
+    Args:
+        id_dict (Dict[Tuple[str, ...], int]): mapping from token to id, ids are expected to be 0...len(id_dict)-1
+
+    Returns:
+        List[Tuple[str, ...]]: tokens in id order
+    """
+    
+    if isinstance(id_dict, Vocabulary):
+        return list(id_dict)
+    
+    ret = [None] * len(id_dict)
+    for token, token_id in id_dict.items():
+        ret[token_id] = token
+    
+    return ret
+
+
+def normalize_rows(matrix: Union[np.ndarray, sp.sparse.spmatrix]) -> Union[np.ndarray, sp.sparse.csr_matrix]:
+    """Scale each row of the matrix to unit L2 norm (rows of zeros are left untouched).
+
+    Args:
+        matrix (Union[np.ndarray, sp.sparse.spmatrix]): dense or sparse matrix
+
+    Returns:
+        Union[np.ndarray, sp.sparse.csr_matrix]: normalized float32 matrix, of the same kind as the input
+    """
+    
+    if sp.sparse.issparse(matrix):
+        matrix = sp.sparse.csr_matrix(matrix, dtype=np.float32)
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        return sp.sparse.diags(1 / norms).dot(matrix).astype(np.float32).tocsr()
+    
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    
+    return matrix / norms
+
+
+def _topk_rows(similarities: np.ndarray, topk: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Finds the top-k columns of each row, sorted by decreasing value.
+
+    Args:
+        similarities (np.ndarray): dense block of similarities
+        topk (int): number of columns to keep
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: column ids and values, both of shape (rows, topk)
+    """
+    
+    topk = min(topk, similarities.shape[1])
+    
+    ids = np.argpartition(-similarities, topk-1, axis=1)[:, :topk]
+    scores = np.take_along_axis(similarities, ids, axis=1)
+    
+    order = np.argsort(-scores, axis=1, kind="stable")
+    
+    return np.take_along_axis(ids, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+
+@profiled("get_nearest_neighbors_blocked")
+def get_nearest_neighbors_blocked(matrix: Union[np.ndarray, sp.sparse.spmatrix], 
+                                  id_dict: Dict[Tuple[str, ...], int], 
+                                  topk: int = 10, 
+                                  queries: Iterable[Tuple[str, ...]] = None, 
+                                  block_size: int = 256, 
+                                  return_arrays: bool = False
+                                  ) -> Union[Dict[Tuple[str, ...], List[Tuple[float, Tuple[str, ...]]]], Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Get nearest neighbors by cosine similarity, directly from the matrix of vectors.
+    
+    Rows are normalized once, then similarities are computed for blocks of block_size queries at a time 
+    and the top-k neighbors are selected with argpartition, so the full similarity matrix is never built.
+    As in "get_nearest_neighbors", each token is among its own neighbors.
+
+    Args:
+        matrix (Union[np.ndarray, sp.sparse.spmatrix]): dense or sparse matrix of vectors, one per row
+        id_dict (Dict[Tuple[str, ...], int]): mapping from token to row id
+        topk (int, optional): Number of neighbors to return. Defaults to 10.
+        queries (Iterable[Tuple[str, ...]], optional): tokens whose neighbors are needed. Defaults to None (all tokens).
+        block_size (int, optional): number of queries processed at once, 
+            memory usage is about block_size * len(id_dict) floats. Defaults to 256.
+        return_arrays (bool, optional): whether to return arrays of ids instead of a dictionary of tokens. Defaults to False.
+
+    Returns:
+        Union[Dict[Tuple[str, ...], List[Tuple[float, Tuple[str, ...]]]], Tuple[np.ndarray, np.ndarray, np.ndarray]]: 
+            Dictionary containing, for each token, its top neighbors and their cosine similarity, as in "get_nearest_neighbors",
+            or query ids with the (queries, topk) arrays of neighbor ids and similarities.
+    """
+    
+    space = VectorSpace(id_dict, matrix)
+    
+    if queries is None:
+        query_ids = np.arange(len(space))
+    else:
+        query_ids = space.ids(queries)
+    
+    neighbor_ids, neighbor_scores = space.most_similar_ids(query_ids, topk, block_size)
+    
+    if return_arrays:
+        return query_ids, neighbor_ids, neighbor_scores
+    
+    tokens = space.tokens
+    
+    ret = {}
+    for query_id, ids, scores in zip(query_ids.tolist(), neighbor_ids.tolist(), neighbor_scores.tolist()):
+        ret[tokens[query_id]] = [(score, tokens[neighbor_id]) for score, neighbor_id in zip(scores, ids)]
+    
+    return ret
+
+
+class VectorSpace:
+    """
+    Vectors of a space (as returned by "load_vectors", "load_vectors_binary" or "build_sparse_matrix") 
+    together with their id map, for repeated cosine computations.
+    
+    Row norms are computed once, when the space is built, and the inverse mapping from id to token is kept, 
+    so that single similarities only take a dot product between two rows. Batched operations use 
+    a unit-normalized float32 copy of the matrix, built the first time it is needed.
+
+    Example:
+        space = VectorSpace(*load_vectors("vectors.txt"))
+        space.similarity(("cane", "S"), ("gatto", "S"))
+        space.most_similar(("cane", "S"), 10)
+
+    Args:
+        id_dict (Dict[Tuple[str, ...], int]): mapping from token to row id
+        matrix (Union[np.ndarray, sp.sparse.spmatrix]): dense or sparse matrix of vectors, one per row
+    """
+    
+    def __init__(self, 
+                 id_dict: Dict[Tuple[str, ...], int], 
+                 matrix: Union[np.ndarray, sp.sparse.spmatrix]):
+        
+        if sp.sparse.issparse(matrix):
+            matrix = matrix.tocsr()
+            norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1), dtype=np.float64).ravel())
+        else:
+            # in chunks of rows, to avoid a float64 copy of the whole matrix
+            norms = np.concatenate([np.linalg.norm(np.asarray(matrix[start:start+65536], dtype=np.float64), axis=1) 
+                                    for start in range(0, matrix.shape[0], 65536)] or [np.empty(0)])
+        
+        self.id_dict = id_dict
+        self.matrix = matrix
+        self.norms = norms
+        self.tokens = _id_to_token(id_dict)
+        self._normalized = None
+    
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+    
+    def __contains__(self, token: Tuple[str, ...]) -> bool:
+        return token in self.id_dict
+    
+    def __repr__(self) -> str:
+        return f"VectorSpace({self.matrix.shape[0]} tokens, {self.matrix.shape[1]} dimensions)"
+    
+    @property
+    def normalized(self) -> Union[np.ndarray, sp.sparse.csr_matrix]:
+        """
+        Unit-normalized float32 copy of the matrix (rows of zeros are left untouched), built on first access
+        """
+        
+        if self._normalized is None:
+            scale = np.ones(len(self.norms))
+            np.divide(1, self.norms, out=scale, where=self.norms > 0)
+            
+            if sp.sparse.issparse(self.matrix):
+                self._normalized = sp.sparse.diags(scale).dot(self.matrix).astype(np.float32).tocsr()
+            else:
+                self._normalized = (np.asarray(self.matrix, dtype=np.float32) * scale[:, np.newaxis].astype(np.float32))
+        
+        return self._normalized
+    
+    def ids(self, tokens: Iterable[Tuple[str, ...]]) -> np.ndarray:
+        """
+        Row ids of tokens
+
+        Args:
+            tokens (Iterable[Tuple[str, ...]]): tokens
+
+        Raises:
+            KeyError: if a token is not in the space
+
+        Returns:
+            np.ndarray: row id of each token
+        """
+        
+        tokens = list(tokens)
+        ret = _lookup_ids(self.id_dict, tokens)
+        
+        missing = np.flatnonzero(ret < 0)
+        if len(missing):
+            raise KeyError(tokens[missing[0]])
+        
+        return ret
+    
+    def _dot_rows(self, left_ids: np.ndarray, right_ids: np.ndarray) -> np.ndarray:
+        """
+        Dot products between pairs of rows of the original matrix
+        """
+        
+        left = self.matrix[left_ids]
+        right = self.matrix[right_ids]
+        
+        if sp.sparse.issparse(left):
+            return np.asarray(left.multiply(right).sum(axis=1), dtype=np.float64).ravel()
+        
+        return np.einsum("ij,ij->i", np.asarray(left, dtype=np.float64), np.asarray(right, dtype=np.float64))
+    
+    def similarity(self, token_a: Tuple[str, ...], token_b: Tuple[str, ...]) -> float:
+        """
+        Cosine similarity of two tokens (0 if either vector is all zeros)
+
+        Args:
+            token_a (Tuple[str, ...]): first token
+            token_b (Tuple[str, ...]): second token
+
+        Returns:
+            float: cosine similarity
+        """
+        
+        return float(self.similarity_batch([(token_a, token_b)])[0])
+    
+    def similarity_batch(self, pairs: Iterable[Tuple[Tuple[str, ...], Tuple[str, ...]]]) -> np.ndarray:
+        """
+        Cosine similarity of several pairs of tokens, with one row-wise product over the original matrix 
+        and the cached norms (0 for pairs with a vector of zeros)
+
+        Args:
+            pairs (Iterable[Tuple[Tuple[str, ...], Tuple[str, ...]]]): pairs of tokens
+
+        Returns:
+            np.ndarray: similarity of each pair
+        """
+        
+        pairs = list(pairs)
+        left_ids = self.ids(pair[0] for pair in pairs)
+        right_ids = self.ids(pair[1] for pair in pairs)
+        
+        norms = self.norms[left_ids] * self.norms[right_ids]
+        ret = np.zeros(len(pairs))
+        np.divide(self._dot_rows(left_ids, right_ids), norms, out=ret, where=norms > 0)
+        
+        return ret
+    
+    def most_similar_ids(self, 
+                         query_ids: np.ndarray, 
+                         topk: int = 10, 
+                         block_size: int = 256
+                         ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Nearest neighbors of rows by cosine similarity, in blocks of block_size queries (see "get_nearest_neighbors_blocked")
+
+        Args:
+            query_ids (np.ndarray): row ids of the queries
+            topk (int, optional): Number of neighbors to return. Defaults to 10.
+            block_size (int, optional): number of queries processed at once. Defaults to 256.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (queries, topk) arrays of neighbor ids and similarities
+        """
+        
+        normalized = self.normalized
+        
+        neighbor_ids = []
+        neighbor_scores = []
+        
+        for block_start in range(0, len(query_ids), block_size):
+            similarities = normalized[query_ids[block_start:block_start+block_size]] @ normalized.T
+            if sp.sparse.issparse(similarities):
+                similarities = similarities.toarray()
+            
+            ids, scores = _topk_rows(similarities, topk)
+            neighbor_ids.append(ids)
+            neighbor_scores.append(scores)
+        
+        k = min(topk, normalized.shape[0])
+        if not neighbor_ids:
+            return np.empty((0, k), dtype=np.int64), np.empty((0, k), dtype=np.float32)
+        
+        return np.concatenate(neighbor_ids), np.concatenate(neighbor_scores)
+    
+    def most_similar(self, token: Tuple[str, ...], topk: int = 10) -> List[Tuple[float, Tuple[str, ...]]]:
+        """
+        Nearest neighbors of a token by cosine similarity (the token itself included, as in "get_nearest_neighbors")
+
+        Args:
+            token (Tuple[str, ...]): query token
+            topk (int, optional): Number of neighbors to return. Defaults to 10.
+
+        Returns:
+            List[Tuple[float, Tuple[str, ...]]]: neighbors and their cosine similarity, by decreasing similarity
+        """
+        
+        return self.most_similar_batch([token], topk)[0]
+    
+    def most_similar_batch(self, 
+                           tokens: Iterable[Tuple[str, ...]], 
+                           topk: int = 10, 
+                           block_size: int = 256
+                           ) -> List[List[Tuple[float, Tuple[str, ...]]]]:
+        """
+        Nearest neighbors of several tokens by cosine similarity
+
+        Args:
+            tokens (Iterable[Tuple[str, ...]]): query tokens
+            topk (int, optional): Number of neighbors to return. Defaults to 10.
+            block_size (int, optional): number of queries processed at once. Defaults to 256.
+
+        Returns:
+            List[List[Tuple[float, Tuple[str, ...]]]]: for each token, its neighbors and their cosine similarity
+        """
+        
+        neighbor_ids, neighbor_scores = self.most_similar_ids(self.ids(tokens), topk, block_size)
+        
+        return [[(score, self.tokens[neighbor_id]) for score, neighbor_id in zip(scores, ids)] 
+                for ids, scores in zip(neighbor_ids.tolist(), neighbor_scores.tolist())]
+
+
+@profiled("extract_cooccurrences")
 def extract_cooccurrences(filepath: str, 
                           token_shape: Tuple[str, ...], 
-                          targets: Union[Dict, Set, List], 
-                          contexts: Union[Dict, Set, List], 
-                          window_size: int = 5
-                          ) -> Dict[Tuple[str, ...], Dict[Tuple[str, ...], int]]:
-    """Extracts co-occurrences between given targets and contexts (given as parameters)
+                          targets: Union[Dict, Set, List], 
+                          contexts: Union[Dict, Set, List], 
+                          window_size: int = 5
+                          ) -> Dict[Tuple[str, ...], Dict[Tuple[str, ...], int]]:
+    """Extracts co-occurrences between given targets and contexts (given as parameters)
+
+    Args:
+        filepath (str): path to file containing data (i.e., corpora)
+        token_shape (Tuple[str, ...]): tuple containing the info that we want to retain for each token.
+            Possible values for 'token_shape' are:
+            "s_id", "form", "lemma", "pos", "pos_fgrained",
+            "morph", "synhead", "synrel",
+            "_", "_", "mwe", "mwe2"
+        targets (Union[Dict, Set, List]): data structure containing list of lexemes to be considered as targets
+        contexts (Union[Dict, Set, List]): data structure containing list of lexemes to be considered as contexts
+        window_size (int, optional): size of context to be considered. 
+            Note, the window is considered both to the left and to the right of the target.
+            Defaults to 5.
+
+    Returns:
+        Dict[Tuple[str, ...], Dict[Tuple[str, ...], int]]: Dictionary of co-occurrences
+    """
+
+    co_occ = collections.defaultdict(lambda: collections.defaultdict(int))
+    
+    # per-token membership tests are faster on a set than on a Vocabulary
+    if isinstance(targets, Vocabulary):
+        targets = set(targets)
+    if isinstance(contexts, Vocabulary):
+        contexts = set(contexts)
+    
+    for sentence in corpus_to_sentences(filepath, token_shape):
+
+        for token_id, token in enumerate(sentence):
+
+            if token in targets:
+
+                # build left and right window boundary
+                # _ _ _ [_ _ _ _ _ X _ _ _ _ _] _ _ _
+                left_boundary = max(0, token_id-window_size)
+                right_boundary = min(len(sentence)-1, token_id+window_size)
+                window = sentence[left_boundary:right_boundary+1]
+
+                target_pos = token_id - left_boundary
+
+                # check contexts in left window
+                for ctx in window[0:target_pos]:
+                    if ctx in contexts:
+                        co_occ[token][ctx]+=1
+
+                # check contexts in right window
+                for ctx in window[target_pos+1:]:
+                    if ctx in contexts:
+                        co_occ[token][ctx]+=1
+                
+    return co_occ
+
+
+def _build_id_dict(tokens: Union[Dict, Set, List]) -> Dict[Tuple[str, ...], int]:
+    """Assigns a dense integer id to each token.
+    
+    Ids follow the order of the given collection (first occurrence for repeated tokens), sets are sorted first
+    so that ids do not depend on hashing. A Vocabulary already maps tokens to dense ids, and is returned as is; the tokens of a FrequencyTable 
+    get ids in table order.
+
+    Args:
+        tokens (Union[Dict, Set, List]): data structure containing list of lexemes
+
+    Returns:
+        Dict[Tuple[str, ...], int]: mapping from token to id
+    """
+    
+    if isinstance(tokens, Vocabulary):
+        return tokens
+    
+    if isinstance(tokens, FrequencyTable):
+        return tokens.as_vocabulary()
+    
+    if isinstance(tokens, (set, frozenset)):
+        tokens = sorted(tokens)
+    
+    return {token: token_id for token_id, token in enumerate(dict.fromkeys(tokens))}
+
+
+def _intern_sentences(sentences: Iterable[Iterable[Tuple[str, ...]]], 
+                      targets_dict: Dict[Tuple[str, ...], int], 
+                      contexts_dict: Dict[Tuple[str, ...], int]
+                      ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Turns a batch of sentences into flat arrays of target ids, context ids and sentence ids.
+    
+    Tokens that are not targets (resp. contexts) get id -1.
+
+    Args:
+        sentences (Iterable[Iterable[Tuple[str, ...]]]): batch of sentences
+        targets_dict (Dict[Tuple[str, ...], int]): mapping from target to row id
+        contexts_dict (Dict[Tuple[str, ...], int]): mapping from context to column id
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: target ids, context ids and sentence ids, one entry per token
+    """
+    
+    tokens = []
+    lengths = []
+    
+    for sentence in sentences:
+        tokens.extend(sentence)
+        lengths.append(len(sentence))
+        
+    sentence_ids = np.repeat(np.arange(len(lengths), dtype=np.int64), lengths)
+    
+    return _lookup_ids(targets_dict, tokens), _lookup_ids(contexts_dict, tokens), sentence_ids
+
+
+def _lookup_ids(id_dict: Dict[Tuple[str, ...], int], tokens: List[Tuple[str, ...]]) -> np.ndarray:
+    """Maps tokens to ids, -1 for tokens missing from id_dict (in a single NumPy pass for a Vocabulary).
+
+    Args:
+        id_dict (Dict[Tuple[str, ...], int]): mapping from token to id
+        tokens (List[Tuple[str, ...]]): tokens
+
+    Returns:
+        np.ndarray: id of each token
+    """
+    
+    if isinstance(id_dict, Vocabulary):
+        return id_dict.encode(tokens)
+    
+    get = id_dict.get
+    return np.array([get(token, -1) for token in tokens], dtype=np.int64)
+
+
+def _iter_window_pairs(target_ids: np.ndarray, 
+                       context_ids: np.ndarray, 
+                       sentence_ids: np.ndarray, 
+                       window_size: int, 
+                       window_sizes: np.ndarray = None
+                       ) -> Generator[Tuple[int, np.ndarray, np.ndarray], None, None]:
+    """Yields, for each distance in the window, the (target, context) pairs found at that distance.
+    
+    A pair at distance d is made of the tokens in positions i and i+d (in both directions),
+    as long as they belong to the same sentence (and d is within the window of the target, with window_sizes). 
+
+    Args:
+        target_ids (np.ndarray): target id of each token, -1 for non-targets
+        context_ids (np.ndarray): context id of each token, -1 for non-contexts
+        sentence_ids (np.ndarray): sentence id of each token
+        window_size (int): size of context to be considered, both to the left and to the right of the target.
+        window_sizes (np.ndarray, optional): window size of each token when it is a target, 
+            at most window_size. Defaults to None (window_size for every token).
+
+    Yields:
+        Generator[Tuple[int, np.ndarray, np.ndarray], None, None]: distance, row ids and column ids
+    """
+    
+    n_tokens = len(target_ids)
+    
+    for distance in range(1, min(window_size, n_tokens - 1) + 1):
+        same_sentence = sentence_ids[:-distance] == sentence_ids[distance:]
+        
+        # target on the left, context on the right
+        left_t = target_ids[:-distance]
+        right_c = context_ids[distance:]
+        mask_right = same_sentence & (left_t >= 0) & (right_c >= 0)
+        
+        # target on the right, context on the left
+        right_t = target_ids[distance:]
+        left_c = context_ids[:-distance]
+        mask_left = same_sentence & (right_t >= 0) & (left_c >= 0)
+        
+        if window_sizes is not None:
+            mask_right &= window_sizes[:-distance] >= distance
+            mask_left &= window_sizes[distance:] >= distance
+        
+        rows = np.concatenate((left_t[mask_right], right_t[mask_left]))
+        columns = np.concatenate((right_c[mask_right], left_c[mask_left]))
+        
+        yield distance, rows, columns
+        
+
+def _pairs_to_csr(rows: np.ndarray, 
+                  columns: np.ndarray, 
+                  shape: Tuple[int, int], 
+                  data: np.ndarray = None, 
+                  dtype: Any = np.int64
+                  ) -> sp.sparse.csr_matrix:
+    """Builds a csr matrix out of (row, column) pairs, summing duplicates.
+
+    Args:
+        rows (np.ndarray): row ids
+        columns (np.ndarray): column ids
+        shape (Tuple[int, int]): shape of the matrix
+        data (np.ndarray, optional): weight of each pair. Defaults to 1 for each pair.
+        dtype (Any, optional): dtype of the matrix. Defaults to np.int64.
+
+    Returns:
+        sp.sparse.csr_matrix: matrix of summed weights
+    """
+    
+    if data is None:
+        data = np.ones(len(rows), dtype=dtype)
+        
+    return sp.sparse.coo_matrix((data, (rows, columns)), shape=shape, dtype=dtype).tocsr()
+
+
+def _window_matrix(target_ids: np.ndarray, 
+                   context_ids: np.ndarray, 
+                   sentence_ids: np.ndarray, 
+                   window_size: int, 
+                   shape: Tuple[int, int], 
+                   by_distance: bool = False, 
+                   dynamic_window: str = None, 
+                   rng: np.random.Generator = None
+                   ) -> Union[sp.sparse.csr_matrix, List[sp.sparse.csr_matrix]]:
+    """Counts windowed co-occurrences in a batch of tokens given as flat arrays (see "_iter_window_pairs")
+
+    Args:
+        target_ids (np.ndarray): target id of each token, -1 for non-targets
+        context_ids (np.ndarray): context id of each token, -1 for non-contexts
+        sentence_ids (np.ndarray): sentence id of each token
+        window_size (int): size of context to be considered, both to the left and to the right of the target.
+        shape (Tuple[int, int]): shape of the matrix
+        by_distance (bool, optional): whether to count pairs at each distance in a separate matrix. Defaults to False.
+        dynamic_window (str, optional): None, "harmonic" (a pair at distance d weighs 1/d) 
+            or "shrink" (the window of each target is drawn uniformly between 1 and window_size). Defaults to None.
+        rng (np.random.Generator, optional): random generator for "shrink". Defaults to None.
+
+    Returns:
+        Union[sp.sparse.csr_matrix, List[sp.sparse.csr_matrix]]: matrix of co-occurrence counts 
+            (float64 weights with "harmonic"), or list of window_size matrices (pairs at distance 1, 2, ...) if by_distance
+    """
+    
+    dtype = np.float64 if dynamic_window == "harmonic" else np.int64
+    
+    window_sizes = None
+    if dynamic_window == "shrink":
+        window_sizes = rng.integers(1, window_size + 1, size=len(target_ids))
+    
+    def weights(distance, r):
+        if dynamic_window == "harmonic":
+            return np.full(len(r), 1 / distance)
+        return None
+    
+    if by_distance:
+        ret = [sp.sparse.csr_matrix(shape, dtype=dtype) for _ in range(window_size)]
+        for distance, r, c in _iter_window_pairs(target_ids, context_ids, sentence_ids, window_size, window_sizes):
+            ret[distance-1] = _pairs_to_csr(r, c, shape, weights(distance, r), dtype)
+        return ret
+    
+    rows, columns, data = [], [], []
+    for distance, r, c in _iter_window_pairs(target_ids, context_ids, sentence_ids, window_size, window_sizes):
+        rows.append(r)
+        columns.append(c)
+        data.append(weights(distance, r))
+    
+    if not rows:
+        return sp.sparse.csr_matrix(shape, dtype=dtype)
+    
+    data = np.concatenate(data) if dynamic_window == "harmonic" else None
+    
+    return _pairs_to_csr(np.concatenate(rows), np.concatenate(columns), shape, data, dtype)
+
+
+def _iter_id_batches(filepath: str, 
+                     token_shape: Tuple[str, ...], 
+                     targets_dict: Dict[Tuple[str, ...], int], 
+                     contexts_dict: Dict[Tuple[str, ...], int], 
+                     batch_size: int, 
+                     start: int = 0, 
+                     end: int = None
+                     ) -> Generator[Tuple[np.ndarray, np.ndarray, np.ndarray], None, None]:
+    """Reads a corpus in batches of about batch_size tokens (whole sentences), 
+    as flat arrays of target ids, context ids and sentence ids (see "_intern_sentences").
+
+    Args:
+        filepath (str): path to file containing data (i.e., corpora), or to a corpus created by "compile_corpus"
+        token_shape (Tuple[str, ...]): tuple containing the info that we want to retain for each token.
+        targets_dict (Dict[Tuple[str, ...], int]): mapping from target to row id
+        contexts_dict (Dict[Tuple[str, ...], int]): mapping from context to column id
+        batch_size (int): number of tokens processed at once
+        start (int, optional): byte offset where reading starts (CoNLL files only). Defaults to 0.
+        end (int, optional): byte offset where reading stops (CoNLL files only). Defaults to None (end of file).
+
+    Yields:
+        Generator[Tuple[np.ndarray, np.ndarray, np.ndarray], None, None]: target ids, context ids and sentence ids
+    """
+    
+    if _is_compiled_corpus(filepath):
+        batches = _iter_compiled_id_batches(CompiledCorpus(filepath), token_shape, targets_dict, contexts_dict, batch_size)
+    else:
+        batches = _iter_text_id_batches(filepath, token_shape, targets_dict, contexts_dict, batch_size, start, end)
+    
+    for target_ids, context_ids, sentence_ids in batches:
+        if PROFILER.enabled:
+            PROFILER.count(int(sentence_ids[-1]) + 1 if len(sentence_ids) else 0, len(sentence_ids))
+        yield target_ids, context_ids, sentence_ids
+
+
+def _iter_text_id_batches(filepath: str, 
+                          token_shape: Tuple[str, ...], 
+                          targets_dict: Dict[Tuple[str, ...], int], 
+                          contexts_dict: Dict[Tuple[str, ...], int], 
+                          batch_size: int, 
+                          start: int = 0, 
+                          end: int = None
+                          ) -> Generator[Tuple[np.ndarray, np.ndarray, np.ndarray], None, None]:
+    """Same as "_iter_id_batches", for a CoNLL file.
+    """
+    
+    batch = []
+    batch_tokens = 0
+    
+    for sentence in _read_sentences(filepath, token_shape, start, end):
+        batch.append(sentence)
+        batch_tokens += len(sentence)
+        
+        if batch_tokens >= batch_size:
+            yield _intern_sentences(batch, targets_dict, contexts_dict)
+            batch = []
+            batch_tokens = 0
+    
+    if batch:
+        yield _intern_sentences(batch, targets_dict, contexts_dict)
+
+
+def _iter_compiled_id_batches(corpus: CompiledCorpus, 
+                              token_shape: Tuple[str, ...], 
+                              targets_dict: Dict[Tuple[str, ...], int], 
+                              contexts_dict: Dict[Tuple[str, ...], int], 
+                              batch_size: int
+                              ) -> Generator[Tuple[np.ndarray, np.ndarray, np.ndarray], None, None]:
+    """Same as "_iter_id_batches", for a compiled corpus: ids are found with binary search on token keys, without parsing.
+
+    Args:
+        corpus (CompiledCorpus): corpus created by "compile_corpus"
+        token_shape (Tuple[str, ...]): tuple containing the columns that identify a token
+        targets_dict (Dict[Tuple[str, ...], int]): mapping from target to row id
+        contexts_dict (Dict[Tuple[str, ...], int]): mapping from context to column id
+        batch_size (int): number of tokens processed at once
+
+    Yields:
+        Generator[Tuple[np.ndarray, np.ndarray, np.ndarray], None, None]: target ids, context ids and sentence ids
+    """
+    
+    corpus.check_token_shape(token_shape)
+    
+    def lookup_table(id_dict):
+        keys = corpus.encode(id_dict.keys(), token_shape)
+        ids = np.fromiter(id_dict.values(), dtype=np.int64, count=len(id_dict))
+        order = np.argsort(keys)
+        return keys[order], ids[order]
+    
+    def to_ids(token_keys, table):
+        sorted_keys, sorted_ids = table
+        if not len(sorted_keys):
+            return np.full(len(token_keys), -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(sorted_keys, token_keys), len(sorted_keys)-1)
+        return np.where(sorted_keys[positions] == token_keys, sorted_ids[positions], -1)
+    
+    targets_table = lookup_table(targets_dict)
+    contexts_table = lookup_table(contexts_dict)
+    
+    offsets = np.asarray(corpus.offsets)
+    
+    first_sentence = 0
+    while first_sentence < corpus.n_sentences:
+        last_sentence = np.searchsorted(offsets, offsets[first_sentence] + batch_size, side="right") - 1
+        last_sentence = min(max(last_sentence, first_sentence + 1), corpus.n_sentences)
+        
+        start, end = offsets[first_sentence], offsets[last_sentence]
+        token_keys = corpus.token_keys(token_shape, start, end)
+        sentence_ids = np.repeat(np.arange(last_sentence - first_sentence), 
+                                 np.diff(offsets[first_sentence:last_sentence+1]))
+        
+        yield to_ids(token_keys, targets_table), to_ids(token_keys, contexts_table), sentence_ids
+        first_sentence = last_sentence
+
+
+_EMPTY_BATCH = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+
+
+def _subsampling_probabilities(targets_dict: Dict[Tuple[str, ...], int], 
+                               contexts_dict: Dict[Tuple[str, ...], int], 
+                               frequencies: Union[Dict[Tuple[str, ...], int], List[Tuple[Tuple[str,...], int]]], 
+                               threshold: float
+                               ) -> Tuple[np.ndarray, np.ndarray]:
+    """Probability of keeping each target and each context with word2vec-style subsampling, 
+    min(1, sqrt(threshold / f)) with f the relative frequency of the token (tokens without frequency are kept).
+
+    Args:
+        targets_dict (Dict[Tuple[str, ...], int]): mapping from target to id
+        contexts_dict (Dict[Tuple[str, ...], int]): mapping from context to id
+        frequencies (Union[Dict[Tuple[str, ...], int], List[Tuple[Tuple[str,...], int]]]): frequencies of all the tokens 
+            of the corpus, as a dictionary, as the output of "compute_frequencies" or as a Vocabulary
+        threshold (float): frequency threshold above which tokens are subsampled
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: keep probability of each target id and of each context id
+    """
+    
+    if isinstance(frequencies, FrequencyTable):
+        frequencies = frequencies.as_vocabulary()
+    
+    if isinstance(frequencies, Vocabulary):
+        corpus_size = float(frequencies.frequencies.sum())
+    elif isinstance(frequencies, dict):
+        corpus_size = float(sum(frequencies.values()))
+    else:
+        frequencies = dict(frequencies)
+        corpus_size = float(sum(frequencies.values()))
+    
+    ret = []
+    for id_dict in (targets_dict, contexts_dict):
+        relative = _marginals_from_frequencies(id_dict, frequencies) / max(corpus_size, 1)
+        subsampled = relative > threshold
+        probabilities = np.ones(len(id_dict))
+        np.divide(threshold, relative, out=probabilities, where=subsampled)
+        np.sqrt(probabilities, out=probabilities, where=subsampled)
+        ret.append(probabilities)
+    
+    return ret[0], ret[1]
+
+
+def _subsample_batch(target_ids: np.ndarray, 
+                     context_ids: np.ndarray, 
+                     sentence_ids: np.ndarray, 
+                     keep_probabilities: Tuple[np.ndarray, np.ndarray], 
+                     rng: np.random.Generator
+                     ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Drops tokens of a batch according to their keep probability (see "_subsampling_probabilities").
+    
+    Dropped tokens are removed before windows are built, so the remaining ones get closer, as in word2vec.
+    Tokens that are neither targets nor contexts are never dropped.
+
+    Args:
+        target_ids (np.ndarray): target id of each token, -1 for non-targets
+        context_ids (np.ndarray): context id of each token, -1 for non-contexts
+        sentence_ids (np.ndarray): sentence id of each token
+        keep_probabilities (Tuple[np.ndarray, np.ndarray]): keep probability of each target id and of each context id
+        rng (np.random.Generator): random generator
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: target ids, context ids and sentence ids of the kept tokens
+    """
+    
+    target_probabilities, context_probabilities = keep_probabilities
+    
+    # a token that is both target and context has the same frequency, hence the same probability, in both roles
+    probabilities = np.ones(len(target_ids))
+    is_target = target_ids >= 0
+    probabilities[is_target] = target_probabilities[target_ids[is_target]]
+    is_context = ~is_target & (context_ids >= 0)
+    probabilities[is_context] = context_probabilities[context_ids[is_context]]
+    
+    keep = rng.random(len(target_ids)) < probabilities
+    
+    return target_ids[keep], context_ids[keep], sentence_ids[keep]
+
+
+def _count_window_cooccurrences(batches: Iterable[Tuple[np.ndarray, np.ndarray, np.ndarray]], 
+                                shape: Tuple[int, int], 
+                                window_size: int, 
+                                by_distance: bool = False, 
+                                keep_probabilities: Tuple[np.ndarray, np.ndarray] = None, 
+                                dynamic_window: str = None, 
+                                seed: Any = None
+                                ) -> Union[sp.sparse.csr_matrix, List[sp.sparse.csr_matrix]]:
+    """Counts windowed co-occurrences over batches of tokens (see "_iter_id_batches").
+
+    Args:
+        batches (Iterable[Tuple[np.ndarray, np.ndarray, np.ndarray]]): target ids, context ids and sentence ids of each batch
+        shape (Tuple[int, int]): shape of the matrix
+        window_size (int): size of context to be considered, both to the left and to the right of the target.
+        by_distance (bool, optional): whether to count pairs at each distance in a separate matrix. Defaults to False.
+        keep_probabilities (Tuple[np.ndarray, np.ndarray], optional): keep probability of each target id and 
+            of each context id, for subsampling. Defaults to None (no subsampling).
+        dynamic_window (str, optional): None, "harmonic" or "shrink" (see "_window_matrix"). Defaults to None.
+        seed (Any, optional): seed of the random generator used by subsampling and "shrink". Defaults to None.
+
+    Returns:
+        Union[sp.sparse.csr_matrix, List[sp.sparse.csr_matrix]]: matrix of co-occurrence counts, 
+            or list of window_size matrices (pairs at distance 1, 2, ...) if by_distance
+    """
+    
+    rng = np.random.default_rng(seed)
+    
+    ret = _window_matrix(*_EMPTY_BATCH, window_size, shape, by_distance, dynamic_window, rng)
+    
+    for target_ids, context_ids, sentence_ids in batches:
+        if keep_probabilities is not None:
+            target_ids, context_ids, sentence_ids = _subsample_batch(target_ids, context_ids, sentence_ids, 
+                                                                     keep_probabilities, rng)
+        counts = _window_matrix(target_ids, context_ids, sentence_ids, window_size, shape, by_distance, dynamic_window, rng)
+        ret = _add_counts(ret, counts)
+        
+    return ret
+
+
+def _add_counts(total: Union[sp.sparse.csr_matrix, List[sp.sparse.csr_matrix]], 
+                counts: Union[sp.sparse.csr_matrix, List[sp.sparse.csr_matrix]]
+                ) -> Union[sp.sparse.csr_matrix, List[sp.sparse.csr_matrix]]:
+    """Sums two matrices of counts, or two lists of matrices element by element"""
+    
+    if isinstance(total, list):
+        return [t + c for t, c in zip(total, counts)]
+    
+    return total + counts
+
+
+def _count_cooccurrences_shard(task: Tuple[str, int, int, Tuple[str, ...], Dict, Dict, int, int, bool, 
+                                           Tuple[np.ndarray, np.ndarray], str, int]
+                               ) -> Union[sp.sparse.csr_matrix, List[sp.sparse.csr_matrix]]:
+    """Counts windowed co-occurrences in a shard of the corpus (worker for "extract_cooccurrences_sparse")
+
+    Args:
+        task (Tuple[str, int, int, Tuple[str, ...], Dict, Dict, int, int, bool, Tuple[np.ndarray, np.ndarray], str, int]): 
+            filename, start and end offsets of the shard, token_shape, targets_dict, contexts_dict, window_size, 
+            batch_size, by_distance, keep_probabilities, dynamic_window and seed
+
+    Returns:
+        Union[sp.sparse.csr_matrix, List[sp.sparse.csr_matrix]]: matrix (or matrices) of co-occurrence counts in the shard
+    """
+    
+    (filename, start, end, token_shape, targets_dict, contexts_dict, window_size, batch_size, by_distance, 
+     keep_probabilities, dynamic_window, seed) = task
+    
+    batches = _iter_id_batches(filename, token_shape, targets_dict, contexts_dict, batch_size, start, end)
+    shape = (len(targets_dict), len(contexts_dict))
+    
+    # each shard draws from its own stream, determined by the seed and the shard offset
+    return _count_window_cooccurrences(batches, shape, window_size, by_distance, 
+                                       keep_probabilities, dynamic_window, [seed, start])
+
+
+def _extract_window_counts(filepath: str, 
+                           token_shape: Tuple[str, ...], 
+                           targets_dict: Dict[Tuple[str, ...], int], 
+                           contexts_dict: Dict[Tuple[str, ...], int], 
+                           window_size: int, 
+                           batch_size: int, 
+                           workers: int, 
+                           by_distance: bool, 
+                           frequencies: Union[Dict[Tuple[str, ...], int], List[Tuple[Tuple[str,...], int]]] = None, 
+                           threshold: float = 1e-5, 
+                           dynamic_window: str = None, 
+                           seed: int = 0
+                           ) -> Union[sp.sparse.csr_matrix, List[sp.sparse.csr_matrix]]:
+    """Counts windowed co-occurrences over a whole corpus, serially or in sentence-aligned shards, 
+    with optional subsampling (when frequencies are given) and dynamic windows.
+    """
+    
+    if dynamic_window not in (None, "harmonic", "shrink"):
+        raise ValueError(f"Unknown dynamic window {dynamic_window}, expected None, 'harmonic' or 'shrink'")
+    
+    keep_probabilities = None
+    if frequencies is not None:
+        keep_probabilities = _subsampling_probabilities(targets_dict, contexts_dict, frequencies, threshold)
+    
+    if workers > 1 and not _is_compiled_corpus(filepath):
+        shard_counts = _run_sharded(_count_cooccurrences_shard, filepath, workers, 
+                                    token_shape, targets_dict, contexts_dict, window_size, batch_size, by_distance, 
+                                    keep_probabilities, dynamic_window, seed)
+        ret = shard_counts[0]
+        for counts in shard_counts[1:]:
+            ret = _add_counts(ret, counts)
+        return ret
+    
+    batches = _iter_id_batches(filepath, token_shape, targets_dict, contexts_dict, batch_size)
+    shape = (len(targets_dict), len(contexts_dict))
+    
+    return _count_window_cooccurrences(batches, shape, window_size, by_distance, 
+                                       keep_probabilities, dynamic_window, [seed, 0])
+
+
+@profiled("extract_cooccurrences_sparse")
+def extract_cooccurrences_sparse(filepath: str, 
+                                 token_shape: Tuple[str, ...], 
+                                 targets: Union[Dict, Set, List], 
+                                 contexts: Union[Dict, Set, List], 
+                                 window_size: int = 5, 
+                                 batch_size: int = 1000000, 
+                                 workers: int = 1, 
+                                 frequencies: Union[Dict[Tuple[str, ...], int], List[Tuple[Tuple[str,...], int]]] = None, 
+                                 threshold: float = 1e-5, 
+                                 dynamic_window: str = None, 
+                                 seed: int = 0
+                                 ) -> Tuple[sp.sparse.csr_matrix, Dict[Tuple[str, ...], int], Dict[Tuple[str, ...], int]]:
+    """Extracts co-occurrences between given targets and contexts directly into a sparse matrix.
+    
+    Same window semantics as "extract_cooccurrences", but targets and contexts are mapped to integer ids
+    up front and pairs are counted with NumPy, one window offset at a time over batches of sentences.
+    
+    Optionally, as in word2vec, frequent tokens are subsampled (each occurrence of a target or context 
+    with relative frequency f is kept with probability sqrt(threshold / f), and dropped before windows are built)
+    and windows are dynamic: with "harmonic" a pair at distance d weighs 1/d, with "shrink" the window 
+    of each target occurrence is drawn uniformly between 1 and window_size. Random draws depend only on seed 
+    (and, with workers > 1, on the shard), so results are reproducible.
+
+    Example:
+        frequencies = compute_frequencies(corpus, token_shape)
+        extract_cooccurrences_sparse(corpus, token_shape, targets, contexts, 5, frequencies=frequencies, dynamic_window="shrink")
+
+    Args:
+        filepath (str): path to file containing data (i.e., corpora), or to a corpus created by "compile_corpus"
+        token_shape (Tuple[str, ...]): tuple containing the info that we want to retain for each token.
+            Possible values for 'token_shape' are:
+            "s_id", "form", "lemma", "pos", "pos_fgrained",
+            "morph", "synhead", "synrel",
+            "_", "_", "mwe", "mwe2"
+        targets (Union[Dict, Set, List]): data structure containing list of lexemes to be considered as targets
+        contexts (Union[Dict, Set, List]): data structure containing list of lexemes to be considered as contexts
+        window_size (int, optional): size of context to be considered. 
+            Note, the window is considered both to the left and to the right of the target.
+            Defaults to 5.
+        batch_size (int, optional): number of tokens processed at once, bounds memory usage. Defaults to 1000000.
+        workers (int, optional): number of processes. If greater than 1, the file is split into 
+            sentence-aligned shards whose matrices are summed. Not used for compiled corpora. Defaults to 1.
+        frequencies (Union[Dict[Tuple[str, ...], int], List[Tuple[Tuple[str,...], int]]], optional): frequencies of 
+            all the tokens of the corpus (output of "compute_frequencies", a dictionary or a Vocabulary), 
+            to subsample frequent tokens. Defaults to None (no subsampling).
+        threshold (float, optional): subsampling threshold on relative frequency. Defaults to 1e-5.
+        dynamic_window (str, optional): None, "harmonic" or "shrink". Defaults to None (all pairs in the window count 1).
+        seed (int, optional): seed for subsampling and "shrink". Defaults to 0.
+
+    Returns:
+        Tuple[sp.sparse.csr_matrix, Dict[Tuple[str, ...], int], Dict[Tuple[str, ...], int]]: matrix of co-occurrence counts
+            in csr format (float64 weights with "harmonic"), mapping from target to row id and mapping from context to column id
+    """
+    
+    targets_dict = _build_id_dict(targets)
+    contexts_dict = _build_id_dict(contexts)
+    
+    ret = _extract_window_counts(filepath, token_shape, targets_dict, contexts_dict, 
+                                 window_size, batch_size, workers, by_distance=False, 
+                                 frequencies=frequencies, threshold=threshold, dynamic_window=dynamic_window, seed=seed)
+    
+    return ret, targets_dict, contexts_dict
+
+
+@profiled("extract_cooccurrences_by_distance")
+def extract_cooccurrences_by_distance(filepath: str, 
+                                      token_shape: Tuple[str, ...], 
+                                      targets: Union[Dict, Set, List], 
+                                      contexts: Union[Dict, Set, List], 
+                                      max_window: int = 10, 
+                                      batch_size: int = 1000000, 
+                                      workers: int = 1, 
+                                      frequencies: Union[Dict[Tuple[str, ...], int], List[Tuple[Tuple[str,...], int]]] = None, 
+                                      threshold: float = 1e-5, 
+                                      seed: int = 0
+                                      ) -> Tuple[List[sp.sparse.csr_matrix], Dict[Tuple[str, ...], int], Dict[Tuple[str, ...], int]]:
+    """Extracts co-occurrences between given targets and contexts, bucketed by distance.
+    
+    The d-th matrix counts the pairs found at distance d+1 (on either side of the target), so that
+    co-occurrences for any window_size up to max_window can be derived from a single corpus pass 
+    by summing the first window_size matrices (see "window_from_buckets", which also applies dynamic windows).
+    Frequent tokens can be subsampled as in "extract_cooccurrences_sparse".
+
+    Args:
+        filepath (str): path to file containing data (i.e., corpora), or to a corpus created by "compile_corpus"
+        token_shape (Tuple[str, ...]): tuple containing the info that we want to retain for each token.
+            Possible values for 'token_shape' are:
+            "s_id", "form", "lemma", "pos", "pos_fgrained",
+            "morph", "synhead", "synrel",
+            "_", "_", "mwe", "mwe2"
+        targets (Union[Dict, Set, List]): data structure containing list of lexemes to be considered as targets
+        contexts (Union[Dict, Set, List]): data structure containing list of lexemes to be considered as contexts
+        max_window (int, optional): largest window size that will be derived. Defaults to 10.
+        batch_size (int, optional): number of tokens processed at once, bounds memory usage. Defaults to 1000000.
+        workers (int, optional): number of processes. If greater than 1, the file is split into 
+            sentence-aligned shards whose matrices are summed. Not used for compiled corpora. Defaults to 1.
+        frequencies (Union[Dict[Tuple[str, ...], int], List[Tuple[Tuple[str,...], int]]], optional): frequencies of 
+            all the tokens of the corpus, to subsample frequent tokens. Defaults to None (no subsampling).
+        threshold (float, optional): subsampling threshold on relative frequency. Defaults to 1e-5.
+        seed (int, optional): seed for subsampling. Defaults to 0.
+
+    Returns:
+        Tuple[List[sp.sparse.csr_matrix], Dict[Tuple[str, ...], int], Dict[Tuple[str, ...], int]]: max_window matrices of 
+            co-occurrence counts in csr format, mapping from target to row id and mapping from context to column id
+    """
+    
+    targets_dict = _build_id_dict(targets)
+    contexts_dict = _build_id_dict(contexts)
+    
+    ret = _extract_window_counts(filepath, token_shape, targets_dict, contexts_dict, 
+                                 max_window, batch_size, workers, by_distance=True, 
+                                 frequencies=frequencies, threshold=threshold, seed=seed)
+    
+    return ret, targets_dict, contexts_dict
+
+
+def _reduce_keys(keys: np.ndarray, counts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Sorts keys and sums the counts of equal keys.
+
+    Args:
+        keys (np.ndarray): keys, not necessarily sorted
+        counts (np.ndarray): count of each key
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: sorted unique keys and their summed counts
+    """
+    
+    if not len(keys):
+        return keys, counts
+    
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    
+    return keys[starts], np.add.reduceat(counts[order], starts)
+
+
+class _SpillBuffer:
+    """
+    Fixed-size buffer of (key, count) pairs, spilled to sorted run files when full.
+    
+    When the buffer fills, it is sorted and reduced: if the distinct keys still take more than half of it,
+    they are written to a run file, otherwise they stay in the buffer and counting goes on.
+
+    Args:
+        size (int): number of pairs held in memory
+        prefix (str): path prefix of run files
+    """
+    
+    def __init__(self, size: int, prefix: str):
+        self.size = size
+        self.prefix = prefix
+        self.keys = np.empty(size, dtype=np.int64)
+        self.counts = np.empty(size, dtype=np.int64)
+        self.n = 0
+        self.runs = []
+    
+    def add(self, keys: np.ndarray) -> None:
+        while len(keys):
+            taken = min(self.size - self.n, len(keys))
+            self.keys[self.n:self.n+taken] = keys[:taken]
+            self.counts[self.n:self.n+taken] = 1
+            self.n += taken
+            keys = keys[taken:]
+            
+            if self.n == self.size:
+                self._compact()
+    
+    def _compact(self) -> None:
+        keys, counts = _reduce_keys(self.keys[:self.n], self.counts[:self.n])
+        
+        if len(keys) > self.size // 2:
+            self._spill(keys, counts)
+            self.n = 0
+        else:
+            self.keys[:len(keys)] = keys
+            self.counts[:len(keys)] = counts
+            self.n = len(keys)
+    
+    def _spill(self, keys: np.ndarray, counts: np.ndarray) -> None:
+        path = f"{self.prefix}{len(self.runs)}"
+        np.save(f"{path}.keys.npy", keys)
+        np.save(f"{path}.counts.npy", counts)
+        self.runs.append(path)
+    
+    def close(self) -> List[str]:
+        """
+        Spills the remaining pairs
+
+        Returns:
+            List[str]: path prefixes of run files
+        """
+        
+        if self.n:
+            self._spill(*_reduce_keys(self.keys[:self.n], self.counts[:self.n]))
+            self.n = 0
+        
+        return self.runs
+
+
+def _merge_runs(runs: List[str], shape: Tuple[int, int], max_keys: int) -> sp.sparse.csr_matrix:
+    """Merges sorted run files of (row * ncols + column, count) pairs into a csr matrix.
+    
+    Runs are memory-mapped and merged one range of rows at a time, 
+    each range holding at most max_keys pairs over all runs (or a single row).
+
+    Args:
+        runs (List[str]): path prefixes of run files (see "_SpillBuffer")
+        shape (Tuple[int, int]): shape of the matrix
+        max_keys (int): number of pairs merged at once
+
+    Returns:
+        sp.sparse.csr_matrix: matrix of summed counts
+    """
+    
+    n_rows, n_columns = shape
+    run_keys = [np.load(f"{run}.keys.npy", mmap_mode="r") for run in runs]
+    run_counts = [np.load(f"{run}.counts.npy", mmap_mode="r") for run in runs]
+    
+    def run_offsets(row: int) -> List[int]:
+        # position of the first pair of row (or later) in each run
+        return [int(np.searchsorted(keys, row * n_columns)) for keys in run_keys]
+    
+    row_nnz = np.zeros(n_rows, dtype=np.int64)
+    indices = []
+    data = []
+    
+    # offsets are searched on demand, one range at a time, so that memory does not grow with the number of runs
+    first_row = 0
+    first_offsets = run_offsets(0)
+    while first_row < n_rows:
+        # last row of the range: the largest row such that the range holds at most max_keys pairs (at least one row)
+        low, high = first_row + 1, n_rows
+        while low < high:
+            middle = (low + high + 1) // 2
+            if sum(run_offsets(middle)) - sum(first_offsets) <= max_keys:
+                low = middle
+            else:
+                high = middle - 1
+        last_row = low
+        last_offsets = run_offsets(last_row)
+        
+        keys = np.concatenate([run_keys[i][first_offsets[i]:last_offsets[i]] 
+                               for i in range(len(runs))] + [np.empty(0, dtype=np.int64)])
+        counts = np.concatenate([run_counts[i][first_offsets[i]:last_offsets[i]] 
+                                 for i in range(len(runs))] + [np.empty(0, dtype=np.int64)])
+        keys, counts = _reduce_keys(keys, counts)
+        
+        rows, columns = np.divmod(keys, n_columns)
+        row_nnz[first_row:last_row] = np.bincount(rows - first_row, minlength=last_row - first_row)
+        indices.append(columns)
+        data.append(counts)
+        
+        first_row = last_row
+        first_offsets = last_offsets
+    
+    indptr = np.concatenate(([0], np.cumsum(row_nnz)))
+    indices = np.concatenate(indices) if indices else np.empty(0, dtype=np.int64)
+    data = np.concatenate(data) if data else np.empty(0, dtype=np.int64)
+    
+    return sp.sparse.csr_matrix((data, indices, indptr), shape=shape)
+
+
+def _spill_cooccurrences_shard(task: Tuple[str, int, int, Tuple[str, ...], Dict, Dict, int, int, int, str]
+                               ) -> List[str]:
+    """Counts windowed co-occurrences in a shard of the corpus into run files (worker for "extract_cooccurrences_external")
+
+    Args:
+        task (Tuple[str, int, int, Tuple[str, ...], Dict, Dict, int, int, int, str]): filename, start and end offsets 
+            of the shard, token_shape, targets_dict, contexts_dict, window_size, batch_size, buffer_size 
+            and directory of run files
+
+    Returns:
+        List[str]: path prefixes of run files
+    """
+    
+    filename, start, end, token_shape, targets_dict, contexts_dict, window_size, batch_size, buffer_size, run_dir = task
+    
+    n_columns = len(contexts_dict)
+    buffer = _SpillBuffer(buffer_size, os.path.join(run_dir, f"run_{start}_"))
+    
+    for target_ids, context_ids, sentence_ids in _iter_id_batches(filename, token_shape, targets_dict, contexts_dict, 
+                                                                  batch_size, start, end):
+        for _, rows, columns in _iter_window_pairs(target_ids, context_ids, sentence_ids, window_size):
+            buffer.add(rows * n_columns + columns)
+    
+    return buffer.close()
+
+
+@profiled("extract_cooccurrences_external")
+def extract_cooccurrences_external(filepath: str, 
+                                   token_shape: Tuple[str, ...], 
+                                   targets: Union[Dict, Set, List], 
+                                   contexts: Union[Dict, Set, List], 
+                                   window_size: int = 5, 
+                                   memory_budget: int = 1 << 30, 
+                                   tmp_dir: str = None, 
+                                   batch_size: int = 1000000, 
+                                   workers: int = 1
+                                   ) -> Tuple[sp.sparse.csr_matrix, Dict[Tuple[str, ...], int], Dict[Tuple[str, ...], int]]:
+    """Extracts co-occurrences between given targets and contexts within a memory budget, spilling partial counts to disk.
+    
+    Same results as "extract_cooccurrences_sparse", for corpora whose counts do not fit in memory while being collected.
+    Pairs are encoded as row * ncols + column and accumulated in a fixed-size buffer; a full buffer is sorted, reduced 
+    and written to a run file. Runs are then merged (memory-mapped, one range of rows at a time) into the final matrix,
+    so that memory used while counting does not depend on corpus size.
+
+    Args:
+        filepath (str): path to file containing data (i.e., corpora), or to a corpus created by "compile_corpus"
+        token_shape (Tuple[str, ...]): tuple containing the info that we want to retain for each token.
+            Possible values for 'token_shape' are:
+            "s_id", "form", "lemma", "pos", "pos_fgrained",
+            "morph", "synhead", "synrel",
+            "_", "_", "mwe", "mwe2"
+        targets (Union[Dict, Set, List]): data structure containing list of lexemes to be considered as targets
+        contexts (Union[Dict, Set, List]): data structure containing list of lexemes to be considered as contexts
+        window_size (int, optional): size of context to be considered. 
+            Note, the window is considered both to the left and to the right of the target.
+            Defaults to 5.
+        memory_budget (int, optional): approximate number of bytes used by the buffer (and its sorting) 
+            and by each merge step, per process. Defaults to 1GB.
+        tmp_dir (str, optional): directory where run files are created (and removed at the end). 
+            Defaults to None (system temporary directory).
+        batch_size (int, optional): number of tokens read at once. Defaults to 1000000.
+        workers (int, optional): number of processes. If greater than 1, the file is split into 
+            sentence-aligned shards, each spilling its own runs. Not used for compiled corpora. Defaults to 1.
+
+    Returns:
+        Tuple[sp.sparse.csr_matrix, Dict[Tuple[str, ...], int], Dict[Tuple[str, ...], int]]: matrix of co-occurrence counts
+            in csr format, mapping from target to row id and mapping from context to column id
+    """
+    
+    targets_dict = _build_id_dict(targets)
+    contexts_dict = _build_id_dict(contexts)
+    shape = (len(targets_dict), len(contexts_dict))
+    
+    # keys and counts, plus the copies made while sorting
+    buffer_size = max(memory_budget // 32, 1)
+    
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as run_dir:
+        args = (token_shape, targets_dict, contexts_dict, window_size, batch_size, buffer_size, run_dir)
+        
+        if workers > 1 and not _is_compiled_corpus(filepath):
+            runs = [run for shard_runs in _run_sharded(_spill_cooccurrences_shard, filepath, workers, *args) 
+                    for run in shard_runs]
+        else:
+            runs = _spill_cooccurrences_shard((filepath, 0, None) + args)
+        
+        ret = _merge_runs(runs, shape, buffer_size)
+    
+    return ret, targets_dict, contexts_dict
+
+
+def window_from_buckets(buckets: List[sp.sparse.csr_matrix], 
+                        window_size: int, 
+                        dynamic_window: str = None
+                        ) -> sp.sparse.csr_matrix:
+    """Derives co-occurrence counts for a given window size from counts bucketed by distance.
+    
+    With dynamic_window, buckets are weighted by distance: "harmonic" gives weight 1/d to distance d,
+    "shrink" gives (window_size - d + 1) / window_size, the expected weight of the random windows 
+    of "extract_cooccurrences_sparse".
+
+    Args:
+        buckets (List[sp.sparse.csr_matrix]): matrices returned by "extract_cooccurrences_by_distance"
+        window_size (int): size of context to be considered, both to the left and to the right of the target.
+        dynamic_window (str, optional): None, "harmonic" or "shrink". Defaults to None.
+
+    Returns:
+        sp.sparse.csr_matrix: matrix of co-occurrence counts, as returned by "extract_cooccurrences_sparse"
+            (float64 weights with dynamic_window)
+    """
+    
+    if window_size > len(buckets):
+        raise ValueError(f"Window size {window_size} is larger than the {len(buckets)} available distances")
+    
+    if dynamic_window is None:
+        ret = buckets[0].copy()
+        for bucket in buckets[1:window_size]:
+            ret += bucket
+        return ret
+    
+    distances = np.arange(1, window_size + 1)
+    if dynamic_window == "harmonic":
+        weights = 1 / distances
+    elif dynamic_window == "shrink":
+        weights = (window_size - distances + 1) / window_size
+    else:
+        raise ValueError(f"Unknown dynamic window {dynamic_window}, expected None, 'harmonic' or 'shrink'")
+    
+    ret = buckets[0].astype(np.float64) * weights[0]
+    for bucket, weight in zip(buckets[1:window_size], weights[1:]):
+        ret += bucket * weight
+    
+    return ret.tocsr()
+
+
+def _intern_dependency_sentences(sentences: Iterable[Iterable[Tuple[str, ...]]], 
+                                 targets_dict: Dict[Tuple[str, ...], int], 
+                                 contexts_dict: Dict[Tuple[str, ...], int], 
+                                 relations_dict: Dict[str, int], 
+                                 fixed_relations: bool
+                                 ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Turns a batch of parsed sentences into flat arrays of target ids, context ids, head positions and relation ids.
+    
+    Tokens are expected to end with their synhead and synrel fields. Heads are turned into positions in the batch 
+    (-1 for the root and for heads outside the sentence). Tokens that are not targets (resp. contexts) get id -1, as well as relations missing 
+    from relations_dict when fixed_relations is set; otherwise new relations are added to relations_dict.
+
+    Args:
+        sentences (Iterable[Iterable[Tuple[str, ...]]]): batch of sentences
+        targets_dict (Dict[Tuple[str, ...], int]): mapping from target to row id
+        contexts_dict (Dict[Tuple[str, ...], int]): mapping from context to id
+        relations_dict (Dict[str, int]): mapping from relation to id
+        fixed_relations (bool): whether relations_dict is closed
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: target ids, context ids, head positions and relation ids, 
+            one entry per token
+    """
+    
+    target_ids = []
+    context_ids = []
+    heads = []
+    relation_ids = []
+    
+    get_target = targets_dict.get
+    get_context = contexts_dict.get
+    offset = -1
+    
+    for sentence in sentences:
+        length = len(sentence)
+        
+        for token in sentence:
+            word, head, relation = token[:-2], token[-2], token[-1]
+            head = int(head) if head.isdigit() else 0
+            
+            target_ids.append(get_target(word, -1))
+            context_ids.append(get_context(word, -1))
+            heads.append(offset + head if 0 < head <= length else -1)
+            
+            relation_id = relations_dict.get(relation)
+            if relation_id is None:
+                relation_id = -1
+                if not fixed_relations:
+                    relation_id = relations_dict[relation] = len(relations_dict)
+            relation_ids.append(relation_id)
+        
+        offset += length
+    
+    return (np.array(target_ids, dtype=np.int64), 
+            np.array(context_ids, dtype=np.int64), 
+            np.array(heads, dtype=np.int64), 
+            np.array(relation_ids, dtype=np.int64))
+
+
+def _dependency_matrix(target_ids: np.ndarray, 
+                       context_ids: np.ndarray, 
+                       heads: np.ndarray, 
+                       relation_ids: np.ndarray, 
+                       n_targets: int, 
+                       n_contexts: int, 
+                       n_relations: int, 
+                       inverse: bool
+                       ) -> sp.sparse.csr_matrix:
+    """Counts typed dependency co-occurrences of a batch of tokens (see "_intern_dependency_sentences").
+    
+    Columns are typed contexts: the column of context c through slot s is s * n_contexts + c, 
+    where the slot of relation r is r (head to dependent) or, with inverse, 2r and 2r+1 (dependent to head).
+
+    Args:
+        target_ids (np.ndarray): target id of each token (-1 if not a target)
+        context_ids (np.ndarray): context id of each token (-1 if not a context)
+        heads (np.ndarray): position of the head of each token (-1 for the root)
+        relation_ids (np.ndarray): id of the relation between each token and its head (-1 to ignore the arc)
+        n_targets (int): number of targets
+        n_contexts (int): number of contexts
+        n_relations (int): number of relations
+        inverse (bool): whether dependents also get their head as a context
+
+    Returns:
+        sp.sparse.csr_matrix: matrix of counts, of shape (n_targets, n_slots * n_contexts)
+    """
+    
+    n_slots = 2 if inverse else 1
+    shape = (n_targets, n_relations * n_slots * n_contexts)
+    
+    dependents = np.flatnonzero((heads >= 0) & (relation_ids >= 0))
+    governors = heads[dependents]
+    slots = relation_ids[dependents] * n_slots
+    
+    # head -> dependent, e.g. ("obj", *dependent) as context of the head
+    rows = [target_ids[governors]]
+    columns = [slots * n_contexts + context_ids[dependents]]
+    valid = [context_ids[dependents] >= 0]
+    
+    if inverse:
+        # dependent -> head, e.g. ("obj-1", *head) as context of the dependent
+        rows.append(target_ids[dependents])
+        columns.append((slots + 1) * n_contexts + context_ids[governors])
+        valid.append(context_ids[governors] >= 0)
+    
+    rows = np.concatenate(rows)
+    columns = np.concatenate(columns)
+    keep = (rows >= 0) & np.concatenate(valid)
+    
+    return _pairs_to_csr(rows[keep], columns[keep], shape)
+
+
+def _count_dependencies(sentences: Iterable[List[Tuple[str, ...]]], 
+                        targets_dict: Dict[Tuple[str, ...], int], 
+                        contexts_dict: Dict[Tuple[str, ...], int], 
+                        relations: List[str], 
+                        fixed_relations: bool, 
+                        inverse: bool, 
+                        batch_size: int
+                        ) -> Tuple[sp.sparse.csr_matrix, List[str]]:
+    """Counts typed dependency co-occurrences over sentences, in batches of about batch_size tokens.
+
+    Returns:
+        Tuple[sp.sparse.csr_matrix, List[str]]: matrix of counts (see "_dependency_matrix") and relations, in id order
+    """
+    
+    relations_dict = {relation: relation_id for relation_id, relation in enumerate(relations)}
+    n_slots = 2 if inverse else 1
+    
+    ret = sp.sparse.csr_matrix((len(targets_dict), len(relations_dict) * n_slots * len(contexts_dict)), dtype=np.int64)
+    
+    def count(batch):
+        arrays = _intern_dependency_sentences(batch, targets_dict, contexts_dict, relations_dict, fixed_relations)
+        counts = _dependency_matrix(*arrays, len(targets_dict), len(contexts_dict), len(relations_dict), inverse)
+        
+        # slots of new relations come after the existing ones, so existing columns keep their meaning
+        ret.resize(counts.shape)
+        return ret + counts
+    
+    batch = []
+    batch_tokens = 0
+    
+    for sentence in sentences:
+        batch.append(sentence)
+        batch_tokens += len(sentence)
+        
+        if batch_tokens >= batch_size:
+            ret = count(batch)
+            batch = []
+            batch_tokens = 0
+    
+    if batch:
+        ret = count(batch)
+    
+    return ret, list(relations_dict)
+
+
+def _count_dependencies_shard(task: Tuple[str, int, int, Tuple[str, ...], Dict, Dict, List[str], bool, bool, int]
+                              ) -> Tuple[sp.sparse.csr_matrix, List[str]]:
+    """Counts typed dependency co-occurrences in a shard of the corpus (worker for "extract_dependency_cooccurrences")
+
+    Args:
+        task (Tuple[str, int, int, Tuple[str, ...], Dict, Dict, List[str], bool, bool, int]): filename, start and end 
+            offsets of the shard, token_shape (with synhead and synrel), targets_dict, contexts_dict, relations, 
+            fixed_relations, inverse and batch_size
+
+    Returns:
+        Tuple[sp.sparse.csr_matrix, List[str]]: matrix of counts in the shard and its relations, in id order
+    """
+    
+    filename, start, end, token_shape, targets_dict, contexts_dict, relations, fixed_relations, inverse, batch_size = task
+    
+    return _count_dependencies(_read_sentences(filename, token_shape, start, end), 
+                               targets_dict, contexts_dict, relations, fixed_relations, inverse, batch_size)
+
+
+@profiled("extract_dependency_cooccurrences")
+def extract_dependency_cooccurrences(filepath: str, 
+                                     token_shape: Tuple[str, ...], 
+                                     targets: Union[Dict, Set, List], 
+                                     contexts: Union[Dict, Set, List], 
+                                     relations: Union[Set, List] = None, 
+                                     inverse: bool = True, 
+                                     batch_size: int = 1000000, 
+                                     workers: int = 1
+                                     ) -> Tuple[sp.sparse.csr_matrix, Dict[Tuple[str, ...], int], Dict[Tuple[str, ...], int]]:
+    """Extracts syntax-based co-occurrences, typed by dependency relation, directly into a sparse matrix.
+    
+    Contexts of a target are the tokens linked to it by a dependency arc (columns "synhead" and "synrel"),
+    prefixed by the relation: a head gets ("obj", *dependent) for each of its objects and, with inverse,
+    a dependent gets ("obj-1", *head) from its head. Only contexts found at least once become columns.
+    
+    Arcs are turned into ids once per batch and counted with NumPy, and, as in "extract_cooccurrences_sparse",
+    the file can be split into sentence-aligned shards processed in parallel.
+
+    Args:
+        filepath (str): path to file containing data (i.e., corpora), or to a corpus created by "compile_corpus"
+            with the synhead and synrel columns
+        token_shape (Tuple[str, ...]): tuple containing the info that we want to retain for each token.
+            Possible values for 'token_shape' are:
+            "s_id", "form", "lemma", "pos", "pos_fgrained",
+            "morph", "synhead", "synrel",
+            "_", "_", "mwe", "mwe2"
+        targets (Union[Dict, Set, List]): data structure containing list of lexemes to be considered as targets
+        contexts (Union[Dict, Set, List]): data structure containing list of lexemes that can appear in typed contexts
+        relations (Union[Set, List], optional): dependency relations to be considered (e.g. {"subj", "obj"}). 
+            Defaults to None (all relations).
+        inverse (bool, optional): whether dependents also get their head as a context. Defaults to True.
+        batch_size (int, optional): number of tokens processed at once, bounds memory usage. Defaults to 1000000.
+        workers (int, optional): number of processes. If greater than 1, the file is split into 
+            sentence-aligned shards whose matrices are summed. Not used for compiled corpora. Defaults to 1.
+
+    Returns:
+        Tuple[sp.sparse.csr_matrix, Dict[Tuple[str, ...], int], Dict[Tuple[str, ...], int]]: matrix of co-occurrence counts
+            in csr format, mapping from target to row id and mapping from typed context to column id
+    """
+    
+    targets_dict = _build_id_dict(targets)
+    contexts_dict = _build_id_dict(contexts)
+    
+    fixed_relations = relations is not None
+    relations = sorted(set(relations)) if fixed_relations else []
+    parse_shape = tuple(token_shape) + ("synhead", "synrel")
+    
+    if workers > 1 and not _is_compiled_corpus(filepath):
+        shard_counts = _run_sharded(_count_dependencies_shard, filepath, workers, parse_shape, 
+                                    targets_dict, contexts_dict, relations, fixed_relations, inverse, batch_size)
+    else:
+        shard_counts = [_count_dependencies(corpus_to_sentences(filepath, parse_shape), targets_dict, contexts_dict, 
+                                            relations, fixed_relations, inverse, batch_size)]
+    
+    # each shard numbers new relations in order of appearance: move its columns to the slots of the merged relations
+    relations = list(dict.fromkeys(relation for _, shard_relations in shard_counts for relation in shard_relations))
+    relation_ids = {relation: relation_id for relation_id, relation in enumerate(relations)}
+    n_slots = 2 if inverse else 1
+    slot_width = n_slots * len(contexts_dict)
+    
+    ret = sp.sparse.csr_matrix((len(targets_dict), len(relations) * slot_width), dtype=np.int64)
+    for counts, shard_relations in shard_counts:
+        global_ids = np.array([relation_ids[relation] for relation in shard_relations], dtype=np.int64)
+        indices = counts.indices.astype(np.int64)
+        if len(indices):
+            indices = global_ids[indices // slot_width] * slot_width + indices % slot_width
+        ret = ret + sp.sparse.csr_matrix((counts.data, indices, counts.indptr), shape=ret.shape)
+    
+    # keep only the typed contexts that were found
+    used_columns = np.unique(ret.indices)
+    ret = sp.sparse.csr_matrix((ret.data, np.searchsorted(used_columns, ret.indices), ret.indptr), 
+                               shape=(len(targets_dict), len(used_columns)))
+    ret.sort_indices()
+    
+    context_tokens = _id_to_token(contexts_dict)
+    typed_contexts_dict = {}
+    for column_id, column in enumerate(used_columns.tolist()):
+        slot, context_id = divmod(column, len(contexts_dict))
+        relation_id, is_inverse = divmod(slot, n_slots)
+        relation = relations[relation_id] + ("-1" if is_inverse else "")
+        typed_contexts_dict[(relation, ) + tuple(context_tokens[context_id])] = column_id
+    
+    return ret, targets_dict, typed_contexts_dict
+
+
+@profiled("apply_ppmi")
+def apply_ppmi(co_occurrences: Dict[Tuple[str, ...], Dict[Tuple[str, ...], int]], 
+               targets_frequencies_dict: Dict[Tuple[str, ...], int], 
+               contexts_frequencies_dict: Dict[Tuple[str, ...], int], 
+               corpus_size: int
+               ) -> Dict[Tuple[str, ...], Dict[Tuple[str, ...], float]]:
+    """Apply PPMI (Positive Pointwise Mutual Information) to a dictionary registering co-occurrences.
+
+    Args:
+        co_occurrences (Dict[Tuple[str, ...], Dict[Tuple[str, ...], int]]): Dictionary of co-occurrences
+        targets_frequencies_dict (Dict[Tuple[str, ...], int]): Dictionary of frequencies for target items
+        contexts_frequencies_dict (Dict[Tuple[str, ...], int]): Dictionary of frequencies for context items
+        corpus_size (int): Overall size of corpus.
+
+    Returns:
+        Dict[Tuple[str, ...], Dict[Tuple[str, ...], float]]: Weighted matrix.
+    """
+
+    weighted_coocc = collections.defaultdict(lambda: collections.defaultdict(int))
+
+    for target in targets_frequencies_dict:
+        target_frequency = targets_frequencies_dict[target]
+        p_target = target_frequency/corpus_size
+
+        for context in contexts_frequencies_dict:
+            context_frequency = contexts_frequencies_dict[context]
+            p_context = context_frequency/corpus_size
+
+            coocc_frequency = co_occurrences.get(target, {}).get(context, 0)
+            p_coocc = coocc_frequency/corpus_size
+
+            if p_coocc > 0:
+                pmi = math.log(p_coocc/(p_target*p_context), 2)
+                weighted_coocc[target][context] = max(0, pmi)
+        
+    return weighted_coocc
+
+
+def _marginals_from_frequencies(id_dict: Dict[Tuple[str, ...], int], 
+                                frequencies: Union[Dict[Tuple[str, ...], int], List[Tuple[Tuple[str,...], int]]]
+                                ) -> np.ndarray:
+    """Builds the array of frequencies of the tokens in id_dict, indexed by id.
+
+    Args:
+        id_dict (Dict[Tuple[str, ...], int]): mapping from token to id
+        frequencies (Union[Dict[Tuple[str, ...], int], List[Tuple[Tuple[str,...], int]]]): frequencies of tokens,
+            either as a dictionary, as the list returned by "compute_frequencies" or as a Vocabulary
+
+    Returns:
+        np.ndarray: frequency of each id, 0 for tokens without frequency
+    """
+    
+    if isinstance(frequencies, Vocabulary):
+        ids = frequencies.encode(_id_to_token(id_dict))
+        return np.where(ids >= 0, frequencies.frequencies[ids], 0).astype(np.float64)
+    
+    if not isinstance(frequencies, dict):
+        frequencies = dict(frequencies)
+    
+    ret = np.zeros(len(id_dict), dtype=np.float64)
+    for token, token_id in id_dict.items():
+        ret[token_id] = frequencies.get(token, 0)
+    
+    return ret
+
+
+@profiled("apply_ppmi_sparse")
+def apply_ppmi_sparse(matrix: sp.sparse.spmatrix, 
+                      targets_dict: Dict[Tuple[str, ...], int] = None, 
+                      contexts_dict: Dict[Tuple[str, ...], int] = None, 
+                      frequencies: Union[Dict[Tuple[str, ...], int], List[Tuple[Tuple[str,...], int]]] = None, 
+                      corpus_size: int = None, 
+                      shift: float = 1, 
+                      alpha: float = 1, 
+                      lmi: bool = False
+                      ) -> sp.sparse.csr_matrix:
+    """Apply PPMI (Positive Pointwise Mutual Information) to a sparse co-occurrence matrix.
+    
+    Only the stored (non-zero) cells are weighted, so cost is linear in the number of co-occurring pairs.
+    Variants:
+        - shifted PPMI: max(PMI - log2(shift), 0)
+        - context distribution smoothing: P(c) = f(c)^alpha / sum_c' f(c')^alpha (alpha=0.75 is the usual choice)
+        - LMI (Local Mutual Information): max(f(t,c) * PMI, 0)
+
+    Args:
+        matrix (sp.sparse.spmatrix): matrix of co-occurrence counts, targets on rows and contexts on columns
+        targets_dict (Dict[Tuple[str, ...], int], optional): mapping from target to row id. 
+            Only needed together with frequencies. Defaults to None.
+        contexts_dict (Dict[Tuple[str, ...], int], optional): mapping from context to column id.
+            Only needed together with frequencies. Defaults to None.
+        frequencies (Union[Dict[Tuple[str, ...], int], List[Tuple[Tuple[str,...], int]]], optional): corpus frequencies of tokens,
+            as returned by "compute_frequencies" (list or Vocabulary). If not given, marginals are computed from the matrix itself. 
+            Defaults to None.
+        corpus_size (int, optional): Overall size of corpus. Defaults to the sum of frequencies (or of the matrix).
+        shift (float, optional): number of negative samples k used to shift PMI by log2(k). Defaults to 1 (no shift).
+        alpha (float, optional): exponent used to smooth the context distribution. Defaults to 1 (no smoothing).
+        lmi (bool, optional): whether to return Local Mutual Information instead of PPMI. Defaults to False.
+
+    Returns:
+        sp.sparse.csr_matrix: weighted matrix, in float32
+    """
+    
+    matrix = sp.sparse.csr_matrix(matrix)
+    
+    if frequencies is None:
+        targets_frequencies = np.asarray(matrix.sum(axis=1), dtype=np.float64).ravel()
+        contexts_frequencies = np.asarray(matrix.sum(axis=0), dtype=np.float64).ravel()
+        if corpus_size is None:
+            corpus_size = float(matrix.data.sum())
+    else:
+        if isinstance(frequencies, Vocabulary):
+            total = int(frequencies.frequencies.sum())
+        else:
+            if not isinstance(frequencies, dict):
+                frequencies = dict(frequencies)
+            total = sum(frequencies.values())
+        targets_frequencies = _marginals_from_frequencies(targets_dict, frequencies)
+        contexts_frequencies = _marginals_from_frequencies(contexts_dict, frequencies)
+        if corpus_size is None:
+            corpus_size = total
+    
+    return _ppmi_from_marginals(matrix, targets_frequencies, contexts_frequencies, corpus_size, shift, alpha, lmi)
+
+
+def _ppmi_from_marginals(matrix: sp.sparse.csr_matrix, 
+                         targets_frequencies: np.ndarray, 
+                         contexts_frequencies: np.ndarray, 
+                         corpus_size: float, 
+                         shift: float = 1, 
+                         alpha: float = 1, 
+                         lmi: bool = False
+                         ) -> sp.sparse.csr_matrix:
+    """Weights the stored cells of a csr matrix of counts, given the frequencies of its rows and columns 
+    (see "apply_ppmi_sparse" for the variants).
+
+    Args:
+        matrix (sp.sparse.csr_matrix): matrix of co-occurrence counts, targets on rows and contexts on columns
+        targets_frequencies (np.ndarray): frequency of each row
+        contexts_frequencies (np.ndarray): frequency of each column
+        corpus_size (float): overall size of corpus
+        shift (float, optional): number of negative samples k used to shift PMI by log2(k). Defaults to 1 (no shift).
+        alpha (float, optional): exponent used to smooth the context distribution. Defaults to 1 (no smoothing).
+        lmi (bool, optional): whether to return Local Mutual Information instead of PPMI. Defaults to False.
+
+    Returns:
+        sp.sparse.csr_matrix: weighted matrix, in float32
+    """
+    
+    counts = matrix.data.astype(np.float64)
+    
+    if alpha != 1:
+        smoothed = contexts_frequencies ** alpha
+        p_contexts = smoothed / smoothed.sum()
+    else:
+        p_contexts = contexts_frequencies / corpus_size
+    p_targets = targets_frequencies / corpus_size
+
+    rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    columns = matrix.indices
+    
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pmi = np.log2((counts / corpus_size) / (p_targets[rows] * p_contexts[columns]))
+    pmi[~np.isfinite(pmi)] = 0
+    
+    if shift != 1:
+        pmi -= math.log(shift, 2)
+    
+    if lmi:
+        pmi *= counts
+    
+    ret = sp.sparse.csr_matrix((np.maximum(pmi, 0).astype(np.float32), columns.copy(), matrix.indptr.copy()), 
+                               shape=matrix.shape)
+    ret.eliminate_zeros()
+    
+    return ret
+
+
+def _chunked_dot(matrix: Union[np.ndarray, sp.sparse.spmatrix], 
+                 other: Union[np.ndarray, sp.sparse.spmatrix], 
+                 chunk_rows: int = None
+                 ) -> np.ndarray:
+    """Computes matrix @ other one block of rows of matrix at a time.
+
+    Args:
+        matrix (Union[np.ndarray, sp.sparse.spmatrix]): left operand, possibly memory-mapped
+        other (Union[np.ndarray, sp.sparse.spmatrix]): right operand
+        chunk_rows (int, optional): number of rows of matrix multiplied at once. Defaults to None (all at once).
+
+    Returns:
+        np.ndarray: dense product
+    """
+    
+    chunk_rows = chunk_rows or matrix.shape[0]
+    ret = np.empty((matrix.shape[0], other.shape[1]), dtype=np.result_type(matrix.dtype, other.dtype))
+    
+    for start in range(0, matrix.shape[0], chunk_rows):
+        block = matrix[start:start+chunk_rows] @ other
+        ret[start:start+chunk_rows] = block.toarray() if sp.sparse.issparse(block) else block
+        
+    return ret
+
+
+def _chunked_tdot(matrix: Union[np.ndarray, sp.sparse.spmatrix], 
+                  other: np.ndarray, 
+                  chunk_rows: int = None
+                  ) -> np.ndarray:
+    """Computes matrix.T @ other, accumulating over blocks of rows of matrix.
+
+    Args:
+        matrix (Union[np.ndarray, sp.sparse.spmatrix]): left operand (transposed), possibly memory-mapped
+        other (np.ndarray): right operand, with as many rows as matrix
+        chunk_rows (int, optional): number of rows of matrix multiplied at once. Defaults to None (all at once).
+
+    Returns:
+        np.ndarray: dense product
+    """
+    
+    chunk_rows = chunk_rows or matrix.shape[0]
+    ret = np.zeros((matrix.shape[1], other.shape[1]), dtype=np.result_type(matrix.dtype, other.dtype))
+    
+    for start in range(0, matrix.shape[0], chunk_rows):
+        ret += matrix[start:start+chunk_rows].T @ other[start:start+chunk_rows]
+        
+    return ret
+
+
+@profiled("reduce_svd")
+def reduce_svd(matrix: Union[np.ndarray, sp.sparse.spmatrix], 
+               n_components: int = 300, 
+               p: float = 1, 
+               n_oversamples: int = 10, 
+               n_iter: int = 4, 
+               seed: int = 0, 
+               chunk_rows: int = None
+               ) -> np.ndarray:
+    """Reduce the dimensionality of a (PPMI) matrix with randomized truncated SVD.
+    
+    Rows are represented as U * S^p, where p is the eigenvalue weighting exponent 
+    (p=1 is the standard SVD projection, p=0 only keeps U, p=0.5 is often better on similarity tasks).
+    The matrix is only accessed through products with thin dense matrices, computed in chunks of rows 
+    if chunk_rows is given, so that csr or memory-mapped matrices are never densified.
+
+    Args:
+        matrix (Union[np.ndarray, sp.sparse.spmatrix]): matrix of vectors, one per row
+        n_components (int, optional): number of dimensions. Defaults to 300.
+        p (float, optional): eigenvalue weighting exponent. Defaults to 1.
+        n_oversamples (int, optional): additional random directions used to improve accuracy. Defaults to 10.
+        n_iter (int, optional): number of power iterations. Defaults to 4.
+        seed (int, optional): seed of the random projection. Defaults to 0.
+        chunk_rows (int, optional): number of rows multiplied at once. Defaults to None (all at once).
+
+    Returns:
+        np.ndarray: dense float32 matrix, of shape (rows, n_components)
+    """
+    
+    if sp.sparse.issparse(matrix):
+        matrix = sp.sparse.csr_matrix(matrix)
+    
+    n_components = min(n_components, *matrix.shape)
+    n_random = min(n_components + n_oversamples, *matrix.shape)
+    
+    rng = np.random.default_rng(seed)
+    omega = rng.standard_normal((matrix.shape[1], n_random))
+    
+    # range finder with power iterations, orthonormalized at each step
+    q, _ = np.linalg.qr(_chunked_dot(matrix, omega, chunk_rows))
+    for _ in range(n_iter):
+        z, _ = np.linalg.qr(_chunked_tdot(matrix, q, chunk_rows))
+        q, _ = np.linalg.qr(_chunked_dot(matrix, z, chunk_rows))
+    
+    # B = Q^T A is small (n_random x columns)
+    b = _chunked_tdot(matrix, q, chunk_rows).T
+    u_b, s, _ = np.linalg.svd(b, full_matrices=False)
+    
+    u = q @ u_b[:, :n_components]
+    
+    return (u * s[:n_components] ** p).astype(np.float32)
+
+
+def reduce_random_projection(matrix: Union[np.ndarray, sp.sparse.spmatrix], 
+                             n_components: int = 1000, 
+                             density: float = None, 
+                             seed: int = 0, 
+                             chunk_rows: int = None
+                             ) -> np.ndarray:
+    """Reduce the dimensionality of a matrix with a very sparse random projection (random indexing).
+    
+    Each column of the original space gets a sparse random index vector of n_components dimensions,
+    whose non-zero entries (a fraction density of them) are +/- sqrt(1 / (density * n_components)).
+    Rows are then the sum of the index vectors of their contexts, weighted by the matrix values.
+
+    Args:
+        matrix (Union[np.ndarray, sp.sparse.spmatrix]): matrix of vectors, one per row
+        n_components (int, optional): number of dimensions. Defaults to 1000.
+        density (float, optional): fraction of non-zero entries in index vectors. 
+            Defaults to None (1 / sqrt(columns), as in Li et al. 2006).
+        seed (int, optional): seed of the random index vectors. Defaults to 0.
+        chunk_rows (int, optional): number of rows multiplied at once. Defaults to None (all at once).
+
+    Returns:
+        np.ndarray: dense float32 matrix, of shape (rows, n_components)
+    """
+    
+    if sp.sparse.issparse(matrix):
+        matrix = sp.sparse.csr_matrix(matrix)
+    
+    if density is None:
+        density = 1 / math.sqrt(matrix.shape[1])
+    
+    rng = np.random.default_rng(seed)
+    scale = math.sqrt(1 / (density * n_components))
+    index_vectors = sp.sparse.random(matrix.shape[1], n_components, density=density, format="csr", random_state=rng, 
+                                     data_rvs=lambda n: rng.choice([-scale, scale], size=n)).astype(np.float32)
+    
+    return _chunked_dot(matrix, index_vectors, chunk_rows).astype(np.float32)
+
+
+def _iter_text_vectors(filename: str, 
+                       chunk_rows: int = 10000, 
+                       dtype: Any = np.float64
+                       ) -> Generator[Tuple[List[Tuple[str, str]], np.ndarray], None, None]:
+    """Reads a text file of vectors (see "load_vectors") in chunks of rows.
+
+    Args:
+        filename (str): path to txt file containing vectors.
+        chunk_rows (int, optional): number of rows parsed at once. Defaults to 10000.
+        dtype (Any, optional): dtype of the parsed values. Defaults to np.float64.
+
+    Yields:
+        Generator[Tuple[List[Tuple[str, str]], np.ndarray], None, None]: lexemes and vectors of each chunk
+    """
+    
+    with open(filename, encoding="utf-8") as fin:
+        fin.readline()
+        
+        while True:
+            lines = list(itertools.islice(fin, chunk_rows))
+            if not lines:
+                break
+            
+            tokens = []
+            values = []
+            for line in lines:
+                key, vector = line.strip().split(maxsplit=1)
+                lemma, pos = key.split("_")
+                tokens.append((lemma, pos))
+                values.append(vector)
+            
+            yield tokens, np.loadtxt(values, dtype=dtype, ndmin=2)
+
+
+def _read_vectors_header(filename: str) -> Tuple[int, int]:
+    """Reads the number of rows and columns from the first line of a text file of vectors.
+    """
+    
+    with open(filename, encoding="utf-8") as fin:
+        nrows, ncols = fin.readline().split()
+    
+    return int(nrows), int(ncols)
+
+
+def load_vectors(filename: str, chunk_rows: int = 10000) -> Tuple[Dict[Tuple[str, str], int], np.ndarray]:
+    """Load vectors from file.
+    
+    The file is expected to be formatted with one vector per line (the first line contains the overall dimension of the matrix), as follows:
+        163473 300
+        say_VERB -0.008861 0.097097 0.100236 0.070044 -0.079279 0.000923 -0.012829 0.064301 ...
+        go_VERB 0.010490 0.094733 0.143699 0.040344 -0.103710 -0.000016 -0.014351 0.019653 ...
+        make_VERB -0.013029 0.038892 0.008581 0.056925 -0.100181 0.011566 -0.072478 0.156239 ...
+        
+    Rows are parsed in chunks straight into a matrix preallocated from the first line.
+    To avoid parsing the text file each time, see "convert_vectors" and "load_vectors_binary".
 
     Args:
-        filepath (str): path to file containing data (i.e., corpora)
-        token_shape (Tuple[str, ...]): tuple containing the info that we want to retain for each token.
-            Possible values for 'token_shape' are:
-            "s_id", "form", "lemma", "pos", "pos_fgrained",
-            "morph", "synhead", "synrel",
-            "_", "_", "mwe", "mwe2"
-        targets (Union[Dict, Set, List]): data structure containing list of lexemes to be considered as targets
-        contexts (Union[Dict, Set, List]): data structure containing list of lexemes to be considered as contexts
-        window_size (int, optional): size of context to be considered. 
-            Note, the window is considered both to the left and to the right of the target.
-            Defaults to 5.
+        filename (str): path to txt file containing vectors.
+        chunk_rows (int, optional): number of rows parsed at once. Defaults to 10000.
 
     Returns:
-        Dict[Tuple[str, ...], Dict[Tuple[str, ...], int]]: Dictionary of co-occurrences
+        Tuple[Dict[Tuple[str, str], int], np.ndarray]: Dictionary containing with lexemes as indexes and vectors as values.
     """
+    
+    nrows, ncols = _read_vectors_header(filename)
+    
+    matrix = np.empty((nrows, ncols))
+    target_to_id = {}
+    id_curr = 0
+    
+    for tokens, vectors in _iter_text_vectors(filename, chunk_rows):
+        if id_curr + len(tokens) > len(matrix):
+            matrix = np.concatenate((matrix, np.empty((id_curr + len(tokens) - len(matrix), ncols))))
+        
+        matrix[id_curr:id_curr+len(tokens)] = vectors
+        for token in tokens:
+            target_to_id[token] = id_curr
+            id_curr += 1
+    
+    return target_to_id, matrix[:id_curr]
 
-    co_occ = collections.defaultdict(lambda: collections.defaultdict(int))
+
+def _open_text(filepath: str, mode: str = "r") -> Any:
+    """Opens a text file, gzip-compressed if its name ends with .gz"""
     
-    for sentence in corpus_to_sentences(filepath, token_shape):
+    if filepath.endswith(".gz"):
+        return gzip.open(filepath, mode + "t", encoding="utf-8")
+    
+    return open(filepath, mode, encoding="utf-8")
 
-        for token_id, token in enumerate(sentence):
 
-            if token in targets:
+def _write_vocabulary(filepath: str, id_dict: Dict[Tuple[str, ...], int]) -> np.ndarray:
+    """Writes tokens to file, one per line in increasing id order, with fields separated by tabs.
+    
+    The file is gzip-compressed if its name ends with .gz
 
-                # build left and right window boundary
-                # _ _ _ [_ _ _ _ _ X _ _ _ _ _] _ _ _
-                left_boundary = max(0, token_id-window_size)
-                right_boundary = min(len(sentence)-1, token_id+window_size)
-                window = sentence[left_boundary:right_boundary+1]
+    Args:
+        filepath (str): path to location where file has to be created
+        id_dict (Dict[Tuple[str, ...], int]): mapping from token to id
 
-                target_pos = token_id - left_boundary
+    Returns:
+        np.ndarray: id of the token on each line, to be passed to "_read_vocabulary" when ids are not 0...len(id_dict)-1
+    """
+    
+    if isinstance(id_dict, Vocabulary):
+        tokens = _id_to_token(id_dict)
+        ids = np.arange(len(tokens), dtype=np.int64)
+    else:
+        items = sorted(id_dict.items(), key=lambda x: x[1])
+        tokens = [token for token, _ in items]
+        ids = np.array([token_id for _, token_id in items], dtype=np.int64)
+    
+    with _open_text(filepath, "w") as fout:
+        for token in tokens:
+            print("\t".join(token), file=fout)
+    
+    return ids
 
-                # check contexts in left window
-                for ctx in window[0:target_pos]:
-                    if ctx in contexts:
-                        co_occ[token][ctx]+=1
 
-                # check contexts in right window
-                for ctx in window[target_pos+1:]:
-                    if ctx in contexts:
-                        co_occ[token][ctx]+=1
-                
-    return co_occ
+def _read_vocabulary(filepath: str, ids: np.ndarray = None) -> Dict[Tuple[str, ...], int]:
+    """Reads tokens written by "_write_vocabulary".
+
+    Args:
+        filepath (str): path to vocabulary file
+        ids (np.ndarray, optional): id of the token on each line. Defaults to None (line numbers).
 
+    Returns:
+        Dict[Tuple[str, ...], int]: mapping from token to id
+    """
+    
+    with _open_text(filepath) as fin:
+        tokens = [tuple(line.rstrip("\n").split("\t")) for line in fin]
+    
+    if ids is None:
+        return {token: token_id for token_id, token in enumerate(tokens)}
+    
+    return dict(zip(tokens, np.asarray(ids).tolist()))
 
-def apply_ppmi(co_occurrences: Dict[Tuple[str, ...], Dict[Tuple[str, ...], int]], 
-               targets_frequencies_dict: Dict[Tuple[str, ...], int], 
-               contexts_frequencies_dict: Dict[Tuple[str, ...], int], 
-               corpus_size: int
-               ) -> Dict[Tuple[str, ...], Dict[Tuple[str, ...], float]]:
-    """Apply PPMI (Positive Pointwise Mutual Information) to a dictionary registering co-occurrences.
+
+def save_vectors(filepath: str, 
+                 target_to_id: Dict[Tuple[str, ...], int], 
+                 matrix: np.ndarray, 
+                 dtype: Any = np.float32
+                 ) -> None:
+    """Save vectors in binary format.
+    
+    Two files are created: [filepath].npy, containing the matrix in NumPy format, 
+    and [filepath].vocab, containing one lexeme per line (fields separated by tabs), in row order.
 
     Args:
-        co_occurrences (Dict[Tuple[str, ...], Dict[Tuple[str, ...], int]]): Dictionary of co-occurrences
-        targets_frequencies_dict (Dict[Tuple[str, ...], int]): Dictionary of frequencies for target items
-        contexts_frequencies_dict (Dict[Tuple[str, ...], int]): Dictionary of frequencies for context items
-        corpus_size (int): Overall size of corpus.
+        filepath (str): path to location where files have to be created, without extension
+        target_to_id (Dict[Tuple[str, ...], int]): mapping from lexeme to row id
+        matrix (np.ndarray): matrix of vectors
+        dtype (Any, optional): dtype used to store vectors (e.g., np.float32 or np.float16). Defaults to np.float32.
+    """
+    
+    np.save(f"{filepath}.npy", np.asarray(matrix, dtype=dtype))
+    _write_vocabulary(f"{filepath}.vocab", target_to_id)
+
+
+def convert_vectors(filename: str, 
+                    filepath: str, 
+                    dtype: Any = np.float32, 
+                    chunk_rows: int = 10000
+                    ) -> None:
+    """Convert a text file of vectors (see "load_vectors") to the binary format of "save_vectors".
+    
+    Rows are streamed in chunks to a memory-mapped output, so the whole matrix is never held in memory.
+
+    Args:
+        filename (str): path to txt file containing vectors.
+        filepath (str): path to location where files have to be created, without extension
+        dtype (Any, optional): dtype used to store vectors (e.g., np.float32 or np.float16). Defaults to np.float32.
+        chunk_rows (int, optional): number of rows parsed at once. Defaults to 10000.
+    """
+    
+    nrows, ncols = _read_vectors_header(filename)
+    
+    matrix = np.lib.format.open_memmap(f"{filepath}.npy", mode="w+", dtype=dtype, shape=(nrows, ncols))
+    
+    with open(f"{filepath}.vocab", "w", encoding="utf-8") as fout:
+        id_curr = 0
+        for tokens, vectors in _iter_text_vectors(filename, chunk_rows, dtype):
+            matrix[id_curr:id_curr+len(tokens)] = vectors
+            id_curr += len(tokens)
+            for token in tokens:
+                print("\t".join(token), file=fout)
+    
+    matrix.flush()
+    
+    if id_curr != nrows:
+        raise ValueError(f"{filename} declares {nrows} vectors but contains {id_curr}")
+
+
+def load_vectors_binary(filepath: str, mmap: bool = True) -> Tuple[Dict[Tuple[str, ...], int], np.ndarray]:
+    """Load vectors saved by "save_vectors" or "convert_vectors".
+    
+    With mmap, the matrix is memory-mapped: loading is immediate and rows are only read from disk when accessed.
+
+    Args:
+        filepath (str): path to files, without extension
+        mmap (bool, optional): whether to memory-map the matrix (read-only) instead of reading it. Defaults to True.
 
     Returns:
-        Dict[Tuple[str, ...], Dict[Tuple[str, ...], float]]: Weighted matrix.
+        Tuple[Dict[Tuple[str, ...], int], np.ndarray]: Dictionary containing with lexemes as indexes and vectors as values.
     """
+    
+    matrix = np.load(f"{filepath}.npy", mmap_mode="r" if mmap else None)
+    target_to_id = _read_vocabulary(f"{filepath}.vocab")
+    
+    return target_to_id, matrix
 
-    weighted_coocc = collections.defaultdict(lambda: collections.defaultdict(int))
 
-    for target in targets_frequencies_dict:
-        target_frequency = targets_frequencies_dict[target]
-        p_target = target_frequency/corpus_size
 
-        for context in contexts_frequencies_dict:
-            context_frequency = contexts_frequencies_dict[context]
-            p_context = context_frequency/corpus_size
+class FrequencyCounter:
+    """
+    Pipeline consumer counting token frequencies, same output as "compute_frequencies"
+    """
+    
+    def __init__(self):
+        self.counts = collections.Counter()
+        
+    def consume(self, sentence: List[Tuple[str, ...]]) -> None:
+        self.counts.update(sentence)
+        
+    def finalize(self) -> None:
+        pass
+    
+    def frequencies(self) -> List[Tuple[Tuple[str,...], int]]:
+        """
+        Returns:
+            List[Tuple[Tuple[str,...], int]]: List of frequencies, sorted in decreasing order
+        """
+        return sorted(self.counts.items(), key= lambda x: (-x[1], x[0]))
+    
 
-            coocc_frequency = co_occurrences[target][context]
-            p_coocc = coocc_frequency/corpus_size
+class CorpusSizeCounter:
+    """
+    Pipeline consumer counting tokens and sentences
+    """
+    
+    def __init__(self):
+        self.n_tokens = 0
+        self.n_sentences = 0
+        
+    def consume(self, sentence: List[Tuple[str, ...]]) -> None:
+        self.n_tokens += len(sentence)
+        self.n_sentences += 1
+        
+    def finalize(self) -> None:
+        pass
 
-            if p_coocc > 0:
-                pmi = math.log(p_coocc/(p_target*p_context), 2)
-                weighted_coocc[target][context] = max(0, pmi)
+
+class CooccurrenceCounter:
+    """
+    Pipeline consumer counting windowed co-occurrences, with the same window semantics as "extract_cooccurrences".
+    
+    Targets and contexts are either given up front (exact counts, as "extract_cooccurrences_sparse"),
+    or admitted as candidates while reading, through target_filter and context_filter 
+    (e.g. a check on Part of Speech), when frequency thresholds are only known at the end of the scan.
+    In the latter case "select" restricts the candidate store to the final vocabularies.
+    
+    If max_nnz is given, the candidate store is kept bounded: whenever it grows beyond max_nnz cells,
+    the least frequent cells are dropped until half of the budget is used. Counts of the surviving cells 
+    are then underestimated by at most max_error.
+    
+    Frequencies of targets and contexts, as marginals for "apply_ppmi_sparse", are kept in target_frequencies 
+    and context_frequencies (indexed by id), and the number of tokens read in n_tokens.
+
+    Args:
+        window_size (int, optional): size of context to be considered, both to the left and to the right of the target.
+            Defaults to 5.
+        targets (Union[Dict, Set, List], optional): fixed list of targets. Defaults to None.
+        contexts (Union[Dict, Set, List], optional): fixed list of contexts. Defaults to None.
+        target_filter (Callable[[Tuple[str, ...]], bool], optional): admission test for candidate targets,
+            used when targets is not given. Defaults to None (every token is a candidate).
+        context_filter (Callable[[Tuple[str, ...]], bool], optional): admission test for candidate contexts,
+            used when contexts is not given. Defaults to None (every token is a candidate).
+        max_nnz (int, optional): maximum number of cells in the candidate store, at least 2. Defaults to None (unbounded).
+        batch_size (int, optional): number of tokens processed at once. Defaults to 1000000.
+
+    Raises:
+        ValueError: if max_nnz is smaller than 2
+    """
+    
+    def __init__(self, 
+                 window_size: int = 5, 
+                 targets: Union[Dict, Set, List] = None, 
+                 contexts: Union[Dict, Set, List] = None, 
+                 target_filter: Callable[[Tuple[str, ...]], bool] = None, 
+                 context_filter: Callable[[Tuple[str, ...]], bool] = None, 
+                 max_nnz: int = None, 
+                 batch_size: int = 1000000):
         
-    return weighted_coocc
+        # pruning keeps max_nnz // 2 cells, which must not be zero
+        if max_nnz is not None and max_nnz < 2:
+            raise ValueError(f"max_nnz must be at least 2, got {max_nnz}")
+        
+        self.window_size = window_size
+        self.max_nnz = max_nnz
+        self.batch_size = batch_size
+        self.max_error = 0
+        
+        self._fixed_targets = targets is not None
+        self._fixed_contexts = contexts is not None
+        self._target_filter = target_filter
+        self._context_filter = context_filter
+        
+        # lookups also record rejected candidates (with id -1), so that filters run once per type
+        self._target_lookup = _build_id_dict(targets) if targets is not None else {}
+        self._context_lookup = _build_id_dict(contexts) if contexts is not None else {}
+        self.targets_dict = dict(self._target_lookup)
+        self.contexts_dict = dict(self._context_lookup)
+        
+        self.matrix = sp.sparse.csr_matrix((len(self.targets_dict), len(self.contexts_dict)), dtype=np.int64)
+        self.target_frequencies = np.zeros(len(self.targets_dict), dtype=np.int64)
+        self.context_frequencies = np.zeros(len(self.contexts_dict), dtype=np.int64)
+        self.n_tokens = 0
+        self._batch = []
+        self._batch_tokens = 0
+        
+    def _intern(self, 
+                token: Tuple[str, ...], 
+                lookup: Dict[Tuple[str, ...], int], 
+                id_dict: Dict[Tuple[str, ...], int], 
+                fixed: bool, 
+                admit: Callable[[Tuple[str, ...]], bool]
+                ) -> int:
+        
+        token_id = lookup.get(token)
+        
+        if token_id is None:
+            token_id = -1
+            if not fixed and (admit is None or admit(token)):
+                token_id = id_dict[token] = len(id_dict)
+            lookup[token] = token_id
+        
+        return token_id
 
+    def consume(self, sentence: List[Tuple[str, ...]]) -> None:
+        self._batch.append(sentence)
+        self._batch_tokens += len(sentence)
+        
+        if self._batch_tokens >= self.batch_size:
+            self._flush()
+        
+    def _flush(self) -> None:
+        target_ids = []
+        context_ids = []
+        lengths = []
+        
+        for sentence in self._batch:
+            for token in sentence:
+                target_ids.append(self._intern(token, self._target_lookup, self.targets_dict, 
+                                               self._fixed_targets, self._target_filter))
+                context_ids.append(self._intern(token, self._context_lookup, self.contexts_dict, 
+                                                self._fixed_contexts, self._context_filter))
+            lengths.append(len(sentence))
+        
+        self._batch = []
+        self._batch_tokens = 0
+        
+        target_ids = np.array(target_ids, dtype=np.int64)
+        context_ids = np.array(context_ids, dtype=np.int64)
+        sentence_ids = np.repeat(np.arange(len(lengths), dtype=np.int64), lengths)
+        
+        self._add_batch(target_ids, context_ids, sentence_ids)
+        
+    def _add_batch(self, 
+                   target_ids: np.ndarray, 
+                   context_ids: np.ndarray, 
+                   sentence_ids: np.ndarray
+                   ) -> sp.sparse.csr_matrix:
+        """
+        Adds the co-occurrences and frequencies of a batch of interned tokens to the store.
 
-def load_vectors(filename: str) -> Tuple[Dict[Tuple[str, str], int], np.ndarray]:
-    """Load vectors from file.
+        Returns:
+            sp.sparse.csr_matrix: co-occurrence counts of the batch
+        """
+        
+        shape = (len(self.targets_dict), len(self.contexts_dict))
+        self.matrix.resize(shape)
+        
+        self.target_frequencies = np.pad(self.target_frequencies, (0, shape[0] - len(self.target_frequencies)))
+        self.target_frequencies += np.bincount(target_ids[target_ids >= 0], minlength=shape[0])
+        self.context_frequencies = np.pad(self.context_frequencies, (0, shape[1] - len(self.context_frequencies)))
+        self.context_frequencies += np.bincount(context_ids[context_ids >= 0], minlength=shape[1])
+        self.n_tokens += len(target_ids)
+        
+        counts = _window_matrix(target_ids, context_ids, sentence_ids, self.window_size, shape)
+        self.matrix = self.matrix + counts
+            
+        if self.max_nnz is not None and self.matrix.nnz > self.max_nnz:
+            self._prune(self.max_nnz // 2)
+        
+        return counts
     
-    The file is expected to be formatted with one vector per line (the first line contains the overall dimension of the matrix), as follows:
-        163473 300
-        say_VERB -0.008861 0.097097 0.100236 0.070044 -0.079279 0.000923 -0.012829 0.064301 ...
-        go_VERB 0.010490 0.094733 0.143699 0.040344 -0.103710 -0.000016 -0.014351 0.019653 ...
-        make_VERB -0.013029 0.038892 0.008581 0.056925 -0.100181 0.011566 -0.072478 0.156239 ...
+    def _prune(self, nnz: int) -> None:
+        dropped = np.argpartition(self.matrix.data, -nnz)[:-nnz]
+        
+        self.max_error += int(self.matrix.data[dropped].max())
+        self.matrix.data[dropped] = 0
+        self.matrix.eliminate_zeros()
+    
+    def finalize(self) -> None:
+        self._flush()
+        
+    def select(self, 
+               targets: Union[Dict, Set, List], 
+               contexts: Union[Dict, Set, List]
+               ) -> Tuple[sp.sparse.csr_matrix, Dict[Tuple[str, ...], int], Dict[Tuple[str, ...], int]]:
+        """
+        Restricts the counts to the given targets and contexts, e.g. the output of "filter_by_threshold".
+
+        Args:
+            targets (Union[Dict, Set, List]): data structure containing list of lexemes to be considered as targets
+            contexts (Union[Dict, Set, List]): data structure containing list of lexemes to be considered as contexts
+
+        Returns:
+            Tuple[sp.sparse.csr_matrix, Dict[Tuple[str, ...], int], Dict[Tuple[str, ...], int]]: matrix of co-occurrence counts
+                in csr format, mapping from target to row id and mapping from context to column id
+        """
+        
+        targets_dict = _build_id_dict(targets)
+        contexts_dict = _build_id_dict(contexts)
+        
+        def selector(new_dict, old_dict):
+            pairs = [(new_id, old_dict[token]) for token, new_id in new_dict.items() if token in old_dict]
+            new_ids, old_ids = zip(*pairs) if pairs else ((), ())
+            return sp.sparse.csr_matrix((np.ones(len(pairs), dtype=np.int64), (new_ids, old_ids)), 
+                                        shape=(len(new_dict), len(old_dict)))
+        
+        rows_selector = selector(targets_dict, self.targets_dict)
+        columns_selector = selector(contexts_dict, self.contexts_dict)
+        
+        ret = (rows_selector @ self.matrix @ columns_selector.T).tocsr()
+        
+        return ret, targets_dict, contexts_dict
+
+
+class CorpusPipeline:
+    """
+    Feeds several consumers (e.g. FrequencyCounter, CorpusSizeCounter, CooccurrenceCounter) from a single scan of the corpus.
+    
+    A consumer is any object with a consume(sentence) and a finalize() method.
+    
+    Example:
+        pipeline = CorpusPipeline("data/wikiCoNLL_10000", ("lemma", "pos"))
+        freqs = pipeline.add_consumer(FrequencyCounter())
+        coocc = pipeline.add_consumer(CooccurrenceCounter(window_size=2, target_filter=lambda t: t[1] == "S"))
+        pipeline.run()
+        
+        targets = [t for t, _ in filter_by_threshold(filter_by_POS(freqs.frequencies(), {"S"}), 10)]
+        contexts = [t for t, _ in filter_by_threshold(freqs.frequencies(), 10)]
+        matrix, targets_dict, contexts_dict = coocc.select(targets, contexts)
 
     Args:
-        filename (str): path to txt file containing vectors.
+        filename (str): path to file containing parsed corpus in CoNLL format
+        token_shape (Tuple[str, ...], optional): tuple containing the info that we want to retain for each token.
+            Possible values for 'token_shape' are:
+            "s_id", "form", "lemma", "pos", "pos_fgrained",
+            "morph", "synhead", "synrel",
+            "_", "_", "mwe", "mwe2" 
+            Defaults to ("form", "lemma", "pos").
+    """
+    
+    def __init__(self, 
+                 filename: str, 
+                 token_shape: Tuple[str, ...] = ("form", "lemma", "pos")):
+        self.filename = filename
+        self.token_shape = token_shape
+        self.consumers = []
+        
+    def add_consumer(self, consumer: Any) -> Any:
+        """
+        Registers a consumer
 
-    Returns:
-        Tuple[Dict[Tuple[str, str], int], np.ndarray]: Dictionary containing with lexemes as indexes and vectors as values.
+        Args:
+            consumer (Any): object with consume(sentence) and finalize() methods
+
+        Returns:
+            Any: the consumer itself
+        """
+        self.consumers.append(consumer)
+        return consumer
+    
+    def run(self) -> None:
+        """
+        Scans the corpus once, feeding every sentence to all consumers
+        """
+        
+        for sentence in corpus_to_sentences(self.filename, self.token_shape):
+            for consumer in self.consumers:
+                consumer.consume(sentence)
+                
+        for consumer in self.consumers:
+            consumer.finalize()
+
+
+class IncrementalSpace(CooccurrenceCounter):
     """
+    Co-occurrence space that can be updated as the corpus grows, without reading the whole corpus again.
     
-    matrix = []
-    target_to_id = {}
-    id_curr = 0
+    The space keeps raw co-occurrence counts, the frequencies of targets and contexts and the corpus size,
+    and can be saved and loaded back between updates. New sentences are either given directly ("update") 
+    or read from the region of a file appended since the last update ("update_from_file"), whose byte offset is tracked.
+    New targets and contexts are admitted as in "CooccurrenceCounter", i.e. either from fixed lists
+    or through target_filter and context_filter, so that the vocabulary grows with the corpus.
     
-    with open(filename, encoding="utf-8") as fin:
-        fin.readline()
-        for line in fin:
-            line = line.strip().split()
-            lemma, pos = line[0].split("_")
-            target_to_id[(lemma, pos)] = id_curr
-            id_curr += 1
-            matrix.append([float(x) for x in line [1:]])
+    PPMI is recomputed lazily ("ppmi"): only the rows of targets seen since the last call are weighted again,
+    while the other rows keep the weights computed with the marginals of that time.
+    
+    Example:
+        space = IncrementalSpace(("lemma", "pos"), window_size=2, target_filter=lambda t: t[1] == "S")
+        space.update_from_file("data/corpus")
+        space.save("space")
+        
+        # the next day
+        space = IncrementalSpace.load("space", target_filter=lambda t: t[1] == "S")
+        space.update_from_file("data/corpus")
+        ppmi_matrix = space.ppmi()
+
+    Args:
+        token_shape (Tuple[str, ...], optional): tuple containing the info that we want to retain for each token.
+            Defaults to ("form", "lemma", "pos").
+        window_size (int, optional): size of context to be considered, both to the left and to the right of the target.
+            Defaults to 5.
+        targets (Union[Dict, Set, List], optional): fixed list of targets. Defaults to None.
+        contexts (Union[Dict, Set, List], optional): fixed list of contexts. Defaults to None.
+        target_filter (Callable[[Tuple[str, ...]], bool], optional): admission test for new targets,
+            used when targets is not given. Defaults to None (every token is a target).
+        context_filter (Callable[[Tuple[str, ...]], bool], optional): admission test for new contexts,
+            used when contexts is not given. Defaults to None (every token is a context).
+        batch_size (int, optional): number of tokens processed at once. Defaults to 1000000.
+    """
+    
+    def __init__(self, 
+                 token_shape: Tuple[str, ...] = ("form", "lemma", "pos"), 
+                 window_size: int = 5, 
+                 targets: Union[Dict, Set, List] = None, 
+                 contexts: Union[Dict, Set, List] = None, 
+                 target_filter: Callable[[Tuple[str, ...]], bool] = None, 
+                 context_filter: Callable[[Tuple[str, ...]], bool] = None, 
+                 batch_size: int = 1000000):
+        
+        super().__init__(window_size, targets, contexts, target_filter, context_filter, batch_size=batch_size)
+        
+        self.token_shape = tuple(token_shape)
+        self.offsets = {}
+        
+        self._dirty = np.ones(len(self.targets_dict), dtype=bool)
+        self._weighted = None
+        self._weighting = None
+    
+    def _add_batch(self, 
+                   target_ids: np.ndarray, 
+                   context_ids: np.ndarray, 
+                   sentence_ids: np.ndarray
+                   ) -> sp.sparse.csr_matrix:
+        
+        counts = super()._add_batch(target_ids, context_ids, sentence_ids)
+        
+        self._dirty = np.pad(self._dirty, (0, len(self.targets_dict) - len(self._dirty)))
+        self._dirty[target_ids[target_ids >= 0]] = True
+        
+        return counts
+    
+    def update(self, sentences: Iterable[List[Tuple[str, ...]]]) -> None:
+        """
+        Adds new sentences to the space.
+
+        Args:
+            sentences (Iterable[List[Tuple[str, ...]]]): sentences of tokens represented as token_shape, 
+                e.g. as returned by "corpus_to_sentences"
+        """
+        
+        for sentence in sentences:
+            self.consume(sentence)
+        self.finalize()
+    
+    def update_from_file(self, filename: str) -> int:
+        """
+        Adds to the space the sentences appended to a CoNLL file since its last update 
+        (the whole file, the first time it is seen).
+        
+        Only sentences followed by a blank line are read: a sentence still being written is read by the next update.
+
+        Args:
+            filename (str): path to file containing parsed corpus in CoNLL format
+
+        Returns:
+            int: number of bytes read
+        """
+        
+        key = os.path.abspath(filename)
+        start = self.offsets.get(key, 0)
+        
+        if os.path.getsize(filename) < start:
+            raise ValueError(f"{filename} is shorter than when it was last read, it cannot be updated incrementally")
+        
+        end = _last_sentence_boundary(filename, start)
+        if end > start:
+            self.update(_read_sentences(filename, self.token_shape, start, end))
+            self.offsets[key] = end
+        
+        return end - start
+    
+    def ppmi(self, 
+             shift: float = 1, 
+             alpha: float = 1, 
+             lmi: bool = False, 
+             refresh: bool = False
+             ) -> sp.sparse.csr_matrix:
+        """
+        PPMI weighted space (see "apply_ppmi_sparse" for the variants), computed from the corpus frequencies 
+        of targets and contexts.
+        
+        Only the rows of targets seen since the last call are weighted again, unless refresh is set 
+        or the weighting parameters change.
+
+        Args:
+            shift (float, optional): number of negative samples k used to shift PMI by log2(k). Defaults to 1 (no shift).
+            alpha (float, optional): exponent used to smooth the context distribution. Defaults to 1 (no smoothing).
+            lmi (bool, optional): whether to return Local Mutual Information instead of PPMI. Defaults to False.
+            refresh (bool, optional): whether to weight all rows with the current marginals. Defaults to False.
+
+        Returns:
+            sp.sparse.csr_matrix: weighted matrix, in float32
+        """
+        
+        weighting = (shift, alpha, lmi)
+        shape = self.matrix.shape
+        
+        full = refresh or self._weighted is None or weighting != self._weighting
+        rows = np.arange(shape[0]) if full else np.flatnonzero(self._dirty)
+        
+        if full or len(rows) or self._weighted.shape != shape:
+            weighted_rows = _ppmi_from_marginals(self.matrix[rows], self.target_frequencies[rows], 
+                                                 self.context_frequencies, self.n_tokens, shift, alpha, lmi)
+            
+            if len(rows) == shape[0]:
+                self._weighted = weighted_rows
+            else:
+                # clean rows of the previous weighting, plus the weighted dirty rows moved to their place
+                kept = np.ones(shape[0], dtype=np.float32)
+                kept[rows] = 0
+                previous = self._weighted.copy()
+                previous.resize(shape)
+                
+                scatter = sp.sparse.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, np.arange(len(rows)))), 
+                                               shape=(shape[0], len(rows)))
+                self._weighted = (sp.sparse.diags(kept) @ previous + scatter @ weighted_rows).tocsr()
+                self._weighted.eliminate_zeros()
+        
+        self._dirty[:] = False
+        self._weighting = weighting
+        
+        return self._weighted
     
-    matrix = np.array(matrix)
+    def save(self, dirpath: str) -> None:
+        """
+        Saves counts, marginals and state of the space to a directory.
+        
+        Counts are saved with "save_sparse_matrix", frequencies as target_frequencies.npy and context_frequencies.npy,
+        everything else (corpus size, token_shape, window size, offsets of files) in state.json.
+        The admission filters are not saved, and must be given again to "load".
+
+        Args:
+            dirpath (str): path to directory where files have to be created
+        """
+        
+        save_sparse_matrix(dirpath, self.matrix, self.targets_dict, self.contexts_dict)
+        np.save(os.path.join(dirpath, "target_frequencies.npy"), self.target_frequencies)
+        np.save(os.path.join(dirpath, "context_frequencies.npy"), self.context_frequencies)
+        
+        state = {"token_shape": self.token_shape, 
+                 "window_size": self.window_size, 
+                 "n_tokens": self.n_tokens, 
+                 "fixed_targets": self._fixed_targets, 
+                 "fixed_contexts": self._fixed_contexts, 
+                 "offsets": self.offsets}
+        
+        with open(os.path.join(dirpath, "state.json"), "w", encoding="utf-8") as fout:
+            json.dump(state, fout, indent=2)
     
-    return target_to_id, matrix
\ No newline at end of file
+    @classmethod
+    def load(cls, 
+             dirpath: str, 
+             target_filter: Callable[[Tuple[str, ...]], bool] = None, 
+             context_filter: Callable[[Tuple[str, ...]], bool] = None, 
+             batch_size: int = 1000000
+             ) -> "IncrementalSpace":
+        """
+        Loads a space saved by "save".
+
+        Args:
+            dirpath (str): path to directory containing the space
+            target_filter (Callable[[Tuple[str, ...]], bool], optional): admission test for new targets. Defaults to None.
+            context_filter (Callable[[Tuple[str, ...]], bool], optional): admission test for new contexts. Defaults to None.
+            batch_size (int, optional): number of tokens processed at once. Defaults to 1000000.
+
+        Returns:
+            IncrementalSpace: the space, ready to be updated
+        """
+        
+        with open(os.path.join(dirpath, "state.json"), encoding="utf-8") as fin:
+            state = json.load(fin)
+        
+        matrix, targets_dict, contexts_dict = load_sparse_matrix(dirpath, mmap=False)
+        
+        ret = cls(state["token_shape"], state["window_size"], 
+                  targets_dict if state["fixed_targets"] else None, 
+                  contexts_dict if state["fixed_contexts"] else None, 
+                  target_filter, context_filter, batch_size)
+        
+        ret.targets_dict = targets_dict
+        ret.contexts_dict = contexts_dict
+        ret._target_lookup = dict(targets_dict)
+        ret._context_lookup = dict(contexts_dict)
+        ret.matrix = matrix
+        ret.target_frequencies = np.load(os.path.join(dirpath, "target_frequencies.npy"))
+        ret.context_frequencies = np.load(os.path.join(dirpath, "context_frequencies.npy"))
+        ret.n_tokens = state["n_tokens"]
+        ret.offsets = state["offsets"]
+        ret._dirty = np.ones(len(targets_dict), dtype=bool)
+        
+        return ret
@@ -0,0 +1,341 @@
+"""
+Batch evaluation of vector spaces on the benchmarks loaded by dataset_utilities.
+"""
+
+import collections
+import os
+import numpy as np
+import scipy as sp
+import scipy.stats
+
+from typing import Callable, Tuple, Any, List, Dict, Union
+
+from . import dsmagic
+from . import dataset_utilities
+
+
+def make_item_mapper(id_dict: Dict[Tuple[str, ...], int],
+                     pos_map: Dict[str, str] = None,
+                     backoff_to_lemma: bool = True
+                     ) -> Callable[[Union[str, Tuple[str, ...]]], int]:
+    """
+    Builds a function mapping dataset items to row ids of a vector space.
+
+    Items are either lexemes (str) or (lexeme, PoS) tuples, as returned by the readers in dataset_utilities.
+    A tuple is looked up as is, then with its PoS translated through pos_map (e.g. {"n": "NOUN"}),
+    then, if backoff_to_lemma, as a bare lexeme. Bare lexemes are matched against the first field of tokens,
+    and map to the token with the lowest id (i.e., the most frequent one when ids follow frequency).
+
+    Args:
+        id_dict (Dict[Tuple[str, ...], int]): mapping from token to row id
+        pos_map (Dict[str, str], optional): translation from dataset PoS tags to space PoS tags. Defaults to None.
+        backoff_to_lemma (bool, optional): whether to ignore PoS when a tuple is not found. Defaults to True.
+
+    Returns:
+        Callable[[Union[str, Tuple[str, ...]]], int]: function from item to row id (-1 if the item is not in the space)
+    """
+
+    lemma_ids = {}
+    for token_id, token in enumerate(dsmagic._id_to_token(id_dict)):
+        lemma_ids.setdefault(token[0], token_id)
+
+    def item_to_id(item):
+        if isinstance(item, str):
+            return lemma_ids.get(item, -1)
+
+        if item in id_dict:
+            return id_dict[item]
+
+        if pos_map is not None and item[-1] in pos_map:
+            mapped = item[:-1] + (pos_map[item[-1]],)
+            if mapped in id_dict:
+                return id_dict[mapped]
+
+        if backoff_to_lemma:
+            return lemma_ids.get(item[0], -1)
+
+        return -1
+
+    return item_to_id
+
+
+def cosine_pairs(left: Union[np.ndarray, sp.sparse.spmatrix], right: Union[np.ndarray, sp.sparse.spmatrix]) -> np.ndarray:
+    """
+    Cosine similarity between each row of left and the corresponding row of right.
+
+    Args:
+        left (Union[np.ndarray, sp.sparse.spmatrix]): first vectors, one per row
+        right (Union[np.ndarray, sp.sparse.spmatrix]): second vectors, with the same shape as left
+
+    Returns:
+        np.ndarray: cosine similarity of each pair of rows
+    """
+
+    left = dsmagic.normalize_rows(left)
+    right = dsmagic.normalize_rows(right)
+
+    if sp.sparse.issparse(left):
+        return np.asarray(left.multiply(right).sum(axis=1)).ravel()
+
+    return np.einsum("ij,ij->i", left, right)
+
+
+def typicality_comparisons(triples: List[Tuple[Tuple[str, str], Tuple[str, str], Tuple[str, str]]],
+                           labels: np.ndarray) -> np.ndarray:
+    """
+    Pairs of (typical, atypical) DTFit triples sharing subject and verb, as compared in typicality evaluations.
+
+    Args:
+        triples (List[Tuple[Tuple[str, str], Tuple[str, str], Tuple[str, str]]]): (subject, verb, object) triples,
+            as the keys of the output of "read_DTFit"
+        labels (np.ndarray): label of each triple, 1 for typical and 0 for atypical
+
+    Returns:
+        np.ndarray: indices of the typical and of the atypical triple of each comparison, of shape (comparisons, 2)
+    """
+
+    groups = collections.defaultdict(lambda: ([], []))
+    for i, (subj, verb, _) in enumerate(triples):
+        groups[(subj, verb)][labels[i]].append(i)
+
+    return np.array([(typical, atypical) for atypical_ids, typical_ids in groups.values()
+                     for typical in typical_ids for atypical in atypical_ids], dtype=np.int64).reshape(-1, 2)
+
+
+def load_benchmarks(datasets_dir: str = "datasets") -> Dict[str, Tuple[str, Dict[Any, Any]]]:
+    """
+    Loads the word-level benchmarks distributed with the tutorial.
+
+    Args:
+        datasets_dir (str, optional): path to the datasets folder. Defaults to "datasets".
+
+    Returns:
+        Dict[str, Tuple[str, Dict[Any, Any]]]: for each benchmark, its kind ("similarity", "toefl" or "bless")
+            and its dataset dictionary
+    """
+
+    def path(*parts):
+        return os.path.join(datasets_dir, *parts)
+
+    return {
+        "WS353-sim": ("similarity", dataset_utilities.read_WS353(path("wordsim353_sim_rel", "wordsim_similarity_goldstandard.txt"))),
+        "WS353-rel": ("similarity", dataset_utilities.read_WS353(path("wordsim353_sim_rel", "wordsim_relatedness_goldstandard.txt"))),
+        "SimLex-999": ("similarity", dataset_utilities.read_SimLex999(path("SimLex-999", "SimLex-999.txt"))),
+        "MEN": ("similarity", dataset_utilities.read_MEN(path("MEN", "MEN_dataset_lemma_form_full"))),
+        "TOEFL": ("toefl", dataset_utilities.read_TOEFL(path("toefl-test-set.txt"))),
+        "BLESS": ("bless", dataset_utilities.read_BLESS(path("bless.csv"))),
+    }
+
+
+class EvaluationSuite:
+    """
+    Evaluates vector spaces sharing the same id map on several benchmarks at once.
+
+    Dataset items are mapped to row ids once, when the suite is built. Evaluating a matrix then takes a single
+    batched cosine computation over all the pairs of all benchmarks, which makes it cheap enough
+    to run inside hyperparameter sweeps.
+
+    Supported kinds of benchmark:
+        - "similarity": pairs with a gold score (WS353, SimLex-999, MEN), evaluated with Spearman correlation
+        - "toefl": pairs marked as correct (1) or not (0), grouped by their first item, evaluated with accuracy
+        - "bless": pairs labelled with a relation, evaluated with the mean similarity of each relation
+
+    Args:
+        benchmarks (Dict[str, Tuple[str, Dict[Any, Any]]]): for each benchmark, its kind and its dataset dictionary
+            (see "load_benchmarks")
+        id_dict (Dict[Tuple[str, ...], int]): mapping from token to row id
+        item_to_id (Callable[[Union[str, Tuple[str, ...]]], int], optional): function from item to row id.
+            Defaults to None ("make_item_mapper" with default arguments).
+    """
+
+    def __init__(self,
+                 benchmarks: Dict[str, Tuple[str, Dict[Any, Any]]],
+                 id_dict: Dict[Tuple[str, ...], int],
+                 item_to_id: Callable[[Union[str, Tuple[str, ...]]], int] = None):
+
+        if item_to_id is None:
+            item_to_id = make_item_mapper(id_dict)
+
+        self.tasks = {}
+        left = []
+        right = []
+
+        for name, (kind, dataset) in benchmarks.items():
+            pairs = list(dataset.items())
+
+            if kind == "toefl":
+                # keep the candidates of each question next to each other
+                pairs.sort(key=lambda x: x[0][0])
+
+            start = len(left)
+            left.extend(item_to_id(pair[0]) for pair, _ in pairs)
+            right.extend(item_to_id(pair[1]) for pair, _ in pairs)
+            gold = [value for _, value in pairs]
+
+            task = {"kind": kind, "slice": slice(start, len(left)), "gold": gold}
+
+            if kind == "similarity":
+                task["gold"] = np.array(gold, dtype=np.float64)
+
+            elif kind == "toefl":
+                questions = [pair[0] for pair, _ in pairs]
+                starts = [i for i in range(len(questions)) if i == 0 or questions[i] != questions[i-1]]
+                task["gold"] = np.array(gold, dtype=np.int64)
+                task["starts"] = np.array(starts, dtype=np.int64)
+
+            elif kind == "bless":
+                task["gold"] = np.array(gold)
+                task["relations"] = sorted(set(gold))
+
+            else:
+                raise ValueError(f"Unknown kind of benchmark {kind} for {name}")
+
+            self.tasks[name] = task
+
+        self.left = np.array(left, dtype=np.int64)
+        self.right = np.array(right, dtype=np.int64)
+        self.covered = (self.left >= 0) & (self.right >= 0)
+
+        # only rows used by some pair are normalized
+        self.row_ids, positions = np.unique(np.concatenate((self.left[self.covered], self.right[self.covered])),
+                                            return_inverse=True)
+        n_covered = int(self.covered.sum())
+        self._left_positions = positions[:n_covered]
+        self._right_positions = positions[n_covered:]
+
+    def similarities(self, matrix: Union[np.ndarray, sp.sparse.spmatrix]) -> np.ndarray:
+        """
+        Cosine similarity of every pair of every benchmark.
+
+        Args:
+            matrix (Union[np.ndarray, sp.sparse.spmatrix]): dense or sparse matrix, whose rows follow id_dict
+
+        Returns:
+            np.ndarray: similarities, NaN for pairs with items missing from the space
+        """
+
+        ret = np.full(len(self.left), np.nan)
+
+        if not len(self.row_ids):
+            return ret
+
+        rows = dsmagic.normalize_rows(matrix[self.row_ids])
+        left = rows[self._left_positions]
+        right = rows[self._right_positions]
+
+        if sp.sparse.issparse(rows):
+            ret[self.covered] = np.asarray(left.multiply(right).sum(axis=1)).ravel()
+        else:
+            ret[self.covered] = np.einsum("ij,ij->i", left, right)
+
+        return ret
+
+    def evaluate(self, matrix: Union[np.ndarray, sp.sparse.spmatrix]) -> Dict[str, Dict[str, Any]]:
+        """
+        Evaluates a vector space on all benchmarks.
+
+        Args:
+            matrix (Union[np.ndarray, sp.sparse.spmatrix]): dense or sparse matrix, whose rows follow id_dict
+
+        Returns:
+            Dict[str, Dict[str, Any]]: for each benchmark, its scores and coverage statistics
+        """
+
+        similarities = self.similarities(matrix)
+        ret = {}
+
+        for name, task in self.tasks.items():
+            scores = similarities[task["slice"]]
+            covered = self.covered[task["slice"]]
+
+            if task["kind"] == "similarity":
+                result = _evaluate_similarity(scores, covered, task["gold"])
+            elif task["kind"] == "toefl":
+                result = _evaluate_toefl(scores, covered, task["gold"], task["starts"])
+            else:
+                result = _evaluate_bless(scores, covered, task["gold"], task["relations"])
+
+            result["pairs"] = len(covered)
+            result["covered_pairs"] = int(covered.sum())
+            result["oov_pairs"] = len(covered) - result["covered_pairs"]
+            result["coverage"] = result["covered_pairs"] / len(covered) if len(covered) else 0.
+
+            ret[name] = result
+
+        return ret
+
+
+def _evaluate_similarity(scores: np.ndarray, covered: np.ndarray, gold: np.ndarray) -> Dict[str, Any]:
+    """
+    Spearman correlation between similarities and gold scores, on covered pairs
+    """
+
+    if covered.sum() < 2:
+        return {"spearman": float("nan")}
+
+    return {"spearman": float(scipy.stats.spearmanr(scores[covered], gold[covered])[0])}
+
+
+def _evaluate_toefl(scores: np.ndarray, covered: np.ndarray, gold: np.ndarray, starts: np.ndarray) -> Dict[str, Any]:
+    """
+    Accuracy on questions whose items are all covered: a question is answered correctly
+    when the correct candidate is the most similar one
+    """
+
+    if not len(starts):
+        return {"accuracy": float("nan"), "questions": 0, "covered_questions": 0}
+
+    question_covered = np.logical_and.reduceat(covered, starts)
+    best = np.maximum.reduceat(np.where(covered, scores, -np.inf), starts)
+
+    question_ids = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, len(scores))))
+    correct = np.zeros(len(starts), dtype=bool)
+    is_best = gold.astype(bool) & (scores == best[question_ids])
+    correct[question_ids[is_best]] = True
+
+    n_covered = int(question_covered.sum())
+
+    return {"accuracy": float(correct[question_covered].mean()) if n_covered else float("nan"),
+            "questions": len(starts),
+            "covered_questions": n_covered}
+
+
+def _evaluate_bless(scores: np.ndarray, covered: np.ndarray, labels: np.ndarray, relations: List[str]) -> Dict[str, Any]:
+    """
+    Mean similarity of covered pairs, for each relation
+    """
+
+    ret = {}
+    for relation in relations:
+        mask = covered & (labels == relation)
+        ret[relation] = float(scores[mask].mean()) if mask.any() else float("nan")
+
+    return {"mean_similarity": ret}
+
+
+def evaluate_space(matrix: Union[np.ndarray, sp.sparse.spmatrix],
+                   id_dict: Dict[Tuple[str, ...], int],
+                   benchmarks: Dict[str, Tuple[str, Dict[Any, Any]]] = None,
+                   item_to_id: Callable[[Union[str, Tuple[str, ...]]], int] = None
+                   ) -> Dict[str, Dict[str, Any]]:
+    """
+    Evaluates a vector space on several benchmarks in one call.
+
+    When evaluating several spaces with the same id_dict, build an "EvaluationSuite" once instead.
+
+    Args:
+        matrix (Union[np.ndarray, sp.sparse.spmatrix]): dense or sparse matrix, whose rows follow id_dict
+        id_dict (Dict[Tuple[str, ...], int]): mapping from token to row id
+        benchmarks (Dict[str, Tuple[str, Dict[Any, Any]]], optional): for each benchmark, its kind and its dataset dictionary.
+            Defaults to None (all benchmarks returned by "load_benchmarks").
+        item_to_id (Callable[[Union[str, Tuple[str, ...]]], int], optional): function from item to row id.
+            Defaults to None ("make_item_mapper" with default arguments).
+
+    Returns:
+        Dict[str, Dict[str, Any]]: for each benchmark, its scores and coverage statistics
+    """
+
+    if benchmarks is None:
+        benchmarks = load_benchmarks()
+
+    return EvaluationSuite(benchmarks, id_dict, item_to_id).evaluate(matrix)
@@ -0,0 +1,438 @@
+"""
+Similarity and nearest neighbors queries over a vector space loaded once, with micro-batching and caching,
+usable in process ("QueryService") or through a loopback socket ("serve", "QueryClient").
+"""
+
+import asyncio
+import collections
+import json
+import time
+import numpy as np
+
+from typing import Dict, Tuple, Any, List, Hashable
+
+from . import dsmagic
+
+
+class QueryService:
+    """
+    Answers similarity and nearest neighbors queries over a VectorSpace.
+
+    Queries submitted concurrently (e.g. by the connections of "serve") are queued and answered together:
+    all neighbors queries waiting at the same time take a single matrix product, all similarity queries
+    a single row-wise product. Results are kept in a bounded LRU cache, and the latency of each query
+    (from submission to answer) is recorded for "stats".
+
+    Example:
+        async with QueryService(dsmagic.VectorSpace(id_dict, matrix)) as service:
+            neighbors = await service.most_similar(("cane", "S"), topk=5)
+
+    Args:
+        space (dsmagic.VectorSpace): vectors and their id map
+        cache_size (int, optional): number of results kept in cache. Defaults to 10000.
+        max_batch_size (int, optional): maximum number of queries answered together. Defaults to 256.
+        max_delay (float, optional): seconds a query waits for others to join its batch. Defaults to 0.001.
+        latency_window (int, optional): number of recent latencies used for percentiles. Defaults to 10000.
+    """
+
+    def __init__(self,
+                 space: dsmagic.VectorSpace,
+                 cache_size: int = 10000,
+                 max_batch_size: int = 256,
+                 max_delay: float = 0.001,
+                 latency_window: int = 10000):
+
+        self.space = space
+
+        self.cache_size = cache_size
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+
+        self._cache = collections.OrderedDict()
+        self._latencies = collections.deque(maxlen=latency_window)
+        self._queue = None
+        self._batcher = None
+
+        self.n_queries = 0
+        self.n_cache_hits = 0
+        self.n_batches = 0
+
+    async def start(self) -> None:
+        """
+        Starts answering queries (in the running event loop)
+        """
+
+        if self._batcher is None:
+            self._queue = asyncio.Queue()
+            self._batcher = asyncio.get_running_loop().create_task(self._run_batcher())
+
+    async def stop(self) -> None:
+        """
+        Stops answering queries, failing the ones still waiting
+        """
+
+        if self._batcher is None:
+            return
+
+        self._batcher.cancel()
+        try:
+            await self._batcher
+        except asyncio.CancelledError:
+            pass
+        self._batcher = None
+
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("QueryService stopped"))
+
+    async def __aenter__(self) -> "QueryService":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.stop()
+
+    async def most_similar(self, token: Tuple[str, ...], topk: int = 10) -> List[Tuple[float, Tuple[str, ...]]]:
+        """
+        Nearest neighbors of a token by cosine similarity (the token itself included, as in "get_nearest_neighbors")
+
+        Args:
+            token (Tuple[str, ...]): query token
+            topk (int, optional): Number of neighbors to return. Defaults to 10.
+
+        Raises:
+            ValueError: if topk is not a non-negative integer
+
+        Returns:
+            List[Tuple[float, Tuple[str, ...]]]: neighbors and their cosine similarity, by decreasing similarity
+        """
+
+        if isinstance(topk, bool) or not isinstance(topk, (int, np.integer)) or topk < 0:
+            raise ValueError(f"topk must be a non-negative integer, got {topk!r}")
+
+        return list(await self._submit(("most_similar", tuple(token), int(topk))))
+
+    async def similarity(self, token_a: Tuple[str, ...], token_b: Tuple[str, ...]) -> float:
+        """
+        Cosine similarity of two tokens
+
+        Args:
+            token_a (Tuple[str, ...]): first token
+            token_b (Tuple[str, ...]): second token
+
+        Returns:
+            float: cosine similarity
+        """
+
+        return await self._submit(("similarity",) + tuple(sorted((tuple(token_a), tuple(token_b)))))
+
+    async def _submit(self, key: Tuple[Hashable, ...]) -> Any:
+        start = time.perf_counter()
+        self.n_queries += 1
+
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self.n_cache_hits += 1
+            ret = self._cache[key]
+
+        else:
+            if self._batcher is None:
+                raise RuntimeError("QueryService is not running, call start() first")
+
+            future = asyncio.get_running_loop().create_future()
+            await self._queue.put((key, future))
+            ret = await future
+
+            self._cache[key] = ret
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        self._latencies.append(time.perf_counter() - start)
+
+        return ret
+
+    async def _run_batcher(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+
+            # let concurrent queries join the batch
+            try:
+                if self.max_delay:
+                    await asyncio.sleep(self.max_delay)
+            except asyncio.CancelledError:
+                # stopped while assembling: the batch is no longer in the queue, fail it here
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(RuntimeError("QueryService stopped"))
+                raise
+
+            while len(batch) < self.max_batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            self.n_batches += 1
+            try:
+                self._answer(batch)
+            except Exception as e:
+                # fail the queries of this batch only, and keep answering the next ones
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _answer(self, batch: List[Tuple[Tuple[Hashable, ...], asyncio.Future]]) -> None:
+        """
+        Answers a batch of queries with one product per kind of query, and resolves their futures
+        """
+
+        pending = {}
+        for key, future in batch:
+            if future.done():
+                continue
+            tokens = key[1:2] if key[0] == "most_similar" else key[1:3]
+            missing = [token for token in tokens if token not in self.space]
+            if missing:
+                future.set_exception(KeyError(missing[0]))
+                continue
+            pending.setdefault(key, []).append(future)
+
+        neighbors_keys = [key for key in pending if key[0] == "most_similar"]
+        similarity_keys = [key for key in pending if key[0] == "similarity"]
+        results = {}
+
+        if neighbors_keys:
+            topk = max(key[2] for key in neighbors_keys)
+            neighbors = self.space.most_similar_batch([key[1] for key in neighbors_keys], topk,
+                                                      block_size=len(neighbors_keys))
+            for key, token_neighbors in zip(neighbors_keys, neighbors):
+                results[key] = token_neighbors[:key[2]]
+
+        if similarity_keys:
+            similarities = self.space.similarity_batch([key[1:] for key in similarity_keys])
+            results.update(zip(similarity_keys, similarities.tolist()))
+
+        for key, futures in pending.items():
+            for future in futures:
+                future.set_result(results[key])
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Counters and latency percentiles (in milliseconds, over the most recent queries)
+
+        Returns:
+            Dict[str, Any]: number of queries, cache hits, batches, mean batch size and p50, p90, p99 latencies
+        """
+
+        ret = {"queries": self.n_queries,
+               "cache_hits": self.n_cache_hits,
+               "batches": self.n_batches,
+               "mean_batch_size": (self.n_queries - self.n_cache_hits) / self.n_batches if self.n_batches else 0.}
+
+        latencies = np.array(self._latencies) * 1000
+        for percentile in (50, 90, 99):
+            ret[f"p{percentile}_ms"] = float(np.percentile(latencies, percentile)) if len(latencies) else None
+
+        return ret
+
+
+async def _answer_request(service: QueryService, request: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Answers one request of the line protocol of "serve"
+    """
+
+    ret = {"id": request.get("id")}
+
+    try:
+        if request["op"] == "most_similar":
+            neighbors = await service.most_similar(tuple(request["token"]), request.get("topk", 10))
+            ret["result"] = [[score, list(token)] for score, token in neighbors]
+        elif request["op"] == "similarity":
+            ret["result"] = await service.similarity(tuple(request["a"]), tuple(request["b"]))
+        elif request["op"] == "stats":
+            ret["result"] = service.stats()
+        else:
+            raise ValueError(f"Unknown operation {request['op']}")
+
+    except Exception as e:
+        ret["error"] = f"{type(e).__name__}: {e}"
+
+    return ret
+
+
+async def serve(service: QueryService, host: str = "127.0.0.1", port: int = 0) -> asyncio.AbstractServer:
+    """
+    Serves a QueryService over TCP, with one JSON object per line in both directions.
+
+    Requests are {"id": ..., "op": "most_similar", "token": [...], "topk": 10},
+    {"id": ..., "op": "similarity", "a": [...], "b": [...]} or {"id": ..., "op": "stats"};
+    responses are {"id": ..., "result": ...} or {"id": ..., "error": "..."}.
+    Requests of a connection are answered concurrently (so that they can be batched together),
+    hence responses may come in a different order and carry the id of their request.
+
+    Args:
+        service (QueryService): the service, started on the same event loop
+        host (str, optional): address to listen on. Defaults to "127.0.0.1".
+        port (int, optional): port to listen on. Defaults to 0 (any free port, see server.sockets[0].getsockname()).
+
+    Returns:
+        asyncio.AbstractServer: the running server
+    """
+
+    async def handle(reader, writer):
+        lock = asyncio.Lock()
+        tasks = set()
+
+        async def respond(line):
+            try:
+                response = await _answer_request(service, json.loads(line))
+            except json.JSONDecodeError as e:
+                response = {"id": None, "error": f"{type(e).__name__}: {e}"}
+
+            async with lock:
+                writer.write((json.dumps(response) + "\n").encode("utf-8"))
+                await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                task = asyncio.get_running_loop().create_task(respond(line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            await asyncio.gather(*tasks)
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+def run_server(space: dsmagic.VectorSpace,
+               host: str = "127.0.0.1",
+               port: int = 8765,
+               **kwargs: Any) -> None:
+    """
+    Loads a space into a QueryService and serves it until interrupted (see "serve").
+
+    Example:
+        run_server(dsmagic.VectorSpace(*dsmagic.load_vectors_binary("vectors")), port=8765)
+
+    Args:
+        space (dsmagic.VectorSpace): vectors and their id map
+        host (str, optional): address to listen on. Defaults to "127.0.0.1".
+        port (int, optional): port to listen on. Defaults to 8765.
+        **kwargs (Any): arguments of QueryService (cache_size, max_batch_size, max_delay, latency_window)
+    """
+
+    async def main():
+        async with QueryService(space, **kwargs) as service:
+            server = await serve(service, host, port)
+            async with server:
+                await server.serve_forever()
+
+    asyncio.run(main())
+
+
+class QueryClient:
+    """
+    Client for "serve", sending queries concurrently over a single connection.
+
+    Example:
+        client = await QueryClient.connect("127.0.0.1", 8765)
+        neighbors, similarity = await asyncio.gather(client.most_similar(("cane", "S")),
+                                                     client.similarity(("cane", "S"), ("gatto", "S")))
+        await client.close()
+
+    Args:
+        reader (asyncio.StreamReader): stream of responses
+        writer (asyncio.StreamWriter): stream of requests
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self._next_id = 0
+        self._pending = {}
+        self._receiver = asyncio.get_running_loop().create_task(self._receive())
+
+    @classmethod
+    async def connect(cls, host: str = "127.0.0.1", port: int = 8765) -> "QueryClient":
+        """
+        Opens a connection to a server
+
+        Args:
+            host (str, optional): address of the server. Defaults to "127.0.0.1".
+            port (int, optional): port of the server. Defaults to 8765.
+
+        Returns:
+            QueryClient: the connected client
+        """
+
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def _receive(self) -> None:
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+
+                response = json.loads(line)
+                future = self._pending.pop(response["id"], None)
+                if future is None or future.done():
+                    continue
+
+                if "error" in response:
+                    future.set_exception(RuntimeError(response["error"]))
+                else:
+                    future.set_result(response["result"])
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Connection closed"))
+            self._pending.clear()
+
+    async def _request(self, request: Dict[str, Any]) -> Any:
+        request["id"] = self._next_id
+        self._next_id += 1
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request["id"]] = future
+
+        self.writer.write((json.dumps(request) + "\n").encode("utf-8"))
+        await self.writer.drain()
+
+        return await future
+
+    async def most_similar(self, token: Tuple[str, ...], topk: int = 10) -> List[Tuple[float, Tuple[str, ...]]]:
+        """
+        Nearest neighbors of a token (see "QueryService.most_similar")
+        """
+
+        result = await self._request({"op": "most_similar", "token": list(token), "topk": topk})
+        return [(score, tuple(neighbor)) for score, neighbor in result]
+
+    async def similarity(self, token_a: Tuple[str, ...], token_b: Tuple[str, ...]) -> float:
+        """
+        Cosine similarity of two tokens (see "QueryService.similarity")
+        """
+
+        return await self._request({"op": "similarity", "a": list(token_a), "b": list(token_b)})
+
+    async def stats(self) -> Dict[str, Any]:
+        """
+        Counters and latency percentiles of the server (see "QueryService.stats")
+        """
+
+        return await self._request({"op": "stats"})
+
+    async def close(self) -> None:
+        """
+        Closes the connection
+        """
+
+        self.writer.close()
+        await self.writer.wait_closed()
+        await self._receiver
@@ -0,0 +1,207 @@
+"""
+Hyperparameter sweeps over window size, weighting and dimensionality reduction.
+"""
+
+import csv
+import itertools
+import multiprocessing
+import multiprocessing.shared_memory
+import time
+import numpy as np
+import scipy as sp
+
+from typing import Tuple, Any, List, Dict
+
+from . import dsmagic
+from .evaluation import EvaluationSuite
+
+
+def _share_matrix(matrix: sp.sparse.csr_matrix
+                  ) -> Tuple[Dict[str, Any], List[multiprocessing.shared_memory.SharedMemory]]:
+    """
+    Copies the arrays of a csr matrix to shared memory blocks.
+
+    Args:
+        matrix (sp.sparse.csr_matrix): matrix to share
+
+    Returns:
+        Tuple[Dict[str, Any], List[multiprocessing.shared_memory.SharedMemory]]: description of the shared matrix
+            (to be passed to "_attach_matrix") and the shared memory blocks, to be released by the owner
+    """
+
+    description = {"shape": matrix.shape, "arrays": {}}
+    blocks = []
+
+    for name in ("data", "indices", "indptr"):
+        values = getattr(matrix, name)
+        block = multiprocessing.shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)[:] = values
+
+        description["arrays"][name] = (block.name, values.shape, values.dtype.str)
+        blocks.append(block)
+
+    return description, blocks
+
+
+def _attach_matrix(description: Dict[str, Any]
+                   ) -> Tuple[sp.sparse.csr_matrix, List[multiprocessing.shared_memory.SharedMemory]]:
+    """
+    Builds a csr matrix on top of shared memory blocks created by "_share_matrix", without copying.
+
+    Args:
+        description (Dict[str, Any]): description of the shared matrix
+
+    Returns:
+        Tuple[sp.sparse.csr_matrix, List[multiprocessing.shared_memory.SharedMemory]]: matrix and attached blocks
+    """
+
+    arrays = {}
+    blocks = []
+
+    for name, (block_name, shape, dtype) in description["arrays"].items():
+        block = multiprocessing.shared_memory.SharedMemory(name=block_name)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+        blocks.append(block)
+
+    ret = sp.sparse.csr_matrix((arrays["data"], arrays["indices"], arrays["indptr"]),
+                               shape=description["shape"], copy=False)
+
+    return ret, blocks
+
+
+# state of each worker process, set by "_init_worker"
+_WORKER_STATE = {}
+
+
+def _init_worker(descriptions: Dict[int, Dict[str, Any]], suite: EvaluationSuite) -> None:
+    _WORKER_STATE["matrices"] = {}
+    _WORKER_STATE["blocks"] = []
+    _WORKER_STATE["suite"] = suite
+
+    for window_size, description in descriptions.items():
+        matrix, blocks = _attach_matrix(description)
+        _WORKER_STATE["matrices"][window_size] = matrix
+        _WORKER_STATE["blocks"].extend(blocks)
+
+
+def _flatten(results: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    """
+    Flattens nested dictionaries of results into a single row, with keys joined by dots
+    """
+
+    ret = {}
+
+    for key, value in results.items():
+        if isinstance(value, dict):
+            ret.update(_flatten(value, f"{prefix}{key}."))
+        else:
+            ret[f"{prefix}{key}"] = value
+
+    return ret
+
+
+def _run_configuration(configuration: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Weights, reduces and evaluates the space of one configuration (worker for "run_sweep").
+
+    Args:
+        configuration (Dict[str, Any]): values of window_size, alpha, shift, lmi, n_components and p
+
+    Returns:
+        Dict[str, Any]: the configuration, followed by its flattened evaluation results and its running time
+    """
+
+    start = time.perf_counter()
+
+    matrix = _WORKER_STATE["matrices"][configuration["window_size"]]
+    space = dsmagic.apply_ppmi_sparse(matrix,
+                                      alpha=configuration["alpha"],
+                                      shift=configuration["shift"],
+                                      lmi=configuration["lmi"])
+
+    if configuration["n_components"]:
+        space = dsmagic.reduce_svd(space, configuration["n_components"], p=configuration["p"])
+
+    ret = dict(configuration)
+    ret.update(_flatten(_WORKER_STATE["suite"].evaluate(space)))
+    ret["seconds"] = time.perf_counter() - start
+
+    return ret
+
+
+DEFAULT_GRID = {"window_size": [2, 5, 10],
+                "alpha": [1, 0.75],
+                "shift": [1],
+                "lmi": [False],
+                "n_components": [None, 300],
+                "p": [1]}
+
+
+def run_sweep(buckets: List[sp.sparse.csr_matrix],
+              suite: EvaluationSuite,
+              grid: Dict[str, List[Any]] = None,
+              workers: int = 1,
+              output: str = None
+              ) -> List[Dict[str, Any]]:
+    """
+    Evaluates all combinations of window size, weighting and reduction parameters.
+
+    Co-occurrence counts for each window size are derived once from distance buckets
+    (see "extract_cooccurrences_by_distance"), placed in shared memory and shared by a pool of processes,
+    each of which weights (with "apply_ppmi_sparse"), optionally reduces (with "reduce_svd") and evaluates
+    one configuration at a time.
+
+    Example:
+        buckets, targets_dict, contexts_dict = dsmagic.extract_cooccurrences_by_distance(corpus, token_shape, targets, contexts, 10)
+        suite = EvaluationSuite(load_benchmarks(), targets_dict)
+        run_sweep(buckets, suite, {"window_size": [2, 5, 10], "alpha": [1, 0.75]}, workers=8, output="sweep.tsv")
+
+    Args:
+        buckets (List[sp.sparse.csr_matrix]): co-occurrence counts bucketed by distance
+        suite (EvaluationSuite): benchmarks, built on the targets_dict of the buckets
+        grid (Dict[str, List[Any]], optional): values to try for each parameter among
+            window_size, alpha, shift, lmi (see "apply_ppmi_sparse"), n_components (None for no reduction) and p
+            (see "reduce_svd"). Missing parameters take their value from DEFAULT_GRID. Defaults to None (DEFAULT_GRID).
+        workers (int, optional): number of processes. Defaults to 1.
+        output (str, optional): path to tab-separated file where the results table is written. Defaults to None.
+
+    Returns:
+        List[Dict[str, Any]]: one row per configuration, with parameters and flattened evaluation results
+    """
+
+    grid = dict(DEFAULT_GRID, **(grid or {}))
+    names = list(DEFAULT_GRID)
+    configurations = [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+    descriptions = {}
+    blocks = []
+
+    try:
+        for window_size in sorted(set(grid["window_size"])):
+            description, matrix_blocks = _share_matrix(dsmagic.window_from_buckets(buckets, window_size))
+            descriptions[window_size] = description
+            blocks.extend(matrix_blocks)
+
+        if workers > 1:
+            with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(descriptions, suite)) as pool:
+                results = pool.map(_run_configuration, configurations, chunksize=1)
+        else:
+            _init_worker(descriptions, suite)
+            results = [_run_configuration(configuration) for configuration in configurations]
+            for block in _WORKER_STATE.pop("blocks"):
+                block.close()
+            _WORKER_STATE.clear()
+
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    if output is not None:
+        fieldnames = list(dict.fromkeys(key for row in results for key in row))
+        with open(output, "w", encoding="utf-8", newline="") as fout:
+            writer = csv.DictWriter(fout, fieldnames=fieldnames, delimiter="\t")
+            writer.writeheader()
+            writer.writerows(results)
+
+    return results
@@ -0,0 +1,277 @@
+"""
+Prototype-based thematic fit: plausibility of a filler for a role of a verb, as its similarity to the centroid
+of the most typical fillers of that role, with evaluation on Pado and DTFit.
+"""
+
+import collections
+import numpy as np
+import scipy as sp
+import scipy.stats
+
+from typing import Callable, Tuple, Any, List, Dict, Union
+
+from . import dsmagic
+from .evaluation import make_item_mapper, cosine_pairs, typicality_comparisons
+
+
+class ThematicFitScorer:
+    """
+    Scores (verb, role, filler) items by the cosine similarity between the filler vector and the prototype
+    of the role of the verb, i.e. the centroid of the vectors of its n_fillers most typical fillers.
+
+    Typical fillers come from dependency-typed counts (see "extract_dependency_cooccurrences"), where the row
+    of a verb has a column (role, *filler) for each filler found in that role: they are the fillers with the
+    highest values in the row, so counts can be replaced by association scores (e.g. with "apply_ppmi_sparse")
+    to prefer distinctive fillers over frequent ones.
+
+    Prototypes are built in batch, with one sparse product for all the (verb, role) pairs missing from
+    a bounded LRU cache, so scoring a dataset builds each prototype once.
+
+    Example:
+        counts, verbs_dict, typed_contexts_dict = dsmagic.extract_dependency_cooccurrences(corpus, ("lemma", "pos"), verbs, nouns, {"subj", "obj"})
+        scorer = ThematicFitScorer(space, counts, verbs_dict, typed_contexts_dict)
+        scorer.score_batch([("mangiare", "obj", "mela"), ("mangiare", "obj", "sasso")])
+
+    Args:
+        space (dsmagic.VectorSpace): vectors of fillers
+        counts (sp.sparse.spmatrix): dependency-typed co-occurrences, one row per verb
+        targets_dict (Dict[Tuple[str, ...], int]): mapping from verb to row id of counts
+        contexts_dict (Dict[Tuple[str, ...], int]): mapping from typed context (role, *filler) to column id of counts
+        n_fillers (int, optional): number of typical fillers averaged in a prototype. Defaults to 20.
+        cache_size (int, optional): number of prototypes kept in cache. Defaults to 10000.
+        item_to_id (Callable[[Union[str, Tuple[str, ...]]], int], optional): function from filler to row id of space.
+            Defaults to None ("make_item_mapper" with default arguments).
+        verb_to_id (Callable[[Union[str, Tuple[str, ...]]], int], optional): function from verb to row id of counts.
+            Defaults to None ("make_item_mapper" on targets_dict).
+    """
+
+    def __init__(self,
+                 space: dsmagic.VectorSpace,
+                 counts: sp.sparse.spmatrix,
+                 targets_dict: Dict[Tuple[str, ...], int],
+                 contexts_dict: Dict[Tuple[str, ...], int],
+                 n_fillers: int = 20,
+                 cache_size: int = 10000,
+                 item_to_id: Callable[[Union[str, Tuple[str, ...]]], int] = None,
+                 verb_to_id: Callable[[Union[str, Tuple[str, ...]]], int] = None):
+
+        self.space = space
+        self.counts = sp.sparse.csr_matrix(counts)
+        self.n_fillers = n_fillers
+        self.cache_size = cache_size
+        self.item_to_id = item_to_id if item_to_id is not None else make_item_mapper(space.id_dict)
+        self.verb_to_id = verb_to_id if verb_to_id is not None else make_item_mapper(targets_dict)
+
+        # role and filler (as row of space) of each column
+        self.relations = {}
+        self.column_relations = np.full(self.counts.shape[1], -1, dtype=np.int64)
+        self.column_fillers = np.full(self.counts.shape[1], -1, dtype=np.int64)
+
+        for (relation, *filler), column in contexts_dict.items():
+            self.column_relations[column] = self.relations.setdefault(relation, len(self.relations))
+            self.column_fillers[column] = self.item_to_id(tuple(filler))
+
+        self._cache = collections.OrderedDict()
+        self.n_built = 0
+        self.n_cache_hits = 0
+
+    def _build_prototypes(self, verb_ids: np.ndarray, relation_ids: np.ndarray) -> Union[np.ndarray, sp.sparse.csr_matrix]:
+        """
+        Prototypes of a batch of (verb, role) pairs, with a single product between the matrix of filler weights
+        and the normalized space (zeros for pairs without fillers)
+
+        Args:
+            verb_ids (np.ndarray): row ids of verbs in counts
+            relation_ids (np.ndarray): ids of roles (see "relations")
+
+        Returns:
+            Union[np.ndarray, sp.sparse.csr_matrix]: one prototype per pair
+        """
+
+        rows = self.counts[verb_ids].tocoo()
+
+        # fillers of the requested role, with a vector
+        keep = (self.column_relations[rows.col] == relation_ids[rows.row]) & (self.column_fillers[rows.col] >= 0) & (rows.data > 0)
+        entry_rows = rows.row[keep]
+        entry_fillers = self.column_fillers[rows.col[keep]]
+        entry_values = rows.data[keep]
+
+        # top n_fillers entries of each pair: sort by pair, then by decreasing value, and keep the first ranks
+        order = np.lexsort((-entry_values, entry_rows))
+        entry_rows = entry_rows[order]
+        entry_fillers = entry_fillers[order]
+
+        starts = np.searchsorted(entry_rows, np.arange(len(verb_ids)))
+        ranks = np.arange(len(entry_rows)) - starts[entry_rows]
+        top = ranks < self.n_fillers
+        entry_rows = entry_rows[top]
+        entry_fillers = entry_fillers[top]
+
+        n_selected = np.bincount(entry_rows, minlength=len(verb_ids))
+        weights = 1 / n_selected[entry_rows]
+
+        selection = sp.sparse.csr_matrix((weights.astype(np.float32), (entry_rows, entry_fillers)),
+                                         shape=(len(verb_ids), len(self.space)))
+
+        ret = selection @ self.space.normalized
+        return ret.tocsr() if sp.sparse.issparse(ret) else np.asarray(ret)
+
+    def prototypes(self, keys: List[Tuple[int, str]]) -> Union[np.ndarray, sp.sparse.csr_matrix]:
+        """
+        Prototypes of (verb, role) pairs, from the cache or built in a single batch
+
+        Args:
+            keys (List[Tuple[int, str]]): pairs of verb row id (in counts) and role
+
+        Returns:
+            Union[np.ndarray, sp.sparse.csr_matrix]: one prototype per pair, in the order of keys
+        """
+
+        missing = list(dict.fromkeys(key for key in keys if key not in self._cache))
+        self.n_cache_hits += sum(key in self._cache for key in keys)
+
+        if missing:
+            verb_ids = np.array([verb_id for verb_id, _ in missing], dtype=np.int64)
+            relation_ids = np.array([self.relations.get(relation, -1) for _, relation in missing], dtype=np.int64)
+            built = self._build_prototypes(verb_ids, relation_ids)
+            self.n_built += len(missing)
+
+            for i, key in enumerate(missing):
+                self._cache[key] = built[i]
+
+        ret = []
+        for key in keys:
+            self._cache.move_to_end(key)
+            ret.append(self._cache[key])
+
+        # evict only once the whole batch is gathered
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+        if not ret:
+            return np.empty((0, self.space.matrix.shape[1]), dtype=np.float32)
+
+        if sp.sparse.issparse(ret[0]):
+            return sp.sparse.vstack(ret, format="csr")
+
+        return np.stack(ret)
+
+    def score_batch(self,
+                    items: List[Tuple[Union[str, Tuple[str, ...]], str, Union[str, Tuple[str, ...]]]]
+                    ) -> np.ndarray:
+        """
+        Thematic fit of a batch of items
+
+        Args:
+            items (List[Tuple[Union[str, Tuple[str, ...]], str, Union[str, Tuple[str, ...]]]]): (verb, role, filler) items,
+                with role as named in counts (e.g. "subj", "obj")
+
+        Returns:
+            np.ndarray: cosine similarity of each filler to the prototype of its role,
+                NaN when the verb or the filler are missing, or the role has no known filler
+        """
+
+        verb_ids = np.array([self.verb_to_id(verb) for verb, _, _ in items], dtype=np.int64)
+        filler_ids = np.array([self.item_to_id(filler) for _, _, filler in items], dtype=np.int64)
+
+        ret = np.full(len(items), np.nan)
+        covered = np.flatnonzero((verb_ids >= 0) & (filler_ids >= 0))
+        if not len(covered):
+            return ret
+
+        prototypes = self.prototypes([(int(verb_ids[i]), items[i][1]) for i in covered])
+        has_fillers = np.asarray(abs(prototypes).sum(axis=1)).ravel() > 0
+
+        scores = cosine_pairs(prototypes, self.space.normalized[filler_ids[covered]])
+        ret[covered[has_fillers]] = scores[has_fillers]
+
+        return ret
+
+    def score(self, verb: Union[str, Tuple[str, ...]], role: str, filler: Union[str, Tuple[str, ...]]) -> float:
+        """
+        Thematic fit of a filler for a role of a verb (see "score_batch")
+
+        Args:
+            verb (Union[str, Tuple[str, ...]]): verb
+            role (str): role, as named in counts
+            filler (Union[str, Tuple[str, ...]]): filler
+
+        Returns:
+            float: cosine similarity of the filler to the prototype of the role, NaN if not covered
+        """
+
+        return float(self.score_batch([(verb, role, filler)])[0])
+
+
+def evaluate_pado(scorer: ThematicFitScorer,
+                  dataset: Dict[Tuple[Tuple[str, str], Tuple[str, str]], float],
+                  role_map: Dict[str, str] = None
+                  ) -> Dict[str, Any]:
+    """
+    Spearman correlation between thematic fit and plausibility ratings on Pado
+
+    Args:
+        scorer (ThematicFitScorer): scorer
+        dataset (Dict[Tuple[Tuple[str, str], Tuple[str, str]], float]): output of "read_Pado"
+        role_map (Dict[str, str], optional): translation from dataset roles to roles of the counts.
+            Defaults to None ({"ARG0": "subj", "ARG1": "obj"}).
+
+    Returns:
+        Dict[str, Any]: Spearman correlation over covered items, the score of each item (NaN if not covered)
+            and coverage statistics
+    """
+
+    if role_map is None:
+        role_map = {"ARG0": "subj", "ARG1": "obj"}
+
+    items = list(dataset)
+    gold = np.array([dataset[item] for item in items], dtype=np.float64)
+    scores = scorer.score_batch([(verb, role_map.get(role, role), arg) for (verb, _), (arg, role) in items])
+
+    covered = ~np.isnan(scores)
+
+    return {"spearman": float(scipy.stats.spearmanr(scores[covered], gold[covered])[0]) if covered.sum() > 1 else float("nan"),
+            "scores": dict(zip(items, scores.tolist())),
+            "items": len(items),
+            "covered_items": int(covered.sum()),
+            "coverage": float(covered.mean()) if len(items) else 0.}
+
+
+def evaluate_dtfit(scorer: ThematicFitScorer,
+                   dataset: Dict[Tuple[Tuple[str, str], Tuple[str, str], Tuple[str, str]], int],
+                   role_map: Dict[str, str] = None
+                   ) -> Dict[str, Any]:
+    """
+    Typicality on DTFit with thematic fit: each object is scored against the object prototype of its verb,
+    and, as in "composition.evaluate_dtfit", a comparison between triples sharing subject and verb
+    is correct when the typical object scores higher than the atypical one.
+
+    Args:
+        scorer (ThematicFitScorer): scorer
+        dataset (Dict[Tuple[Tuple[str, str], Tuple[str, str], Tuple[str, str]], int]): output of "read_DTFit"
+        role_map (Dict[str, str], optional): translation from dataset roles to roles of the counts.
+            Defaults to None ({"obj": "obj"}).
+
+    Returns:
+        Dict[str, Any]: accuracy over covered comparisons, the score of each triple (NaN if not covered)
+            and coverage statistics
+    """
+
+    if role_map is None:
+        role_map = {"obj": "obj"}
+
+    triples = list(dataset)
+    labels = np.array([dataset[triple] for triple in triples], dtype=np.int64)
+    scores = scorer.score_batch([(verb, role_map.get(role, role), obj) for _, (verb, _), (obj, role) in triples])
+
+    covered = ~np.isnan(scores)
+    comparisons = typicality_comparisons(triples, labels)
+    covered_comparisons = covered[comparisons].all(axis=1)
+    correct = scores[comparisons[:, 0]] > scores[comparisons[:, 1]]
+
+    return {"accuracy": float(correct[covered_comparisons].mean()) if covered_comparisons.any() else float("nan"),
+            "scores": dict(zip(triples, scores.tolist())),
+            "triples": len(triples),
+            "covered_triples": int(covered.sum()),
+            "comparisons": len(comparisons),
+            "covered_comparisons": int(covered_comparisons.sum())}